@@ -1,24 +1,28 @@
 # 文件名: app/__init__.py
-import os
 import logging
 from flask import Flask
 from config import Config
+from app.utils import metrics
 
 # --- 日志配置 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_app(config_class=Config):
-    """应用工厂函数"""
+def create_app(config_class=Config, warm_up: bool = False):
+    """
+    应用工厂函数。
+    向量库连接与审查助手在首个请求时才创建；warm_up 为 True 时立即在后台线程中初始化
+    （gunicorn 部署在工作进程 fork 之后预热，见 gunicorn.conf.py）。
+    """
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    # 确保上传目录存在
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
     # 注册蓝图
-    from app.api.routes import api_bp
-    app.register_blueprint(api_bp, url_prefix='/') # 注册蓝图，并设置URL前缀
+    from app.api import routes
+    app.register_blueprint(routes.api_bp, url_prefix='/') # 注册蓝图，并设置URL前缀
+    if warm_up:
+        routes.start_warm_up()
+    metrics.start_flusher()
 
     logger.info("Flask 应用创建并配置完成。")
     
@@ -1,37 +1,212 @@
 # 文件名: app/api/routes.py
 import os
 import re
+import json
+import time
 import logging
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.utils import secure_filename
-from app.db.milvus_kb import MilvusKnowledgeBase
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, Response, stream_with_context, g, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.db.base import create_knowledge_base
 from app.core.assistant import ContractReviewAssistant
-from app.utils.helpers import allowed_file, extract_text_from_pdf
+from app.core.jobs import JobManager
+from app.core.documents import DocumentStore
+from app.core.batch import BatchReviewRunner, BatchOutputLocked, collect_contract_paths, output_in_use
+from app.db.index_config import choose_index_params
+from config import (
+    JOB_MAX_WORKERS, JOB_TTL_SECONDS, JOB_STATE_DIR, EMBEDDING_DIM, BULK_PARTY_MAX_FILES, BULK_PARTY_MAX_CONCURRENCY,
+    BATCH_INPUT_ROOT, BATCH_OUTPUT_DIR, DOCUMENT_STORE_MAX_ENTRIES, DOCUMENT_STORE_DIR,
+    DOCUMENT_STORE_MAX_DISK_MB, VECTOR_BACKEND, COMPONENT_INIT_RETRY_SECONDS, UPLOAD_SPOOL_MAX_BYTES
+)
+from app.services.llm_service import get_embedding_cache_stats, get_llm_cache_stats, get_llm_status, init_llm_client
+from app.services.qichahca_service import get_qichacha_stats
+from app.utils.helpers import allowed_file, extract_text_from_pdf, find_article_refs, parse_chinese_number, spool_upload
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
+_MAX_SOURCE_NAME_BYTES = 512  # 与 Milvus 集合 source 字段的长度上限一致
+
 # 创建蓝图
 api_bp = Blueprint('api', __name__)
 
-# --- 全局实例化核心组件 ---
-# 在应用启动时就初始化，避免每次请求都重新连接
-try:
-    kb = MilvusKnowledgeBase()
-    assistant = ContractReviewAssistant(kb)
-except Exception as e:
-    logger.error(f"启动时初始化核心组件失败: {e}", exc_info=True)
-    kb = None
-    assistant = None
+# --- 全局核心组件 ---
+# 已解析合同的缓存：同一合同再次分析时跳过文本提取与合同方提取
+document_store = DocumentStore(DOCUMENT_STORE_MAX_ENTRIES, DOCUMENT_STORE_DIR, DOCUMENT_STORE_MAX_DISK_MB)
+metrics.register_cache("document_store", document_store)
+
+# 向量库连接与审查助手由 init_components() 按需创建（首个请求或服务预热时），不在导入时连接；
+# 初始化失败后由之后的请求重试（间隔至少 COMPONENT_INIT_RETRY_SECONDS 秒），向量库短暂不可用不会使服务永久失效
+kb = None
+assistant = None
+_init_lock = threading.Lock()
+_init_state = {"attempts": 0, "last_attempt": None, "last_error": None, "init_seconds": None}
+_started_at = time.time()
+
+# 异步审查任务管理器：提交后立即返回任务ID，由工作线程执行审查流程
+job_manager = JobManager(max_workers=JOB_MAX_WORKERS, ttl_seconds=JOB_TTL_SECONDS, state_dir=JOB_STATE_DIR)
+
+def init_components(force: bool = False) -> bool:
+    """
+    创建向量库连接与审查助手，已初始化时直接返回。返回是否初始化成功。
+    距上次失败不足 COMPONENT_INIT_RETRY_SECONDS 秒时不重试（force 为 True 时除外）。
+    """
+    global kb, assistant
+    if assistant is not None:
+        return True
+    with _init_lock:
+        if assistant is not None:
+            return True
+        last_attempt = _init_state["last_attempt"]
+        if not force and last_attempt and time.time() - last_attempt < COMPONENT_INIT_RETRY_SECONDS:
+            return False
+        _init_state["attempts"] += 1
+        _init_state["last_attempt"] = time.time()
+        start = time.perf_counter()
+        try:
+            kb = create_knowledge_base()
+            assistant = ContractReviewAssistant(kb, document_store)
+        except Exception as e:
+            logger.error(f"初始化核心组件失败（第 {_init_state['attempts']} 次）: {e}", exc_info=True)
+            metrics.inc("errors_total", component="init")
+            kb = None
+            _init_state["last_error"] = str(e)
+            return False
+        _init_state["last_error"] = None
+        _init_state["init_seconds"] = round(time.perf_counter() - start, 3)
+        logger.info(f"核心组件初始化完成（进程 {os.getpid()}，耗时 {_init_state['init_seconds']} 秒）。")
+        return True
+
+def start_warm_up():
+    """在后台线程中初始化核心组件并加载模型客户端，不阻塞服务启动；期间 /readyz 返回未就绪"""
+    def warm_up():
+        init_components(force=True)
+        init_llm_client()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def shutdown_components():
+    """停止接收新的异步任务，并等待进行中的任务执行完毕"""
+    job_manager.shutdown(wait=True)
+    logger.info(f"核心组件已关闭（进程 {os.getpid()}）。")
+
+def _parse_upload(stream, filename: str):
+    """按内容哈希取得已解析的合同，首次上传时直接从内存缓冲提取文本；提取失败时返回 None。完成后关闭缓冲"""
+    try:
+        document, _ = document_store.get_or_create(stream, filename, extract_text_from_pdf)
+        return document
+    finally:
+        stream.close()
+
+def _contract_from_request():
+    """
+    从请求中取得待分析的合同：表单字段 document_id（引用已解析的合同）或上传的 contract_file。
+    返回 (合同, 上传内容, 错误响应)：提供有效 document_id 时返回已缓存的合同；
+    否则返回 (上传内容的缓冲, 文件名)，由调用方或异步任务通过 _parse_upload 解析并关闭；参数无效时返回 (响应, 状态码)。
+    """
+    document_id = request.form.get('document_id')
+    if document_id:
+        document = document_store.get(document_id)
+        if document is None:
+            return None, None, (jsonify({"status": "error", "message": f"文档 '{document_id}' 不存在或已过期，请重新上传合同文件。"}), 404)
+        return document, None, None
+
+    file = request.files.get('contract_file')
+    if not file or file.filename == '':
+        return None, None, (jsonify({"status": "error", "message": "请求中未找到合同文件 (contract_file) 或 document_id"}), 400)
+    if not allowed_file(file.filename):
+        return None, None, (jsonify({"status": "error", "message": "文件类型不允许，仅支持 PDF"}), 400)
+    return None, (spool_upload(file), file.filename), None
+
+def _source_name(file):
+    """
+    知识库来源名：优先使用表单字段 source，否则使用上传时的原始文件名（保留中文，只去掉客户端附带的路径）。
+    来源名只作为检索结果中的出处与 /remove_source 的删除依据，不用于磁盘路径。名称为空或过长时返回 None
+    """
+    name = (request.form.get('source') or file.filename or "").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    if not name or len(name.encode("utf-8")) > _MAX_SOURCE_NAME_BYTES:
+        return None
+    return name
+
+def _document_from_request():
+    """同步接口使用：返回 (合同, 错误响应)，上传的新合同在当前请求中完成解析"""
+    document, upload, error = _contract_from_request()
+    if error:
+        return None, error
+    if document is None:
+        document = _parse_upload(*upload)
+        if document is None:
+            return None, (jsonify({"status": "error", "message": "无法从PDF中提取文本内容"}), 500)
+    return document, None
 
 # --- Flask 路由定义 ---
 
+@api_bp.before_request
+def _start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.add_gauge("http_requests_in_flight", 1)
+
+@api_bp.after_request
+def _record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@api_bp.teardown_request
+def _finish_request_metrics(exc):
+    """请求结束（流式响应在全部输出之后）时记录耗时与状态码"""
+    if "request_start" not in g:
+        return
+    metrics.add_gauge("http_requests_in_flight", -1)
+    status = 500 if exc is not None else g.get("response_status", 500)
+    endpoint = request.endpoint or "unknown"
+    metrics.observe("http_request_seconds", time.perf_counter() - g.request_start, endpoint=endpoint)
+    metrics.inc("http_requests_total", endpoint=endpoint, method=request.method, status=status)
+    if status >= 500:
+        metrics.inc("errors_total", component="http")
+
+@api_bp.before_request
+def _ensure_components():
+    """核心组件尚未就绪时在请求中尝试初始化（健康检查与指标接口除外）"""
+    if request.endpoint not in ("api.healthz", "api.readyz", "api.metrics_endpoint"):
+        init_components()
+
+@api_bp.errorhandler(RequestEntityTooLarge)
+def _request_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH（见 config.Config）"""
+    limit_mb = current_app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    return jsonify({"status": "error", "message": f"请求体过大，上限为 {limit_mb:g} MB"}), 413
+
+@api_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """存活检查：进程能处理请求即返回 200，不检查外部依赖"""
+    return jsonify({"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - _started_at, 1)})
+
+@api_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 文本格式的指标，多进程部署时汇总所有工作进程"""
+    return Response(metrics.render_all(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@api_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    就绪检查：核心组件已初始化且已配置模型服务 API Key 时返回 200，否则返回 503 及各依赖状态。
+    只报告初始化状态，不访问向量库；尚未初始化时在后台发起一次初始化（遵守重试间隔），本请求不等待
+    """
+    initializing = _init_lock.locked()
+    if assistant is None and not initializing:
+        threading.Thread(target=init_components, name="init-components", daemon=True).start()
+    knowledge_base = {"backend": VECTOR_BACKEND, "initialized": assistant is not None, "initializing": initializing,
+                      "init_attempts": _init_state["attempts"], "init_seconds": _init_state["init_seconds"],
+                      "last_error": _init_state["last_error"]}
+    llm = get_llm_status()
+    ready = knowledge_base["initialized"] and llm["api_key_configured"]
+    return jsonify({"status": "ready" if ready else "not_ready",
+                    "dependencies": {"knowledge_base": knowledge_base, "llm": llm}}), 200 if ready else 503
+
 @api_bp.route('/build_kb', methods=['POST'])
 def build_kb_endpoint():
-    # ... (此处代码与原文件中的 build_kb_endpoint 函数完全相同) ...
-    # 注意：将 `@app.route` 改为 `@api_bp.route`
-    # 并将 `app.config['UPLOAD_FOLDER']` 改为 `current_app.config['UPLOAD_FOLDER']`
     if not kb:
-        return jsonify({"status": "error", "message": "服务初始化失败，请检查 Milvus 连接。"}), 500
+        return jsonify({"status": "error", "message": "服务初始化失败，请检查向量存储后端连接。"}), 500
         
     if 'file' not in request.files:
         return jsonify({"status": "error", "message": "请求中未找到文件部分"}), 400
@@ -40,28 +215,46 @@ def build_kb_endpoint():
     if not collection_name or not re.match(r"^[a-zA-Z_][a-zA-Z0-9_]{0,254}$", collection_name):
         return jsonify({"status": "error", "message": "必须提供有效的知识库名称 (collection_name)，只能包含字母、数字和下划线，且不能以数字开头。"}), 400
     
+    mode = request.form.get('mode', 'rebuild')
+    if mode not in ['rebuild', 'append']:
+        return jsonify({"status": "error", "message": "构建模式 (mode) 必须是 'rebuild' 或 'append'"}), 400
+
+    # 可选的索引配置，未提供时按文本块数量自动选择
+    index_type = request.form.get('index_type') or None
+    metric_type = request.form.get('metric_type') or None
+    try:
+        index_params = json.loads(request.form['index_params']) if request.form.get('index_params') else None
+        choose_index_params(0, EMBEDDING_DIM, index_type, metric_type, index_params)
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": f"索引配置无效: {str(e)}"}), 400
+
     file = request.files['file']
     if file.filename == '':
         return jsonify({"status": "error", "message": "未选择文件"}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
+        source_name = _source_name(file)
+        if source_name is None:
+            return jsonify({"status": "error", "message": f"来源名 (source) 不能为空，且不能超过 {_MAX_SOURCE_NAME_BYTES} 字节"}), 400
+        stream = spool_upload(file)
         try:
-            logger.info(f"开始为 {filename} 构建知识库 '{collection_name}'...")
-            inserted_count = kb.build_and_store(filepath, collection_name)
-            os.remove(filepath)
+            logger.info(f"开始为 {source_name} 构建知识库 '{collection_name}'...")
+            inserted_count = kb.build_and_store(stream, collection_name, mode=mode, source_name=source_name,
+                                                index_type=index_type, metric_type=metric_type,
+                                                index_params=index_params)
+            action = "追加" if mode == "append" else "构建"
             return jsonify({
                 "status": "success", 
-                "message": f"知识库 '{collection_name}' 构建成功，共存入 {inserted_count} 个条目。"
+                "message": f"知识库 '{collection_name}' {action}成功，共存入 {inserted_count} 个条目。",
+                "index": kb.index_info(collection_name)
             })
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         except Exception as e:
             logger.error(f"构建知识库时发生错误: {e}", exc_info=True)
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
+        finally:
+            stream.close()
     else:
         return jsonify({"status": "error", "message": "文件类型不允许，仅支持 PDF"}), 400
 
@@ -78,106 +271,111 @@ def review_contract_endpoint():
     if not kb.is_ready(collection_name):
          return jsonify({"status": "error", "message": f"知识库 '{collection_name}' 不存在或为空。"}), 400
 
-    if 'contract_file' not in request.files:
-        return jsonify({"status": "error", "message": "请求中未找到合同文件"}), 400
-    
     perspective = request.form.get('perspective')
     if perspective not in ['甲方', '乙方']:
         return jsonify({"status": "error", "message": "立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
         
-    file = request.files['contract_file']
-    if file.filename == '':
-        return jsonify({"status": "error", "message": "未选择合同文件"}), 400
-    
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
+    mode = request.form.get('mode', 'auto')
+    if mode not in ['auto', 'single', 'map_reduce']:
+        return jsonify({"status": "error", "message": "审查模式 (mode) 必须是 'auto'、'single' 或 'map_reduce'"}), 400
+
+    try:
+        document, error = _document_from_request()
+        if error:
+            return error
+
+        # 摘要、检索与合同方提取并发执行，条款审查在其依赖就绪后立即开始
+        review_result = assistant.run_full_review(document.text, perspective, collection_name, mode=mode,
+                                                  document=document)
+        response_data = {
+            "document_id": document.id,
+            "contract_summary": review_result["contract_summary"],
+            "risk_review_report": review_result["risk_review_report"],
+            "stage_timings": review_result["stage_timings"],
+            "errors": review_result["errors"]
+        }
+        return jsonify(response_data)
+    except Exception as e:
+        logger.error(f"合同审查时发生错误: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
+
+def _sse_event(event: str, data) -> str:
+    """按 Server-Sent Events 格式编码一个事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@api_bp.route('/review_contract/stream', methods=['POST'])
+def review_contract_stream_endpoint():
+    """
+    合同审查的流式版本：以 SSE 形式先推送 document（含 document_id），再依次推送 summary、parties、逐条 risk_item
+    （已推送的条款风险等级被上调时推送 risk_item_update），最后推送 done（含完整报告与耗时）。
+    """
+    if not assistant or not kb:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    collection_name = request.form.get('collection_name')
+    if not collection_name:
+        return jsonify({"status": "error", "message": "必须提供要使用的知识库名称 (collection_name)"}), 400
+    if not kb.is_ready(collection_name):
+        return jsonify({"status": "error", "message": f"知识库 '{collection_name}' 不存在或为空。"}), 400
+
+    perspective = request.form.get('perspective')
+    if perspective not in ['甲方', '乙方']:
+        return jsonify({"status": "error", "message": "立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
+
+    mode = request.form.get('mode', 'auto')
+    if mode not in ['auto', 'single', 'map_reduce']:
+        return jsonify({"status": "error", "message": "审查模式 (mode) 必须是 'auto'、'single' 或 'map_reduce'"}), 400
+
+    try:
+        document, error = _document_from_request()
+    except Exception as e:
+        logger.error(f"流式合同审查解析合同时发生错误: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
+    if error:
+        return error
+
+    def generate():
+        yield _sse_event("document", {"document_id": document.id})
         try:
-            contract_content = extract_text_from_pdf(filepath)
-            if not contract_content:
-                os.remove(filepath)
-                return jsonify({"status": "error", "message": "无法从PDF中提取文本内容"}), 500
-
-            summary = assistant.get_contract_summary(contract_content)
-            party_info = assistant.extract_party_names(contract_content)
-            risk_report = assistant.review_contract(contract_content, perspective, party_info, collection_name)
-            
-            os.remove(filepath)
-            
-            response_data = {
-                "contract_summary": summary,
-                "risk_review_report": risk_report
-            }
-            return jsonify(response_data)
+            for event, data in assistant.iter_full_review(document.text, perspective, collection_name, mode=mode,
+                                                          document=document):
+                yield _sse_event(event, data)
         except Exception as e:
-            logger.error(f"合同审查时发生错误: {e}", exc_info=True)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
-    else:
-        return jsonify({"status": "error", "message": "文件类型不允许，仅支持 PDF"}), 400
+            logger.error(f"流式合同审查时发生错误: {e}", exc_info=True)
+            yield _sse_event("error", {"message": f"服务器内部错误: {str(e)}"})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
 
 @api_bp.route('/review_party', methods=['POST'])
 def review_party_endpoint():
-    # --- 此函数已更新 ---
     if not assistant:
         return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
 
-    if 'contract_file' not in request.files:
-        return jsonify({"status": "error", "message": "请求中未找到合同文件"}), 400
-    
-    # 不再需要用户手动提供 party_profile
+    # party_profile 可选，未提供时通过企查查获取对方工商信息
     perspective = request.form.get('perspective')
     
     if perspective not in ['甲方', '乙方']:
         return jsonify({"status": "error", "message": "我方立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
 
-    file = request.files['contract_file']
-    if file.filename == '':
-        return jsonify({"status": "error", "message": "未选择合同文件"}), 400
-        
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    try:
+        document, error = _document_from_request()
+        if error:
+            return error
 
-        try:
-            contract_content = extract_text_from_pdf(filepath)
-            if not contract_content:
-                os.remove(filepath)
-                return jsonify({"status": "error", "message": "无法从PDF中提取文本内容"}), 500
-
-            party_info = assistant.extract_party_names(contract_content)
-            party_to_review_str = "乙方" if perspective == "甲方" else "甲方"
-            party_name_key = 'party_b' if party_to_review_str == "乙方" else 'party_a'
-            party_name_to_review = party_info.get(party_name_key)
-
-            if not party_name_to_review or party_name_to_review == "未知":
-                 os.remove(filepath)
-                 return jsonify({"status": "error", "message": f"无法从合同中自动识别出{party_to_review_str}的公司名称。"}), 400
-
-            party_review_report = assistant.review_party_profile(
-                contract_text=contract_content,
-                party_name_to_review=party_name_to_review,
-                perspective=perspective
-            )
-
-            # 检查 assistant 是否返回了 API 错误
-            if isinstance(party_review_report, dict) and "error" in party_review_report:
-                # 503 Service Unavailable 表示上游服务（企查查）暂时不可用
-                return jsonify({"status": "error", "message": party_review_report["error"]}), 503
-            
-            os.remove(filepath)
-            return jsonify(party_review_report)
-        except Exception as e:
-            logger.error(f"主体审查时发生错误: {e}", exc_info=True)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
-    else:
-        return jsonify({"status": "error", "message": "文件类型不允许，仅支持 PDF"}), 400
+        party_profile = request.form.get('party_profile') or None
+        party_review_report = assistant.run_party_review(document.text, perspective, party_profile=party_profile,
+                                                         document=document)
+
+        # 检查 assistant 是否返回了错误（无法识别对方或上游服务不可用）
+        if isinstance(party_review_report, dict) and "error" in party_review_report:
+            return jsonify({"status": "error", "message": party_review_report["error"],
+                            "document_id": document.id}), party_review_report["status_code"]
+        
+        return jsonify(party_review_report)
+    except Exception as e:
+        logger.error(f"主体审查时发生错误: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
 
 @api_bp.route('/delete_kb', methods=['POST'])
 def delete_kb_endpoint():
@@ -198,6 +396,26 @@ def delete_kb_endpoint():
         logger.error(f"删除知识库接口发生未知错误: {e}", exc_info=True)
         return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
 
+@api_bp.route('/remove_source', methods=['POST'])
+def remove_source_endpoint():
+    if not kb:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    collection_name = request.form.get('collection_name')
+    source_name = request.form.get('source')
+    if not collection_name or not source_name:
+        return jsonify({"status": "error", "message": "必须提供知识库名称 (collection_name) 和来源文档名 (source)"}), 400
+
+    try:
+        success, message = kb.remove_source(collection_name, source_name)
+        if success:
+            return jsonify({"status": "success", "message": message})
+        else:
+            return jsonify({"status": "error", "message": message}), 400
+    except Exception as e:
+        logger.error(f"删除来源接口发生未知错误: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
+
 @api_bp.route('/list_kbs', methods=['GET'])
 def list_kbs_endpoint():
     if not kb:
@@ -214,4 +432,262 @@ def list_kbs_endpoint():
             return jsonify({"status": "error", "message": data}), 500
     except Exception as e:
         logger.error(f"列出知识库接口发生未知错误: {e}", exc_info=True)
-        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": f"服务器内部错误: {str(e)}"}), 500
+
+@api_bp.route('/lookup_article', methods=['GET'])
+def lookup_article_endpoint():
+    """按条号直接查询条文原文。article 可以是“第五百八十五条”、“585”，或包含多个引用的一段文本"""
+    if not kb:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    collection_name = request.args.get('collection_name')
+    article = request.args.get('article', '').strip()
+    if not collection_name or not article:
+        return jsonify({"status": "error", "message": "必须提供知识库名称 (collection_name) 和条号 (article)"}), 400
+    number = parse_chinese_number(article)
+    article_nos = [number] if number else find_article_refs(article)
+    if not article_nos:
+        return jsonify({"status": "error", "message": f"无法识别条号: {article}"}), 400
+
+    found = kb.lookup_articles(collection_name, article_nos)
+    return jsonify({
+        "status": "success",
+        "articles": [hit for article_no in article_nos for hit in found.get(article_no, [])],
+        "not_found": [article_no for article_no in article_nos if article_no not in found]
+    })
+
+@api_bp.route('/documents', methods=['POST'])
+def upload_document_endpoint():
+    """上传并解析合同，返回 document_id；之后各审查接口可用 document_id 代替重复上传"""
+    document, error = _document_from_request()
+    if error:
+        return error
+    return jsonify({"status": "success", **document.to_dict()})
+
+@api_bp.route('/documents/<document_id>', methods=['GET'])
+def get_document_endpoint(document_id):
+    document = document_store.get(document_id)
+    if document is None:
+        return jsonify({"status": "error", "message": f"文档 '{document_id}' 不存在或已过期。"}), 404
+    return jsonify({"status": "success", **document.to_dict()})
+
+@api_bp.route('/cache_stats', methods=['GET'])
+def cache_stats_endpoint():
+    return jsonify({
+        "status": "success",
+        "embedding_cache": get_embedding_cache_stats(),
+        "llm_cache": get_llm_cache_stats(),
+        "qichacha": get_qichacha_stats(),
+        "document_store": document_store.stats(),
+        "knowledge_base": kb.stats() if kb else None
+    })
+
+# --- 异步审查任务 ---
+
+def _job_document(job, document, upload):
+    """异步任务中取得合同：已缓存的合同直接使用，否则解析上传内容"""
+    job.update_stage("extract", "running")
+    if document is None:
+        document = _parse_upload(*upload)
+    job.update_stage("extract", "done" if document else "failed")
+    return document
+
+def _contract_review_job(job, document, upload, perspective: str, collection_name: str, mode: str):
+    document = _job_document(job, document, upload)
+    if document is None:
+        return {"error": "无法从PDF中提取文本内容"}
+
+    review_result = assistant.run_full_review(
+        document.text, perspective, collection_name, mode=mode, progress_callback=job.update_stage, document=document
+    )
+    return {
+        "document_id": document.id,
+        "contract_summary": review_result["contract_summary"],
+        "risk_review_report": review_result["risk_review_report"],
+        "stage_timings": review_result["stage_timings"],
+        "errors": review_result["errors"]
+    }
+
+def _party_review_job(job, document, upload, perspective: str, party_profile: str):
+    document = _job_document(job, document, upload)
+    if document is None:
+        return {"error": "无法从PDF中提取文本内容"}
+    return assistant.run_party_review(
+        document.text, perspective, party_profile=party_profile, progress_callback=job.update_stage, document=document
+    )
+
+def _bulk_party_review_job(job, uploads: list, perspective: str):
+    """
+    uploads 为 [(合同标识, 上传内容的缓冲)]，并发提取文本后进行批量主体审查。
+    与单份上传一样按内容哈希复用 document_store 中已解析的合同，重复提交同一批合同时不再提取文本
+    """
+    job.update_stage("extract", "running")
+    contract_ids = [contract_id for contract_id, _ in uploads]
+    try:
+        with ThreadPoolExecutor(max_workers=BULK_PARTY_MAX_CONCURRENCY) as executor:
+            documents = list(executor.map(lambda upload: _parse_upload(upload[1], upload[0]), uploads))
+    finally:
+        for _, stream in uploads:
+            stream.close()
+    texts = [document.text if document else None for document in documents]
+    job.update_stage("extract", "done")
+
+    contracts = {contract_id: text for contract_id, text in zip(contract_ids, texts) if text}
+    result = assistant.run_bulk_party_review(contracts, perspective, progress_callback=job.update_stage)
+    for contract_id, text in zip(contract_ids, texts):
+        if not text:
+            result["results"][contract_id] = {"party_info": None, "counterparty": None,
+                                              "error": "无法从PDF中提取文本内容"}
+    return result
+
+def _batch_review_job(job, paths: list, collection_name: str, perspective: str, mode: str, output_path: str):
+    job.update_stage("review", "running")
+    runner = BatchReviewRunner(assistant, collection_name, perspective, output_path, mode=mode)
+    try:
+        report = runner.run(paths)
+    except BatchOutputLocked as e:
+        return {"error": str(e)}
+    job.update_stage("review", "done")
+    return report
+
+@api_bp.route('/jobs/review_contract', methods=['POST'])
+def submit_review_contract_job():
+    if not assistant or not kb:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    collection_name = request.form.get('collection_name')
+    if not collection_name:
+        return jsonify({"status": "error", "message": "必须提供要使用的知识库名称 (collection_name)"}), 400
+    if not kb.is_ready(collection_name):
+        return jsonify({"status": "error", "message": f"知识库 '{collection_name}' 不存在或为空。"}), 400
+
+    perspective = request.form.get('perspective')
+    if perspective not in ['甲方', '乙方']:
+        return jsonify({"status": "error", "message": "立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
+
+    mode = request.form.get('mode', 'auto')
+    if mode not in ['auto', 'single', 'map_reduce']:
+        return jsonify({"status": "error", "message": "审查模式 (mode) 必须是 'auto'、'single' 或 'map_reduce'"}), 400
+
+    document, upload, error = _contract_from_request()
+    if error:
+        return error
+
+    job = job_manager.submit(
+        "review_contract", ["extract", "summarize", "extract_parties", "retrieve", "review"],
+        _contract_review_job, document, upload, perspective, collection_name, mode
+    )
+    return jsonify({"status": "accepted", "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+
+@api_bp.route('/jobs/review_party', methods=['POST'])
+def submit_review_party_job():
+    if not assistant:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    perspective = request.form.get('perspective')
+    if perspective not in ['甲方', '乙方']:
+        return jsonify({"status": "error", "message": "我方立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
+
+    document, upload, error = _contract_from_request()
+    if error:
+        return error
+
+    job = job_manager.submit(
+        "review_party", ["extract", "extract_parties", "review"],
+        _party_review_job, document, upload, perspective, request.form.get('party_profile') or None
+    )
+    return jsonify({"status": "accepted", "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+
+@api_bp.route('/jobs/review_parties', methods=['POST'])
+def submit_bulk_party_review_job():
+    """批量交易对手审查：一次上传多份合同（contract_files），结果按合同文件名组织"""
+    if not assistant:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    perspective = request.form.get('perspective')
+    if perspective not in ['甲方', '乙方']:
+        return jsonify({"status": "error", "message": "我方立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
+
+    files = [file for file in request.files.getlist('contract_files') if file and file.filename]
+    if not files:
+        return jsonify({"status": "error", "message": "请求中未找到合同文件 (contract_files)"}), 400
+    if len(files) > BULK_PARTY_MAX_FILES:
+        return jsonify({"status": "error", "message": f"单次最多提交 {BULK_PARTY_MAX_FILES} 份合同"}), 400
+    rejected = [file.filename for file in files if not allowed_file(file.filename)]
+    if rejected:
+        return jsonify({"status": "error", "message": f"文件类型不允许，仅支持 PDF: {rejected}"}), 400
+
+    # 以原文件名作为合同标识，同名文件依次加序号区分。
+    # 整个请求共用一份内存缓冲预算，多数合同直接转存为临时文件，内存占用不随文件数增长
+    uploads, seen = [], {}
+    spool_max_bytes = UPLOAD_SPOOL_MAX_BYTES // len(files)
+    for file in files:
+        contract_id = file.filename
+        seen[contract_id] = seen.get(contract_id, 0) + 1
+        if seen[contract_id] > 1:
+            contract_id = f"{contract_id}#{seen[contract_id]}"
+        uploads.append((contract_id, spool_upload(file, max_size=spool_max_bytes)))
+
+    job = job_manager.submit(
+        "review_parties", ["extract", "extract_parties", "lookup", "review"],
+        _bulk_party_review_job, uploads, perspective
+    )
+    return jsonify({"status": "accepted", "job_id": job.id, "contracts": len(uploads),
+                    "status_url": f"/jobs/{job.id}"}), 202
+
+@api_bp.route('/jobs/batch_review', methods=['POST'])
+def submit_batch_review_job():
+    """
+    批量审查服务器上 BATCH_INPUT_ROOT 目录中的合同，JSON 请求体:
+    {"inputs": [相对 BATCH_INPUT_ROOT 的文件或目录], "collection_name", "perspective", "mode", "batch_name"}。
+    结果逐份写入 BATCH_OUTPUT_DIR/<batch_name>.jsonl；以相同 batch_name 重新提交时跳过已成功的合同。
+    """
+    if not assistant or not kb:
+        return jsonify({"status": "error", "message": "服务初始化失败。"}), 500
+
+    payload = request.get_json(silent=True) or {}
+    collection_name = payload.get('collection_name')
+    if not collection_name:
+        return jsonify({"status": "error", "message": "必须提供要使用的知识库名称 (collection_name)"}), 400
+    if not kb.is_ready(collection_name):
+        return jsonify({"status": "error", "message": f"知识库 '{collection_name}' 不存在或为空。"}), 400
+
+    perspective = payload.get('perspective')
+    if perspective not in ['甲方', '乙方']:
+        return jsonify({"status": "error", "message": "立场 (perspective) 必须是 '甲方' 或 '乙方'"}), 400
+
+    mode = payload.get('mode', 'auto')
+    if mode not in ['auto', 'single', 'map_reduce']:
+        return jsonify({"status": "error", "message": "审查模式 (mode) 必须是 'auto'、'single' 或 'map_reduce'"}), 400
+
+    batch_name = payload.get('batch_name')
+    if not batch_name or not re.match(r"^[a-zA-Z0-9_\-]{1,128}$", batch_name):
+        return jsonify({"status": "error", "message": "必须提供有效的批次名称 (batch_name)，只能包含字母、数字、下划线和短横线。"}), 400
+
+    inputs = payload.get('inputs') or ['.']
+    if not isinstance(inputs, list):
+        return jsonify({"status": "error", "message": "inputs 必须是路径列表"}), 400
+    root = os.path.realpath(BATCH_INPUT_ROOT)
+    resolved = [os.path.realpath(os.path.join(root, str(item))) for item in inputs]
+    if any(path != root and not path.startswith(root + os.sep) for path in resolved):
+        return jsonify({"status": "error", "message": f"输入路径必须位于 {BATCH_INPUT_ROOT} 目录内"}), 400
+    paths = collect_contract_paths(resolved)
+    if not paths:
+        return jsonify({"status": "error", "message": "未找到任何 PDF 合同。"}), 400
+
+    output_path = os.path.join(BATCH_OUTPUT_DIR, f"{batch_name}.jsonl")
+    if output_in_use(output_path):
+        return jsonify({"status": "error", "message": f"批次 '{batch_name}' 正在审查中，请等待其完成后再提交。"}), 409
+    job = job_manager.submit(
+        "batch_review", ["review"],
+        _batch_review_job, paths, collection_name, perspective, mode, output_path
+    )
+    return jsonify({"status": "accepted", "job_id": job.id, "contracts": len(paths), "output_path": output_path,
+                    "status_url": f"/jobs/{job.id}"}), 202
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": f"任务 '{job_id}' 不存在或已过期。"}), 404
+    return jsonify(job.to_dict())
@@ -2,17 +2,51 @@
 import logging
 import json
 import re
-from app.db.milvus_kb import MilvusKnowledgeBase
-from app.services.llm_service import call_qwen_model
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    REVIEW_MAP_REDUCE_THRESHOLD_CHARS, REVIEW_WINDOW_CHARS, REVIEW_MAX_CONCURRENCY, BULK_PARTY_MAX_CONCURRENCY,
+    RETRIEVAL_CONTEXT_TOKEN_BUDGET
+)
+from app.db.base import KnowledgeBaseBackend
+from app.core.documents import ContractDocument, DocumentStore
+from app.services.llm_service import call_qwen_model, get_embeddings
+from app.services.prompt_budget import (
+    estimate_tokens, strip_boilerplate, truncate_to_tokens, take_within_budget, max_input_tokens, plan_prompt
+)
+from app.services.qichahca_service import get_company_info, format_company_info_for_llm, normalize_company_name
+from app.utils.helpers import split_contract_clauses, find_article_refs, find_statute_refs
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
+_PROMPT_TEMPLATE_TOKENS = 1500  # 提示词模板本身（角色、任务、输出要求）的 token 数上限
+SUMMARY_UNAVAILABLE = "未能生成合同摘要。"  # 模型调用失败时返回的摘要占位文本
+
 class ContractReviewAssistant:
-    def __init__(self, knowledge_base: MilvusKnowledgeBase):
+    def __init__(self, knowledge_base: KnowledgeBaseBackend, document_store: DocumentStore = None):
         self.knowledge_base = knowledge_base
+        # 提供 document 参数的方法会把合同方、条款向量写回文档缓存，同一合同再次分析时直接复用
+        self.document_store = document_store
+
+    def _save_document(self, document: ContractDocument):
+        if self.document_store is not None:
+            self.document_store.update(document)
         
+    @staticmethod
+    def _fit_contract_text(stage: str, contract_text: str, reserved_tokens: int = 0) -> str:
+        """去除页码、页眉页脚和签署栏；仍超出该阶段最大模型的容量时截断并告警"""
+        text = strip_boilerplate(contract_text)
+        budget = max_input_tokens(stage) - _PROMPT_TEMPLATE_TOKENS - reserved_tokens
+        truncated = truncate_to_tokens(text, budget)
+        if len(truncated) < len(text):
+            logger.warning(f"[{stage}] 合同文本超出模型容量，已截断为前 {len(truncated)}/{len(text)} 个字符。")
+        return truncated
+
     def get_contract_summary(self, contract_text: str) -> str:
         logger.info("开始生成合同摘要...")
+        contract_text = self._fit_contract_text("summary", contract_text)
         prompt = f"""
         ### 角色 ###
         你是一位专业的法律助理，擅长将复杂的法律文件提炼成清晰、简洁的摘要。
@@ -35,15 +69,25 @@ class ContractReviewAssistant:
         {contract_text}
         ---
         """
-        summary = call_qwen_model(prompt, model="qwen-turbo", temperature=0.0)
+        model = plan_prompt("summary", prompt, {"合同": contract_text})
+        summary = call_qwen_model(prompt, model=model, temperature=0.0)
         logger.info("合同摘要生成完毕。")
-        return summary or "未能生成合同摘要。"
+        return summary or SUMMARY_UNAVAILABLE
 
-    def review_party_profile(self, contract_text: str, party_profile: str, party_name_to_review: str, perspective: str) -> dict:
+    def review_party_profile(self, contract_text: str, party_name_to_review: str, perspective: str,
+                             party_profile: str = None) -> dict:
         """
-        根据用户提供的公司简介，审查合同另一方的潜在风险和履约能力。
+        根据公司简介，审查合同另一方的潜在风险和履约能力。
+        未提供 party_profile 时，通过企查查获取工商信息作为简介；查询失败时返回包含 'error' 键的字典。
         """
+        if not party_profile:
+            company_info = get_company_info(party_name_to_review)
+            if "error" in company_info:
+                return {"error": company_info["error"]}
+            party_profile = format_company_info_for_llm(company_info)
+
         logger.info(f"开始对 {party_name_to_review} 进行主体资格与履约能力审查...")
+        contract_text = self._fit_contract_text("party_review", contract_text, estimate_tokens(party_profile))
         prompt = f"""
         ### 角色 ###
         你是一位经验丰富的商业尽职调查专家，特别擅长从公司简介和合同文本中识别潜在的商业风险。
@@ -79,7 +123,8 @@ class ContractReviewAssistant:
         ---
         """
         
-        response_str = call_qwen_model(prompt, model="qwen-plus", temperature=0.1)
+        model = plan_prompt("party_review", prompt, {"合同": contract_text, "公司简介": party_profile})
+        response_str = call_qwen_model(prompt, model=model, temperature=0.1)
         
         if not response_str:
             logger.error("模型未能返回主体审查结果。")
@@ -97,7 +142,10 @@ class ContractReviewAssistant:
             logger.error(f"模型返回的原始文本: \n{response_str}")
             return {}
 
-    def extract_party_names(self, contract_text: str) -> dict:
+    def extract_party_names(self, contract_text: str, document: ContractDocument = None) -> dict:
+        if document is not None and document.parties:
+            logger.info("复用已缓存的合同方信息，跳过模型调用。")
+            return dict(document.parties)
         logger.info("开始提取合同方信息...")
         prompt = f"""
         请从以下合同文本中，提取并识别出“甲方”和“乙方”分别对应的公司全称。
@@ -111,15 +159,19 @@ class ContractReviewAssistant:
         {{"party_a": "甲方公司全称", "party_b": "乙方公司全称"}}
         如果找不到，请将对应的值留空字符串 ""。
         """
-        response_str = call_qwen_model(prompt)
+        response_str = call_qwen_model(prompt, model=plan_prompt("extract_parties", prompt))
         try:
             parties = json.loads(response_str)
             logger.info(f"成功提取合同方: 甲方 - {parties.get('party_a')}, 乙方 - {parties.get('party_b')}")
+            # 只缓存模型提取成功的结果，正则兜底的结果下次仍会重试模型
+            if document is not None and isinstance(parties, dict):
+                document.parties = parties
+                self._save_document(document)
             return parties
         except (json.JSONDecodeError, TypeError):
             logger.warning("模型返回非JSON，尝试正则提取...")
-            party_a = re.search(r"甲\s*方：\s*([^\n\r]+)", contract_text)
-            party_b = re.search(r"乙\s*方：\s*([^\n\r]+)", contract_text)
+            party_a = re.search(r"甲\s*方：\s*([^\n\r\f]+)", contract_text)
+            party_b = re.search(r"乙\s*方：\s*([^\n\r\f]+)", contract_text)
             parties = {
                 "party_a": party_a.group(1).strip() if party_a else "未知",
                 "party_b": party_b.group(1).strip() if party_b else "未知"
@@ -127,21 +179,14 @@ class ContractReviewAssistant:
             logger.info(f"正则提取结果: 甲方 - {parties['party_a']}, 乙方 - {parties['party_b']}")
             return parties
 
-    def review_contract(self, contract_text: str, perspective: str, party_names: dict, collection_name: str) -> list:
-        if perspective.upper() not in ["甲方", "乙方"]:
-            raise ValueError("立场必须是 '甲方' 或 '乙方'")
-            
-        party_name = party_names.get('party_a' if perspective == '甲方' else 'party_b', perspective)
-        logger.info(f"开始合同条款风险审查（使用知识库 '{collection_name}'），当前立场: {perspective} ({party_name})")
-        
-        retrieved_context = self.knowledge_base.retrieve(contract_text, collection_name=collection_name)
-        
-        prompt = f"""
+    def _build_review_prompt(self, contract_text: str, perspective: str, party_name: str,
+                             retrieved_context: str, segment_note: str = "") -> str:
+        return f"""
         ### 角色 ###
         你是一位专注于《中华人民共和国民法典》的法务专家。你的所有知识和分析都必须严格基于我提供给你的《民法典》条款。
 
         ### 背景 ###
-        我现在的立场是 **{perspective}** ({party_name})。请你站在我的立场上，以保护我方利益为首要目标。
+        我现在的立场是 **{perspective}** ({party_name})。请你站在我的立场上，以保护我方利益为首要目标。{segment_note}
 
         ### 法律依据参考 (唯一知识来源) ###
         以下是从《中华人民共和国民法典》知识库中检索到的相关法律条文。这是你进行本次审查时可以使用的 **唯一** 法律依据。
@@ -172,23 +217,460 @@ class ContractReviewAssistant:
         {contract_text}
         ---
         """
-        
-        response_str = call_qwen_model(prompt, model="qwen-long", temperature=0.1)
-        
+
+    @staticmethod
+    def _parse_review_response(response_str: str):
+        """解析条款审查结果，失败时返回 None"""
         if not response_str:
             logger.error("模型未能返回审查结果。")
-            return []
-            
+            return None
         try:
             if response_str.strip().startswith("```json"):
                 response_str = response_str.strip()[7:-3].strip()
             
             review_results = json.loads(response_str)
             review_results = json.loads(json.dumps(review_results, ensure_ascii=False))
-
-            logger.info(f"条款审查完成，发现 {len(review_results)} 个风险点。")
+            if not isinstance(review_results, list):
+                raise json.JSONDecodeError("审查结果不是JSON列表", response_str, 0)
             return review_results
         except json.JSONDecodeError as e:
             logger.error(f"解析条款审查报告JSON失败: {e}")
             logger.error(f"模型返回的原始文本: \n{response_str}")
-            return []
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def _build_review_windows(clauses: list[str], window_chars: int = REVIEW_WINDOW_CHARS) -> list[list[int]]:
+        """将条款按顺序组合为不超过 window_chars 字符的窗口，返回每个窗口包含的条款序号"""
+        windows, current, current_len = [], [], 0
+        for idx, clause in enumerate(clauses):
+            if current and current_len + len(clause) > window_chars:
+                windows.append(current)
+                current, current_len = [], 0
+            current.append(idx)
+            current_len += len(clause)
+        if current:
+            windows.append(current)
+        return windows
+
+    @staticmethod
+    def _risk_item_key(item: dict) -> str:
+        """风险条款的去重键：original_clause 去掉空白"""
+        return re.sub(r"\s+", "", str(item.get("original_clause", "")))
+
+    @staticmethod
+    def _outranks(item: dict, existing: dict) -> bool:
+        """item 的风险等级是否高于 existing"""
+        level_rank = {"高风险": 3, "中风险": 2, "低风险": 1}
+        return level_rank.get(item.get("risk_level"), 0) > level_rank.get(existing.get("risk_level"), 0)
+
+    @classmethod
+    def _merge_risk_items(cls, risk_items: list[dict]) -> list[dict]:
+        """按 original_clause（忽略空白）去重，重复时保留风险等级更高的一条"""
+        merged = {}
+        for item in risk_items:
+            if not isinstance(item, dict):
+                continue
+            key = cls._risk_item_key(item)
+            existing = merged.get(key)
+            if existing is None or cls._outranks(item, existing):
+                merged[key] = item
+        return list(merged.values())
+
+    @staticmethod
+    def _format_articles(article_hits: dict) -> list[str]:
+        return [f"【{hit['source']} 第{article_no}条】{hit['text']}"
+                for article_no, hits in article_hits.items() for hit in hits]
+
+    def _build_retrieved_context(self, text: str, collection_name: str, clause_contexts: dict) -> str:
+        """
+        组装提示词中的法律依据：待审查文本中注明法律名称引用的条文（按条号精确取回）排在前面，
+        其后是检索得到的相关条文，已精确取回的条文不再重复。合同自身的条款编号不视为引用。
+        """
+        article_hits = self.knowledge_base.lookup_articles(collection_name, find_statute_refs(text))
+        cited = self._format_articles(article_hits)
+        cited_texts = {hit["text"] for hits in article_hits.values() for hit in hits}
+        retrieved = [doc for doc in self.knowledge_base.merge_clause_contexts(clause_contexts) if doc not in cited_texts]
+        docs = take_within_budget(cited + retrieved, RETRIEVAL_CONTEXT_TOKEN_BUDGET)
+        if len(docs) < len(cited) + len(retrieved):
+            logger.info(f"法条超出 {RETRIEVAL_CONTEXT_TOKEN_BUDGET} tokens 预算，保留前 {len(docs)}/{len(cited) + len(retrieved)} 条。")
+        return "\n---\n".join(docs) or "未检索到相关法条。"
+
+    def _attach_cited_articles(self, risk_items: list, collection_name: str) -> list:
+        """为模型在合规分析中引用的法条附上原文（cited_articles），便于核对引用是否准确"""
+        for item in risk_items:
+            if not isinstance(item, dict):
+                continue
+            refs = find_article_refs(str(item.get("compliance_analysis", "")))
+            hits = self.knowledge_base.lookup_articles(collection_name, refs) if refs else {}
+            if hits:
+                item["cited_articles"] = [hit for article_hits in hits.values() for hit in article_hits]
+        return risk_items
+
+    def retrieve_clause_contexts(self, contract_text: str, collection_name: str,
+                                 document: ContractDocument = None) -> dict:
+        """
+        按条款检索知识库，返回 {条款序号: 检索结果列表}。条款序号基于去除页码、签署栏等内容后的文本。
+        提供 document 时复用其条款切分与条款向量，首次检索生成的向量写回文档缓存。
+        """
+        if document is None:
+            clauses = split_contract_clauses(strip_boilerplate(contract_text))
+            return self.knowledge_base.retrieve_by_clauses(clauses, collection_name)
+
+        clauses = document.clauses
+        if document.clause_embeddings is None:
+            embeddings = get_embeddings(clauses)
+            if all(e is not None for e in embeddings):
+                document.clause_embeddings = embeddings
+                self._save_document(document)
+        else:
+            logger.info(f"复用已缓存的 {len(clauses)} 个条款向量。")
+            embeddings = document.clause_embeddings
+        return self.knowledge_base.retrieve_by_clauses(clauses, collection_name, clause_embeddings=embeddings)
+
+    def iter_review_windows(self, contract_text: str, perspective: str, party_name: str, collection_name: str,
+                            clause_contexts: dict, max_workers: int = REVIEW_MAX_CONCURRENCY, failures: list = None):
+        """
+        Map 阶段：将合同切分为条款窗口并以有限并发审查，每完成一个窗口就产出该窗口的风险条款列表。
+        单个窗口调用或解析失败只会丢失该窗口的结果，并向 failures（如提供）追加一条失败说明。
+        """
+        clauses = split_contract_clauses(contract_text)
+        windows = self._build_review_windows(clauses)
+        logger.info(f"合同被切分为 {len(clauses)} 个条款、{len(windows)} 个审查窗口，最大并发数 {max_workers}。")
+
+        def review_window(window_no: int, clause_ids: list[int]):
+            window_text = "\n".join(clauses[i] for i in clause_ids)
+            retrieved_context = self._build_retrieved_context(
+                window_text, collection_name, {i: clause_contexts.get(i, []) for i in clause_ids}
+            )
+            segment_note = f"\n        以下待审查文本是完整合同的第 {window_no + 1}/{len(windows)} 部分，请仅审查该部分中的条款。"
+            prompt = self._build_review_prompt(window_text, perspective, party_name, retrieved_context, segment_note)
+            model = plan_prompt("clause_review", prompt, {"合同": window_text, "法条": retrieved_context})
+            return self._parse_review_response(call_qwen_model(prompt, model=model, temperature=0.1))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(review_window, no, ids): no for no, ids in enumerate(windows)}
+            for future in as_completed(futures):
+                window_no = futures[future]
+                try:
+                    window_results = future.result()
+                except Exception as e:
+                    logger.error(f"审查窗口 {window_no + 1}/{len(windows)} 发生异常: {e}", exc_info=True)
+                    window_results = None
+                if window_results is None:
+                    logger.warning(f"审查窗口 {window_no + 1}/{len(windows)} 失败，该部分结果将缺失。")
+                    if failures is not None:
+                        failures.append(f"审查窗口 {window_no + 1}/{len(windows)} 失败")
+                    continue
+                yield self._attach_cited_articles(window_results, collection_name)
+
+    def iter_review_batches(self, contract_text: str, perspective: str, party_names: dict, collection_name: str,
+                            clause_contexts: dict = None, mode: str = "auto", failures: list = None):
+        """
+        逐批产出条款审查结果（每批为一个风险条款列表）。
+        mode 为 "single" 时整份合同一次性审查，只产出一批；为 "map_reduce" 时每完成一个条款窗口产出一批；
+        为 "auto" 时根据合同长度自动选择。
+        模型调用或结果解析失败的部分不会产出结果，提供 failures 列表时向其中追加失败说明。
+        """
+        if perspective.upper() not in ["甲方", "乙方"]:
+            raise ValueError("立场必须是 '甲方' 或 '乙方'")
+        if mode not in ["auto", "single", "map_reduce"]:
+            raise ValueError("审查模式必须是 'auto'、'single' 或 'map_reduce'")
+            
+        party_name = party_names.get('party_a' if perspective == '甲方' else 'party_b', perspective)
+        # 调用方可以传入预先检索好的条款上下文（例如并发编排时），避免重复检索
+        if clause_contexts is None:
+            clause_contexts = self.retrieve_clause_contexts(contract_text, collection_name)
+
+        contract_text = strip_boilerplate(contract_text)
+        if mode == "auto":
+            # 过长或整份放不进最大模型（预留法条预算）时分窗口审查
+            single_budget = max_input_tokens("clause_review") - _PROMPT_TEMPLATE_TOKENS - RETRIEVAL_CONTEXT_TOKEN_BUDGET
+            too_long = (len(contract_text) > REVIEW_MAP_REDUCE_THRESHOLD_CHARS
+                        or estimate_tokens(contract_text) > single_budget)
+            mode = "map_reduce" if too_long else "single"
+        logger.info(f"开始合同条款风险审查（使用知识库 '{collection_name}'，模式 {mode}），当前立场: {perspective} ({party_name})")
+        
+        if mode == "map_reduce":
+            yield from self.iter_review_windows(contract_text, perspective, party_name, collection_name,
+                                                clause_contexts, failures=failures)
+            return
+
+        retrieved_context = self._build_retrieved_context(contract_text, collection_name, clause_contexts)
+        prompt = self._build_review_prompt(contract_text, perspective, party_name, retrieved_context)
+        model = plan_prompt("clause_review", prompt, {"合同": contract_text, "法条": retrieved_context})
+        response_str = call_qwen_model(prompt, model=model, temperature=0.1)
+        review_results = self._parse_review_response(response_str)
+        if review_results is None and failures is not None:
+            failures.append("条款审查失败：模型未返回可解析的审查结果")
+        yield self._attach_cited_articles(review_results or [], collection_name)
+
+    def review_contract(self, contract_text: str, perspective: str, party_names: dict, collection_name: str,
+                        clause_contexts: dict = None, mode: str = "auto") -> list:
+        """
+        条款风险审查。
+        mode 为 "single" 时整份合同一次性审查；为 "map_reduce" 时按条款窗口并发审查后合并去重；
+        为 "auto" 时根据合同长度自动选择。
+        """
+        all_items = []
+        for batch in self.iter_review_batches(contract_text, perspective, party_names, collection_name,
+                                              clause_contexts=clause_contexts, mode=mode):
+            all_items.extend(batch)
+        review_results = self._merge_risk_items(all_items)
+        logger.info(f"条款审查完成，合并去重后共 {len(review_results)} 个风险点。")
+        return review_results
+
+    def run_party_review(self, contract_text: str, perspective: str, party_profile: str = None,
+                         progress_callback=None, document: ContractDocument = None) -> dict:
+        """
+        完整的交易对手审查流程：识别对方名称，再进行主体审查。提供 document 时复用已缓存的合同方信息。
+        失败时返回 {"error": 错误信息, "status_code": 建议的 HTTP 状态码}。
+        """
+        def report(stage: str, status: str):
+            if progress_callback:
+                progress_callback(stage, status)
+
+        report("extract_parties", "running")
+        party_info = self.extract_party_names(contract_text, document=document)
+        report("extract_parties", "done")
+
+        party_to_review_str, party_name_to_review = self._counterparty(party_info, perspective)
+        if not party_name_to_review:
+            return {"error": f"无法从合同中自动识别出{party_to_review_str}的公司名称。", "status_code": 400}
+
+        report("review", "running")
+        party_review_report = self.review_party_profile(
+            contract_text=contract_text,
+            party_name_to_review=party_name_to_review,
+            perspective=perspective,
+            party_profile=party_profile
+        )
+        if isinstance(party_review_report, dict) and "error" in party_review_report:
+            # 503 Service Unavailable 表示上游服务（企查查）暂时不可用
+            report("review", "failed")
+            return {"error": party_review_report["error"], "status_code": 503}
+        report("review", "done")
+        return party_review_report
+
+    @staticmethod
+    def _counterparty(party_info: dict, perspective: str):
+        """根据我方立场确定交易对手，返回 (对方称谓, 对方名称)；无法识别时名称为 None"""
+        party_to_review_str = "乙方" if perspective == "甲方" else "甲方"
+        name = (party_info or {}).get('party_b' if party_to_review_str == "乙方" else 'party_a')
+        if not name or not str(name).strip() or name == "未知":
+            return party_to_review_str, None
+        return party_to_review_str, str(name).strip()
+
+    def run_bulk_party_review(self, contracts: dict[str, str], perspective: str,
+                              max_workers: int = BULK_PARTY_MAX_CONCURRENCY, progress_callback=None) -> dict:
+        """
+        批量交易对手审查：contracts 为 {合同标识: 合同文本}。
+        返回 {"results": 按合同标识组织的结果, "unique_counterparties": 不同交易对手数, "stage_timings": 各阶段耗时}，
+        每份合同的结果为 {"party_info", "counterparty", "report"}，失败时以 "error" 代替 "report"。
+        - 各合同的合同方提取并发执行；
+        - 同一交易对手（按规范化名称）只查询一次企查查，多份合同共用其工商信息；
+        - 主体审查按合同进行（同一对手在不同合同中的义务不同），并发数不超过 max_workers，
+          整体吞吐由 LLM 配额而非请求次数决定。
+        """
+        if perspective not in ["甲方", "乙方"]:
+            raise ValueError("立场必须是 '甲方' 或 '乙方'")
+
+        stage_timings = {}
+        results = {contract_id: {"party_info": None, "counterparty": None} for contract_id in contracts}
+
+        def timed(stage: str, func, *args, **kwargs):
+            return self._timed(stage_timings, progress_callback, stage, func, *args, **kwargs)
+
+        logger.info(f"开始批量交易对手审查，共 {len(contracts)} 份合同，并发上限 {max_workers}，立场: {perspective}")
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            def extract_all():
+                futures = {executor.submit(self.extract_party_names, text): contract_id
+                           for contract_id, text in contracts.items()}
+                for future in as_completed(futures):
+                    contract_id = futures[future]
+                    try:
+                        results[contract_id]["party_info"] = future.result()
+                    except Exception as e:
+                        logger.error(f"合同 '{contract_id}' 合同方提取失败: {e}", exc_info=True)
+                        results[contract_id]["error"] = f"合同方提取失败: {str(e)}"
+            timed("extract_parties", extract_all)
+
+            # 交易对手规范化名称 -> 涉及的合同
+            counterparties = {}
+            for contract_id, result in results.items():
+                if "error" in result:
+                    continue
+                party_to_review_str, name = self._counterparty(result["party_info"], perspective)
+                if not name:
+                    result["error"] = f"无法从合同中自动识别出{party_to_review_str}的公司名称。"
+                    continue
+                result["counterparty"] = name
+                counterparties.setdefault(normalize_company_name(name), []).append(contract_id)
+
+            profiles = {}
+            def lookup_all():
+                futures = {executor.submit(get_company_info, name): name for name in counterparties}
+                for future in as_completed(futures):
+                    try:
+                        profiles[futures[future]] = future.result()
+                    except Exception as e:
+                        logger.error(f"查询交易对手 '{futures[future]}' 失败: {e}", exc_info=True)
+                        profiles[futures[future]] = {"error": str(e)}
+            timed("lookup", lookup_all)
+            logger.info(f"{len(counterparties)} 个不同的交易对手已完成工商信息查询。")
+
+            def review_all():
+                futures = {}
+                for name, contract_ids in counterparties.items():
+                    company_info = profiles.get(name, {})
+                    if "error" in company_info:
+                        for contract_id in contract_ids:
+                            results[contract_id]["error"] = company_info["error"]
+                        continue
+                    party_profile = format_company_info_for_llm(company_info)
+                    for contract_id in contract_ids:
+                        future = executor.submit(self.review_party_profile, contracts[contract_id],
+                                                 results[contract_id]["counterparty"], perspective, party_profile)
+                        futures[future] = contract_id
+                for future in as_completed(futures):
+                    contract_id = futures[future]
+                    try:
+                        report = future.result()
+                    except Exception as e:
+                        logger.error(f"合同 '{contract_id}' 主体审查失败: {e}", exc_info=True)
+                        report = {"error": f"主体审查失败: {str(e)}"}
+                    if isinstance(report, dict) and "error" in report:
+                        results[contract_id]["error"] = report["error"]
+                    else:
+                        results[contract_id]["report"] = report
+            timed("review", review_all)
+
+        failed = sum(1 for result in results.values() if "error" in result)
+        logger.info(f"批量交易对手审查完成：成功 {len(results) - failed} 份，失败 {failed} 份，各阶段耗时: {stage_timings}")
+        return {"results": results, "unique_counterparties": len(counterparties), "stage_timings": stage_timings}
+
+    @staticmethod
+    def _timed(stage_timings: dict, progress_callback, stage: str, func, *args, **kwargs):
+        """执行一个阶段并记录耗时，同时通过 progress_callback 汇报阶段状态"""
+        start = time.time()
+        if progress_callback:
+            progress_callback(stage, "running")
+        status = "failed"
+        try:
+            result = func(*args, **kwargs)
+            status = "done"
+            return result
+        finally:
+            elapsed = time.time() - start
+            stage_timings[stage] = round(elapsed, 3)
+            metrics.observe("stage_seconds", elapsed, stage=stage, status=status)
+            if progress_callback:
+                progress_callback(stage, status)
+
+    def iter_full_review(self, contract_text: str, perspective: str, collection_name: str,
+                         mode: str = "auto", progress_callback=None, document: ContractDocument = None):
+        """
+        并发执行完整的合同审查流程，并在各部分结果就绪时立即产出 (事件名, 数据)：
+        - ("summary", 合同摘要)
+        - ("parties", 合同方信息)
+        - ("risk_item", 单个风险条款)：每批审查结果解析后立即产出，已产出过的条款不再重复
+        - ("risk_item_update", {"index": 该条款是第几个产出的 risk_item（从 0 开始）, "risk_item": 新的条款})：
+          已产出的条款在后续批次中以更高的风险等级再次出现时产出，与 done 中合并后的报告保持一致
+        - ("done", {"risk_review_report": 合并去重后的完整报告, "stage_timings": 各阶段耗时,
+                    "errors": 摘要生成失败、审查窗口失败等未能完成的部分，全部成功时为空列表})
+        摘要、知识库检索和合同方提取同时启动；条款审查只依赖合同方和检索结果，
+        因此在这两者完成后立即开始，与仍在进行的摘要生成重叠。
+        progress_callback(stage, status) 会在每个阶段开始（running）和结束（done/failed）时被调用。
+        提供 document 时复用其已缓存的合同方与条款向量。
+        """
+        if perspective not in ["甲方", "乙方"]:
+            raise ValueError("立场必须是 '甲方' 或 '乙方'")
+
+        stage_timings = {}
+        errors = []
+        events = queue.Queue()
+
+        def timed(stage: str, func, *args, **kwargs):
+            return self._timed(stage_timings, progress_callback, stage, func, *args, **kwargs)
+
+        def review_branch(party_future, retrieve_future):
+            party_info = party_future.result()
+            events.put(("parties", party_info))
+            clause_contexts = retrieve_future.result()
+
+            def review_all():
+                for batch in self.iter_review_batches(contract_text, perspective, party_info, collection_name,
+                                                      clause_contexts=clause_contexts, mode=mode, failures=errors):
+                    events.put(("risk_batch", batch))
+            timed("review", review_all)
+
+        logger.info(f"开始并发合同审查流程（知识库 '{collection_name}'，立场: {perspective}）...")
+        total_start = time.time()
+        executor = ThreadPoolExecutor(max_workers=4)
+        try:
+            summary_future = executor.submit(timed, "summarize", self.get_contract_summary, contract_text)
+            retrieve_future = executor.submit(timed, "retrieve", self.retrieve_clause_contexts,
+                                              contract_text, collection_name, document)
+            party_future = executor.submit(timed, "extract_parties", self.extract_party_names, contract_text, document)
+            review_future = executor.submit(review_branch, party_future, retrieve_future)
+            summary_future.add_done_callback(lambda f: events.put(("summary_done", f)))
+            review_future.add_done_callback(lambda f: events.put(("review_done", f)))
+
+            all_items, emitted, pending = [], {}, 2  # emitted: 去重键 -> (产出序号, 已产出的条款)
+            while pending:
+                event, payload = events.get()
+                if event == "parties":
+                    yield "parties", payload
+                elif event == "risk_batch":
+                    all_items.extend(payload)
+                    for item in payload:
+                        if not isinstance(item, dict):
+                            continue
+                        key = self._risk_item_key(item)
+                        if key not in emitted:
+                            emitted[key] = (len(emitted), item)
+                            yield "risk_item", item
+                        elif self._outranks(item, emitted[key][1]):
+                            index = emitted[key][0]
+                            emitted[key] = (index, item)
+                            yield "risk_item_update", {"index": index, "risk_item": item}
+                elif event == "summary_done":
+                    pending -= 1
+                    summary = payload.result()
+                    if summary == SUMMARY_UNAVAILABLE:
+                        errors.append("合同摘要生成失败")
+                    yield "summary", summary
+                elif event == "review_done":
+                    pending -= 1
+                    payload.result()  # 审查分支异常时在此抛出
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        stage_timings["total"] = round(time.time() - total_start, 3)
+        sequential = sum(v for k, v in stage_timings.items() if k != "total")
+        stage_timings["sequential_estimate"] = round(sequential, 3)
+        stage_timings["saved"] = round(max(sequential - stage_timings["total"], 0.0), 3)
+        logger.info(f"并发合同审查完成，各阶段耗时: {stage_timings}")
+        if errors:
+            logger.warning(f"合同审查部分失败: {errors}")
+        yield "done", {
+            "risk_review_report": self._merge_risk_items(all_items),
+            "stage_timings": stage_timings,
+            "errors": errors
+        }
+
+    def run_full_review(self, contract_text: str, perspective: str, collection_name: str,
+                        mode: str = "auto", progress_callback=None, document: ContractDocument = None) -> dict:
+        """
+        并发执行完整的合同审查流程（见 iter_full_review），等待所有分支完成后一次性返回结果。
+        返回结果中包含各阶段耗时（秒），便于观察并发带来的延迟节省；errors 非空表示结果不完整。
+        """
+        result = {}
+        for event, data in self.iter_full_review(contract_text, perspective, collection_name, mode=mode,
+                                                 progress_callback=progress_callback, document=document):
+            if event == "summary":
+                result["contract_summary"] = data
+            elif event == "parties":
+                result["party_info"] = data
+            elif event == "done":
+                result.update(data)
+        return result
@@ -0,0 +1,220 @@
+# 文件名: app/core/batch.py
+import os
+import json
+import time
+import fcntl
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import BATCH_EXTRACT_WORKERS, BATCH_REVIEW_WORKERS
+from app.utils.pdf import PAGE_BREAK, extract_pages, file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+def collect_contract_paths(inputs: list[str]) -> list[str]:
+    """将文件与目录混合的输入展开为 PDF 路径列表（目录递归查找，按路径排序），保持输入顺序并去重"""
+    paths, seen = [], set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found = sorted(os.path.join(root, name) for root, _, names in os.walk(item)
+                           for name in names if name.lower().endswith(".pdf"))
+        elif os.path.isfile(item):
+            found = [item]
+        else:
+            logger.warning(f"批量审查输入不存在，已跳过: {item}")
+            found = []
+        for path in found:
+            path = os.path.abspath(path)
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def _extract_contract(pdf_path: str):
+    """进程池工作函数：提取整份合同文本，返回 (文本, 耗时秒数)。工作进程内不再嵌套进程池"""
+    start = time.perf_counter()
+    text = PAGE_BREAK.join(extract_pages(pdf_path, workers=1, use_cache=False))
+    return text, time.perf_counter() - start
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_completed(output_path: str) -> set[str]:
+    """读取已有的结果文件，返回已成功审查的合同哈希。末尾写了一半的行（进程中断所致）忽略"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "succeeded":
+                completed.add(record["sha256"])
+    return completed
+
+
+class BatchOutputLocked(RuntimeError):
+    """结果文件正被另一个批量审查任务（可能在其他进程中）写入"""
+
+
+def output_in_use(output_path: str) -> bool:
+    """结果文件是否正被某个批量审查任务持有（见 BatchReviewRunner.run）"""
+    if not os.path.exists(output_path):
+        return False
+    with open(output_path, "a", encoding="utf-8") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return False
+
+
+class BatchReviewRunner:
+    """
+    批量合同审查。
+    PDF 提取在进程池中进行，检索与 LLM 调用在有界线程池中进行，两者流水线重叠：
+    任一合同提取完成即进入审查，同时在途合同数有上限，避免提取远超审查速度时文本堆积在内存中。
+    每份合同审查结束立即向 JSONL 结果文件追加一行；重新运行同一结果文件时跳过已成功的合同（按文件哈希）。
+    审查结果带有 errors（摘要或部分审查窗口失败）的合同记为失败，续跑时会重新审查。
+    """
+    def __init__(self, assistant, collection_name: str, perspective: str, output_path: str, mode: str = "auto",
+                 extract_workers: int = BATCH_EXTRACT_WORKERS, review_workers: int = BATCH_REVIEW_WORKERS,
+                 progress_callback=None):
+        if perspective not in ["甲方", "乙方"]:
+            raise ValueError("立场必须是 '甲方' 或 '乙方'")
+        self.assistant = assistant
+        self.collection_name = collection_name
+        self.perspective = perspective
+        self.output_path = output_path
+        self.mode = mode
+        self.extract_workers = max(1, extract_workers)
+        self.review_workers = max(1, review_workers)
+        self.progress_callback = progress_callback
+
+    def _review(self, text: str) -> dict:
+        start = time.perf_counter()
+        result = self.assistant.run_full_review(text, self.perspective, self.collection_name, mode=self.mode)
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    def run(self, pdf_paths: list[str]) -> dict:
+        """
+        审查给定合同，返回吞吐报告（见 _build_report）。
+        运行期间持有结果文件的排他锁（跨进程有效），同一结果文件已在写入时抛出 BatchOutputLocked
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        with open(self.output_path, "a", encoding="utf-8") as out:
+            try:
+                fcntl.flock(out, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise BatchOutputLocked(f"结果文件 {self.output_path} 正被另一个批量审查任务写入") from None
+            return self._run(pdf_paths, out)
+
+    def _run(self, pdf_paths: list[str], out) -> dict:
+        completed = load_completed(self.output_path)
+        stage_times = {}
+        counts = {"total": len(pdf_paths), "skipped": 0, "succeeded": 0, "failed": 0}
+        start = time.perf_counter()
+        pending = iter(pdf_paths)
+        max_inflight = self.extract_workers + self.review_workers * 2
+        inflight = {}   # future -> ("extract" | "review", 合同路径, 文件哈希)
+        started = set()  # 本次运行已开始处理的合同哈希，同一文件在输入中重复出现时只审查一次
+        logger.info(f"开始批量审查 {len(pdf_paths)} 份合同（提取进程 {self.extract_workers}，审查线程 {self.review_workers}），"
+                    f"结果写入 {self.output_path}，已完成 {len(completed)} 份。")
+
+        def progress(status: str):
+            counts[status] += 1
+            if self.progress_callback:
+                self.progress_callback(counts["succeeded"] + counts["failed"] + counts["skipped"], counts["total"])
+
+        def record(out, path: str, sha256: str, status: str, **fields):
+            out.write(json.dumps({"contract": path, "sha256": sha256, "status": status, **fields,
+                                  "finished_at": time.time()}, ensure_ascii=False) + "\n")
+            out.flush()
+            progress(status)
+
+        extract_pool = ProcessPoolExecutor(max_workers=self.extract_workers,
+                                           mp_context=multiprocessing.get_context("spawn"))
+        review_pool = ThreadPoolExecutor(max_workers=self.review_workers, thread_name_prefix="batch-review")
+        try:
+            while True:
+                while len(inflight) < max_inflight:
+                    path = next(pending, None)
+                    if path is None:
+                        break
+                    # 先按文件哈希判断是否已审查过，续跑时已完成的合同无需重新提取
+                    try:
+                        sha256 = file_sha256(path)
+                    except OSError as e:
+                        record(out, path, None, "failed", error=f"读取文件失败: {str(e)}")
+                        continue
+                    if sha256 in completed or sha256 in started:
+                        logger.info(f"合同已审查过，跳过: {path}")
+                        progress("skipped")
+                        continue
+                    started.add(sha256)
+                    inflight[extract_pool.submit(_extract_contract, path)] = ("extract", path, sha256)
+                if not inflight:
+                    break
+
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path, sha256 = inflight.pop(future)
+                    if kind == "extract":
+                        try:
+                            text, elapsed = future.result()
+                        except Exception as e:
+                            logger.error(f"提取合同 {path} 失败: {e}", exc_info=True)
+                            record(out, path, sha256, "failed", error=f"PDF 提取失败: {str(e)}")
+                            continue
+                        stage_times.setdefault("extract", []).append(elapsed)
+                        if not text:
+                            record(out, path, sha256, "failed", error="无法从PDF中提取文本内容")
+                            continue
+                        inflight[review_pool.submit(self._review, text)] = ("review", path, sha256)
+                    else:
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            logger.error(f"审查合同 {path} 失败: {e}", exc_info=True)
+                            record(out, path, sha256, "failed", error=f"服务器内部错误: {str(e)}")
+                            continue
+                        stage_times.setdefault("review_total", []).append(result.pop("elapsed"))
+                        for stage, seconds in result.get("stage_timings", {}).items():
+                            if stage in ("summarize", "retrieve", "extract_parties", "review"):
+                                stage_times.setdefault(stage, []).append(seconds)
+                        if result.get("errors"):
+                            # 摘要或部分审查窗口的模型调用失败，结果不完整；记为失败，续跑时重新审查
+                            logger.warning(f"合同 {path} 审查结果不完整: {result['errors']}")
+                            record(out, path, sha256, "failed", error="；".join(result["errors"]), **result)
+                            continue
+                        record(out, path, sha256, "succeeded", **result)
+        finally:
+            review_pool.shutdown(wait=True, cancel_futures=True)
+            extract_pool.shutdown(wait=True, cancel_futures=True)
+
+        report = self._build_report(counts, stage_times, time.perf_counter() - start)
+        logger.info(f"批量审查结束: {report}")
+        return report
+
+    def _build_report(self, counts: dict, stage_times: dict, wall_seconds: float) -> dict:
+        """吞吐报告：各状态计数、总耗时、每分钟审查合同数，以及各阶段耗时的 p50/p95（秒）"""
+        reviewed = counts["succeeded"] + counts["failed"]
+        return {
+            **counts,
+            "output_path": self.output_path,
+            "wall_seconds": round(wall_seconds, 2),
+            "contracts_per_minute": round(reviewed / wall_seconds * 60, 2) if wall_seconds > 0 else 0.0,
+            "stages": {stage: {"count": len(values), "p50": round(_percentile(values, 0.5), 3),
+                               "p95": round(_percentile(values, 0.95), 3)}
+                       for stage, values in stage_times.items() if values},
+        }
@@ -0,0 +1,218 @@
+# 文件名: app/core/documents.py
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.services.prompt_budget import strip_boilerplate
+from app.utils.pdf import file_sha256
+from app.utils.helpers import split_contract_clauses
+
+logger = logging.getLogger(__name__)
+
+_DOCUMENT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ContractDocument:
+    """
+    一份已解析的合同。以上传文件内容的 SHA-256 作为 document_id，
+    保存提取的文本、条款切分、合同方以及条款向量，供各接口重复分析同一合同时复用。
+    """
+    def __init__(self, document_id: str, text: str, filename: str = None, parties: dict = None,
+                 clause_embeddings: list = None, created_at: float = None):
+        self.id = document_id
+        self.text = text
+        self.filename = filename
+        self.parties = parties
+        self.clause_embeddings = clause_embeddings
+        self.created_at = created_at or time.time()
+        self._clauses = None
+        self._lock = threading.Lock()
+
+    @property
+    def clauses(self) -> list[str]:
+        """去除页码、签署栏等内容后的条款切分，与条款审查使用的切分一致"""
+        with self._lock:
+            if self._clauses is None:
+                self._clauses = split_contract_clauses(strip_boilerplate(self.text))
+            return self._clauses
+
+    def to_dict(self) -> dict:
+        return {
+            "document_id": self.id,
+            "filename": self.filename,
+            "chars": len(self.text),
+            "clauses": len(self.clauses),
+            "parties": self.parties,
+            "has_clause_embeddings": self.clause_embeddings is not None,
+            "created_at": self.created_at,
+        }
+
+
+class DocumentStore:
+    """
+    按 document_id 缓存已解析合同的 LRU 存储。
+    内存中最多保留 max_entries 份；配置 disk_dir 时同时写入磁盘（<id>.json 保存文本与合同方，<id>.npy 保存条款向量），
+    内存淘汰或进程重启后可从磁盘恢复。磁盘层总大小超过 max_disk_mb 时，每次写入后按最近使用时间淘汰最旧的合同。
+    磁盘读写失败只记录警告，不影响本次请求。
+    """
+    def __init__(self, max_entries: int, disk_dir: str = None, max_disk_mb: int = 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            logger.info(f"合同文档磁盘缓存已启用: {self.disk_dir}")
+
+    @staticmethod
+    def document_id(source) -> str:
+        """上传内容的 SHA-256，source 为字节串或可定位的二进制流"""
+        return file_sha256(source)
+
+    def _remember(self, document: ContractDocument):
+        with self._lock:
+            self._documents[document.id] = document
+            self._documents.move_to_end(document.id)
+            while len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+
+    def _load(self, document_id: str):
+        json_path = os.path.join(self.disk_dir, f"{document_id}.json")
+        if not os.path.exists(json_path):
+            return None
+        try:
+            with open(json_path, encoding="utf-8") as f:
+                data = json.load(f)
+            npy_path = os.path.join(self.disk_dir, f"{document_id}.npy")
+            embeddings = np.load(npy_path).tolist() if os.path.exists(npy_path) else None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取合同文档缓存 {document_id} 失败，将重新解析: {e}")
+            return None
+        try:
+            # 更新修改时间，磁盘层按最近使用时间淘汰
+            os.utime(json_path)
+        except OSError:
+            pass
+        return ContractDocument(document_id, data["text"], data.get("filename"), data.get("parties"),
+                                embeddings, data.get("created_at"))
+
+    def get(self, document_id: str):
+        """按 document_id 获取合同，不存在时返回 None"""
+        if not document_id or not _DOCUMENT_ID_PATTERN.match(document_id):
+            return None
+        with self._lock:
+            document = self._documents.get(document_id)
+            if document is not None:
+                self._documents.move_to_end(document_id)
+        if document is None and self.disk_dir:
+            document = self._load(document_id)
+            if document is not None:
+                self._remember(document)
+        with self._lock:
+            if document is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return document
+
+    def get_or_create(self, source, filename: str, extract_fn):
+        """
+        按上传内容（字节串或可定位的二进制流）获取合同；首次出现时调用 extract_fn(source) 提取文本并保存。
+        返回 (合同或 None, 是否命中缓存)，文本提取失败时合同为 None。
+        """
+        document_id = self.document_id(source)
+        document = self.get(document_id)
+        if document is not None:
+            logger.info(f"合同 {filename} 已解析过（{document_id[:12]}），跳过文本提取。")
+            return document, True
+        text = extract_fn(source)
+        if not text:
+            return None, False
+        document = ContractDocument(document_id, text, filename)
+        self.update(document)
+        return document, False
+
+    def update(self, document: ContractDocument):
+        """保存合同（新增或补充了合同方、条款向量之后调用）"""
+        self._remember(document)
+        if not self.disk_dir:
+            return
+        # 同一合同可能被多个线程或工作进程同时保存，临时文件名需各不相同
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        json_path = os.path.join(self.disk_dir, f"{document.id}.json")
+        try:
+            # 先写条款向量再写 JSON，JSON 的修改时间即该合同最近一次使用的时间
+            if document.clause_embeddings is not None:
+                npy_path = os.path.join(self.disk_dir, f"{document.id}.npy")
+                with open(npy_path + suffix, "wb") as f:
+                    np.save(f, np.asarray(document.clause_embeddings, dtype=np.float32))
+                os.replace(npy_path + suffix, npy_path)
+            with open(json_path + suffix, "w", encoding="utf-8") as f:
+                json.dump({"text": document.text, "filename": document.filename, "parties": document.parties,
+                           "created_at": document.created_at}, f, ensure_ascii=False)
+            os.replace(json_path + suffix, json_path)
+        except OSError as e:
+            logger.warning(f"写入合同文档缓存 {document.id} 失败: {e}")
+            return
+        self._evict_disk(keep=document.id)
+
+    def _evict_disk(self, keep: str):
+        """磁盘层超出容量时按最近使用时间删除最旧的合同（keep 为刚写入的合同，不删除）"""
+        entries = {}  # document_id -> [总字节数, 最近使用时间]
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError as e:
+            logger.warning(f"读取合同文档缓存目录失败: {e}")
+            return
+        for name in names:
+            document_id, ext = os.path.splitext(name)
+            if ext not in (".json", ".npy") or not _DOCUMENT_ID_PATTERN.match(document_id):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entry = entries.setdefault(document_id, [0, 0.0])
+            entry[0] += stat.st_size
+            if ext == ".json":
+                entry[1] = stat.st_mtime
+        total = sum(size for size, _ in entries.values())
+        if total <= self.max_disk_bytes:
+            return
+        evicted = 0
+        for document_id, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_disk_bytes:
+                break
+            if document_id == keep:
+                continue
+            for ext in (".json", ".npy"):
+                try:
+                    os.remove(os.path.join(self.disk_dir, f"{document_id}{ext}"))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"删除合同文档缓存 {document_id}{ext} 失败: {e}")
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"合同文档磁盘缓存超出上限，已淘汰 {evicted} 份最久未使用的合同。")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._documents),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "disk_dir": self.disk_dir,
+                "max_disk_mb": round(self.max_disk_bytes / 1024 / 1024, 1),
+            }
@@ -0,0 +1,192 @@
+# 文件名: app/core/jobs.py
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """一个异步审查任务，记录整体状态、各阶段进度以及最终结果"""
+    def __init__(self, job_type: str, stages: list[str], on_change=None):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.status = "queued"   # queued / running / succeeded / failed
+        self.stages = {name: {"status": "pending", "started_at": None, "finished_at": None} for name in stages}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._on_change = on_change
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        """由 to_dict 的快照恢复任务（用于查询其他工作进程执行的任务）"""
+        job = cls(data["type"], [])
+        job.id = data["job_id"]
+        job.status = data["status"]
+        job.stages = data["stages"]
+        job.result = data["result"]
+        job.error = data["error"]
+        job.created_at = data["created_at"]
+        job.finished_at = data["finished_at"]
+        return job
+
+    def _changed(self):
+        if self._on_change:
+            self._on_change(self)
+
+    def update_stage(self, stage: str, status: str):
+        """更新阶段状态，status 为 running / done / failed"""
+        with self._lock:
+            info = self.stages.setdefault(stage, {"status": "pending", "started_at": None, "finished_at": None})
+            info["status"] = status
+            if status == "running":
+                info["started_at"] = time.time()
+            else:
+                info["finished_at"] = time.time()
+        self._changed()
+
+    def fail_running_stages(self):
+        """任务失败时，将仍处于 running 的阶段标记为 failed，避免查询结果中阶段永远停留在进行中"""
+        with self._lock:
+            now = time.time()
+            for info in self.stages.values():
+                if info["status"] == "running":
+                    info["status"] = "failed"
+                    info["finished_at"] = now
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            done = sum(1 for s in self.stages.values() if s["status"] == "done")
+            progress = 1.0 if self.status == "succeeded" else (round(done / len(self.stages), 2) if self.stages else 0.0)
+            return {
+                "job_id": self.id,
+                "type": self.type,
+                "status": self.status,
+                "progress": progress,
+                "stages": {name: dict(info) for name, info in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobManager:
+    """
+    基于线程池的任务管理器。
+    提交任务后立即返回任务对象，由工作线程执行审查流程；已结束的任务在 ttl_seconds 后被清理。
+    配置 state_dir 时，任务状态变化会写入 <state_dir>/<job_id>.json，
+    多进程部署下请求落到其他工作进程时也能查询到任务进度与结果。
+    """
+    def __init__(self, max_workers: int, ttl_seconds: int, state_dir: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.state_dir = state_dir or None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="review-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+
+    def submit(self, job_type: str, stages: list[str], func, *args, **kwargs) -> Job:
+        """
+        提交任务。func 的第一个参数为 Job 对象，可通过 job.update_stage 汇报进度；
+        func 的返回值作为任务结果，返回包含 'error' 键的字典或抛出异常均视为失败。
+        """
+        self._cleanup()
+        job = Job(job_type, stages, on_change=self._persist)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._persist(job)
+        self._executor.submit(self._run, job, func, *args, **kwargs)
+        logger.info(f"已提交 {job_type} 任务: {job.id}")
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir:
+            job = self._load(job_id)
+        return job
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _persist(self, job: Job):
+        if not self.state_dir:
+            return
+        path = self._state_path(job.id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"保存任务 {job.id} 状态失败: {e}")
+
+    def _load(self, job_id: str):
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding="utf-8") as f:
+                return Job.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取任务 {job_id} 状态失败: {e}")
+            return None
+
+    def shutdown(self, wait: bool = True):
+        """停止接收新任务；wait 为 True 时等待已提交的任务全部执行完毕"""
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+        if pending:
+            logger.info(f"等待 {pending} 个未完成的任务结束...")
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, func, *args, **kwargs):
+        job.status = "running"
+        job._changed()
+        try:
+            result = func(job, *args, **kwargs)
+            if isinstance(result, dict) and "error" in result:
+                job.error = result["error"]
+                job.fail_running_stages()
+                job.status = "failed"
+            else:
+                job.result = result
+                job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"任务 {job.id} 执行失败: {e}", exc_info=True)
+            job.error = f"服务器内部错误: {str(e)}"
+            job.fail_running_stages()
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job._changed()
+            logger.info(f"任务 {job.id} 结束，状态: {job.status}")
+
+    def _cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and now - job.finished_at > self.ttl_seconds]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if not self.state_dir:
+            return
+        # 状态文件由各工作进程共享，按修改时间清理（也覆盖了其他进程或上次运行留下的文件）
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if name.endswith(".json") and now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+            except OSError:
+                pass
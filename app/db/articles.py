@@ -0,0 +1,105 @@
+# 文件名: app/db/articles.py
+import os
+import json
+import logging
+import threading
+from app.utils.helpers import file_signature
+
+logger = logging.getLogger(__name__)
+
+_ARTICLES_FILE = "articles.json"
+
+
+class ArticleIndex:
+    """
+    单个集合的条号 -> 条文索引，用于按“第X条”直接取回原文而无需向量检索。
+    同一集合可能包含多部法律，因此每个条号下按来源文档分别保存；超长条文被切成多块时按顺序拼接。
+    signature 为本对象最后一次读写时 articles.json 的签名，用于发现其他进程的修改。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._articles = {}    # 条号 -> {来源: {"chapter": 章节, "parts": [文本块, ...]}}
+        self._lock = threading.Lock()
+        file_path = os.path.join(path, _ARTICLES_FILE)
+        self.signature = file_signature(file_path)
+        if os.path.exists(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                self._articles = {int(no): sources for no, sources in json.load(f).items()}
+
+    def __len__(self):
+        return len(self._articles)
+
+    def add(self, source: str, items):
+        """加入一批 (文本, 条号, 章节)，条号为 0 的文本块不属于任何条文，忽略"""
+        with self._lock:
+            for text, article_no, chapter in items:
+                if not article_no:
+                    continue
+                entry = self._articles.setdefault(article_no, {}).setdefault(source, {"chapter": chapter, "parts": []})
+                entry["parts"].append(text)
+
+    def lookup(self, article_no: int) -> list[dict]:
+        with self._lock:
+            sources = self._articles.get(article_no, {})
+            return [{"article_no": article_no, "source": source, "chapter": entry["chapter"],
+                     "text": "".join(entry["parts"])} for source, entry in sources.items()]
+
+    def remove_source(self, source: str) -> int:
+        with self._lock:
+            removed = 0
+            for article_no in list(self._articles):
+                if self._articles[article_no].pop(source, None) is not None:
+                    removed += 1
+                if not self._articles[article_no]:
+                    del self._articles[article_no]
+        self.flush()
+        return removed
+
+    def flush(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            file_path = os.path.join(self.path, _ARTICLES_FILE)
+            tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._articles, f, ensure_ascii=False)
+            os.replace(tmp_path, file_path)
+            self.signature = file_signature(file_path)
+
+
+class ArticleIndexStore:
+    """
+    按集合名管理条号索引，与 BM25 索引存放在同一目录（root_dir/<集合名>/articles.json）。
+    每次获取时核对 articles.json 的签名，其他进程重建、删除来源或删除集合后重新加载。
+    """
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, collection_name)
+
+    def _file(self, collection_name: str) -> str:
+        return os.path.join(self._path(collection_name), _ARTICLES_FILE)
+
+    def get(self, collection_name: str, create: bool = False):
+        """获取集合的条号索引；不存在且 create 为 False 时返回 None"""
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is not None and index.signature != file_signature(self._file(collection_name)):
+                logger.info(f"集合 '{collection_name}' 的条号索引已被其他进程更新，重新加载。")
+                del self._indexes[collection_name]
+                index = None
+            if index is None:
+                if not create and not os.path.exists(self._file(collection_name)):
+                    return None
+                index = ArticleIndex(self._path(collection_name))
+                self._indexes[collection_name] = index
+            return index
+
+    def drop(self, collection_name: str):
+        with self._lock:
+            self._indexes.pop(collection_name, None)
+            file_path = self._file(collection_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
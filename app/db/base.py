@@ -0,0 +1,186 @@
+# 文件名: app/db/base.py
+import os
+import time
+import logging
+import importlib
+from config import (
+    VECTOR_BACKEND, CLAUSE_RETRIEVAL_TOP_K, RETRIEVAL_MAX_CONTEXT_DOCS,
+    HYBRID_RETRIEVAL_ENABLED, HYBRID_CANDIDATE_K, HYBRID_RRF_K, KB_INDEX_DIR
+)
+from app.db.lexical import LexicalIndexStore, reciprocal_rank_fusion
+from app.db.articles import ArticleIndexStore
+from app.utils.helpers import split_contract_clauses
+
+logger = logging.getLogger(__name__)
+
+BUILD_MODES = ["rebuild", "append"]
+
+
+class KnowledgeBaseBackend:
+    """
+    知识库存储后端接口。
+    各后端需保证相同的语义：集合按名称隔离；build_and_store 返回插入条数；
+    vector_retrieve_by_clauses 返回的 distance 越小越相似；管理类操作返回 (是否成功, 消息/数据)。
+    各后端共用按集合存放的 BM25 索引（self.lexical）与条号索引（self.articles），
+    写入、删除文本块时通过 _prepare_indexes / _index_rows / _flush_indexes 等方法同步更新。
+    """
+    name = "base"
+
+    def __init__(self):
+        self.index_dir = os.path.join(KB_INDEX_DIR, self.name)
+        self.lexical = LexicalIndexStore(self.index_dir)
+        self.articles = ArticleIndexStore(self.index_dir)
+
+    def has_collection(self, collection_name: str) -> bool:
+        raise NotImplementedError
+
+    def build_and_store(self, pdf_source, collection_name: str, mode: str = "rebuild", source_name: str = None,
+                        index_type: str = None, metric_type: str = None, index_params: dict = None) -> int:
+        """pdf_source 为文件路径或可定位的二进制流（如上传文件的内存缓冲）；为流时应提供 source_name"""
+        raise NotImplementedError
+
+    def remove_source(self, collection_name: str, source_name: str):
+        raise NotImplementedError
+
+    def vector_retrieve_by_clauses(self, clauses: list[str], collection_name: str, k: int = CLAUSE_RETRIEVAL_TOP_K,
+                                   clause_embeddings: list = None) -> dict[int, list[dict]]:
+        """
+        为每个条款做向量检索，返回 {条款序号: [{"text": 法条文本, "distance": 距离}, ...]}。
+        clause_embeddings 为与 clauses 对齐的预先生成的向量，提供时不再重新生成。
+        """
+        raise NotImplementedError
+
+    def retrieve_by_clauses(self, clauses: list[str], collection_name: str, k: int = CLAUSE_RETRIEVAL_TOP_K,
+                            clause_embeddings: list = None) -> dict[int, list[dict]]:
+        """
+        为每个条款检索相关法条。
+        集合有 BM25 索引时，向量与词法两路各召回 HYBRID_CANDIDATE_K 个候选，按倒数排名融合后取前 k 个；
+        融合结果的 distance 为 RRF 得分的相反数，仍满足越小越相关。
+        """
+        lexical_index = self.lexical.get(collection_name) if HYBRID_RETRIEVAL_ENABLED else None
+        if lexical_index is None or not len(lexical_index):
+            return self.vector_retrieve_by_clauses(clauses, collection_name, k=k, clause_embeddings=clause_embeddings)
+
+        candidate_k = max(k, HYBRID_CANDIDATE_K)
+        vector_contexts = self.vector_retrieve_by_clauses(clauses, collection_name, k=candidate_k,
+                                                          clause_embeddings=clause_embeddings)
+        start = time.perf_counter()
+        clause_contexts = {}
+        for idx, clause in enumerate(clauses):
+            vector_ranked = [doc["text"] for doc in vector_contexts.get(idx, [])]
+            lexical_ranked = [doc["text"] for doc in lexical_index.search(clause, candidate_k)]
+            fused = reciprocal_rank_fusion([vector_ranked, lexical_ranked], HYBRID_RRF_K)[:k]
+            if fused:
+                clause_contexts[idx] = [{"text": text, "distance": -score} for text, score in fused]
+        logger.info(f"BM25 检索与融合 {len(clauses)} 个条款耗时 {(time.perf_counter() - start) * 1000:.1f} 毫秒。")
+        return clause_contexts
+
+    def _prepare_indexes(self, collection_name: str, mode: str, existing_count: int):
+        """
+        构建前准备集合的 BM25 索引与条号索引，返回 (BM25 索引或 None, 条号索引)。
+        重建时清空两者；向已有数据但没有 BM25 索引的旧集合追加时不建 BM25 索引，以免词法检索只覆盖部分文本块。
+        """
+        if mode == "rebuild":
+            self._drop_indexes(collection_name)
+        article_index = self.articles.get(collection_name, create=True)
+        if mode == "append" and existing_count and not self.lexical.exists(collection_name):
+            logger.warning(f"集合 '{collection_name}' 尚无 BM25 索引，本次追加仅写入向量；重建后即可启用混合检索。")
+            return None, article_index
+        return self.lexical.get(collection_name, create=True), article_index
+
+    @staticmethod
+    def _index_rows(lexical_index, article_index, rows, source_name: str):
+        """将一批已写入的 (向量, 文本, 内容哈希, 页码, 结构字段) 行同步到 BM25 与条号索引"""
+        if lexical_index is not None:
+            lexical_index.add([row[1] for row in rows], source_name)
+        article_index.add(source_name, [(row[1], row[4]["article_no"], row[4]["chapter"]) for row in rows])
+
+    @staticmethod
+    def _flush_indexes(lexical_index, article_index):
+        if lexical_index is not None:
+            lexical_index.flush()
+        article_index.flush()
+
+    def _remove_source_from_indexes(self, collection_name: str, source_name: str):
+        lexical_index = self.lexical.get(collection_name)
+        if lexical_index is not None:
+            lexical_index.remove_source(source_name)
+        article_index = self.articles.get(collection_name)
+        if article_index is not None:
+            article_index.remove_source(source_name)
+
+    def _drop_indexes(self, collection_name: str):
+        self.articles.drop(collection_name)
+        self.lexical.drop(collection_name)
+
+    def lookup_articles(self, collection_name: str, article_nos: list[int]) -> dict[int, list[dict]]:
+        """
+        按条号直接取回条文原文，返回 {条号: [{"article_no", "source", "chapter", "text"}, ...]}。
+        集合没有条号索引（旧集合或按字符切块构建）时返回空字典。
+        """
+        article_index = self.articles.get(collection_name)
+        if article_index is None:
+            return {}
+        found = {}
+        for article_no in article_nos:
+            hits = article_index.lookup(article_no)
+            if hits:
+                found[article_no] = hits
+        return found
+
+    def is_ready(self, collection_name: str) -> bool:
+        raise NotImplementedError
+
+    def delete_collection(self, collection_name: str):
+        raise NotImplementedError
+
+    def list_all_collections(self):
+        raise NotImplementedError
+
+    def index_info(self, collection_name: str) -> dict:
+        """集合当前使用的索引参数"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """后端运行状态，用于 /cache_stats"""
+        return {"backend": self.name, "lexical_indexes": self.lexical.stats()}
+
+    @staticmethod
+    def merge_clause_contexts(clause_contexts: dict[int, list[dict]],
+                              max_docs: int = RETRIEVAL_MAX_CONTEXT_DOCS) -> list[str]:
+        """对各条款的检索结果去重合并，按最佳距离排序并截取前 max_docs 条"""
+        best = {}
+        for docs in clause_contexts.values():
+            for doc in docs:
+                text = doc["text"]
+                if text not in best or doc["distance"] < best[text]:
+                    best[text] = doc["distance"]
+        return sorted(best, key=best.get)[:max_docs]
+
+    def retrieve(self, query: str, collection_name: str, k: int = CLAUSE_RETRIEVAL_TOP_K) -> str:
+        if not self.has_collection(collection_name):
+            return f"知识库 '{collection_name}' 不存在。"
+
+        clauses = split_contract_clauses(query)
+        clause_contexts = self.retrieve_by_clauses(clauses, collection_name, k=k)
+        if not clause_contexts:
+            return "无法为查询生成向量。"
+        retrieved_docs = self.merge_clause_contexts(clause_contexts)
+        context = "\n---\n".join(retrieved_docs)
+        logger.info(f"成功从集合 '{collection_name}' 检索到 {len(retrieved_docs)} 条相关信息（共 {len(clauses)} 个条款）。")
+        return context
+
+
+# 后端名 -> (模块, 类名)，按需导入，未使用的后端不会引入其依赖
+BACKENDS = {
+    "milvus": ("app.db.milvus_kb", "MilvusKnowledgeBase"),
+    "local": ("app.db.local_kb", "LocalKnowledgeBase"),
+}
+
+
+def create_knowledge_base(backend: str = None) -> KnowledgeBaseBackend:
+    backend = backend or VECTOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的向量存储后端: {backend}，可选: {list(BACKENDS)}")
+    module_name, class_name = BACKENDS[backend]
+    return getattr(importlib.import_module(module_name), class_name)()
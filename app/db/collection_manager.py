@@ -0,0 +1,191 @@
+# 文件名: app/db/collection_manager.py
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from pymilvus import Collection, utility
+from config import EMBEDDING_DIM
+from app.db.index_config import normalize_index_params
+from app.utils.helpers import log_time, file_signature
+
+logger = logging.getLogger(__name__)
+
+# 估算每条记录占用的内存：向量（float32）加上文本字段的大致开销
+_ESTIMATED_TEXT_BYTES = 3 * 1000
+# 尚未核对过变更标记的集合
+_UNSEEN = object()
+
+
+class CollectionManager:
+    """
+    缓存 Collection 句柄，并让常用集合常驻 Milvus 查询节点内存。
+    已加载集合的估算内存超出预算时，按最近最少使用（LRU）顺序释放未被固定、且当前没有查询在使用的集合。
+    配置 state_dir 时，每个集合在其中有一个变更标记文件：本进程重建、删除集合或重建索引时更新标记，
+    获取句柄时发现标记被其他进程更新过，则丢弃本进程缓存的句柄、加载状态与索引参数。
+    """
+    def __init__(self, memory_budget_mb: int, pinned: list[str] = None, state_dir: str = None):
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.pinned = set(pinned or [])
+        self.state_dir = state_dir or None
+        self._generations = {}         # 集合名 -> 最近一次看到的变更标记签名
+        self._handles = {}
+        self._loaded = OrderedDict()   # 集合名 -> 估算内存（字节），按最近使用排序
+        self._in_use = {}              # 集合名 -> 正在使用的查询数
+        self._index_params = {}        # 集合名 -> 向量索引参数（从 Milvus 读取）
+        self._loading = {}             # 集合名 -> 加载完成事件，正在由某个线程加载的集合
+        self._lock = threading.RLock()
+
+    def _marker_path(self, collection_name: str) -> str:
+        return os.path.join(self.state_dir, collection_name)
+
+    def _forget(self, collection_name: str):
+        self._handles.pop(collection_name, None)
+        self._loaded.pop(collection_name, None)
+        self._index_params.pop(collection_name, None)
+
+    def _check_generation(self, collection_name: str):
+        """其他进程更新过该集合的变更标记时，丢弃本进程的缓存状态（调用方持有 _lock）"""
+        if not self.state_dir:
+            return
+        current = file_signature(self._marker_path(collection_name))
+        seen = self._generations.get(collection_name, _UNSEEN)
+        if seen is not _UNSEEN and seen != current:
+            logger.info(f"集合 '{collection_name}' 已被其他进程重建或删除，丢弃缓存的句柄。")
+            self._forget(collection_name)
+        self._generations[collection_name] = current
+
+    def _bump_generation(self, collection_name: str):
+        """替换变更标记文件（新的 inode 与修改时间），返回新的签名"""
+        path = self._marker_path(collection_name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"{time.time()}\n")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"更新集合 '{collection_name}' 的变更标记失败: {e}")
+        return file_signature(path)
+
+    def get(self, collection_name: str) -> Collection:
+        """获取（缓存的）集合句柄，不触发加载"""
+        with self._lock:
+            self._check_generation(collection_name)
+            handle = self._handles.get(collection_name)
+            if handle is None:
+                handle = Collection(collection_name)
+                self._handles[collection_name] = handle
+            return handle
+
+    def index_params(self, collection_name: str) -> dict:
+        """读取集合向量字段上实际创建的索引参数，检索时据此生成匹配的检索参数"""
+        with self._lock:
+            self._check_generation(collection_name)
+            cached = self._index_params.get(collection_name)
+            if cached is not None:
+                return cached
+            collection = self.get(collection_name)
+            indexes = [index for index in collection.indexes if index.field_name == "embedding"]
+            params = normalize_index_params(indexes[0].params if indexes else {})
+            self._index_params[collection_name] = params
+            return params
+
+    @staticmethod
+    def estimate_memory(collection: Collection) -> int:
+        return collection.num_entities * (EMBEDDING_DIM * 4 + _ESTIMATED_TEXT_BYTES)
+
+    def _ensure_loaded(self, collection_name: str) -> Collection:
+        """
+        确保集合已加载。加载可能耗时数秒到数分钟，在管理器锁之外进行，不阻塞其他集合的查询；
+        同一集合同时只由一个线程加载，其余线程等待该次加载结束后重新检查。
+        """
+        while True:
+            with self._lock:
+                collection = self.get(collection_name)
+                if collection_name in self._loaded:
+                    self._loaded.move_to_end(collection_name)
+                    return collection
+                loading = self._loading.get(collection_name)
+                if loading is None:
+                    loading = self._loading[collection_name] = threading.Event()
+                    break
+            loading.wait()
+        try:
+            logger.info(f"正在加载集合 '{collection_name}' 到内存...")
+            start_time = time.time()
+            collection.load()
+            log_time(start_time, f"加载集合 '{collection_name}'", metric="collection_load_seconds")
+            memory = self.estimate_memory(collection)
+            with self._lock:
+                # 加载期间集合可能已被重建或删除，此时不记录为已加载，由后续查询重新加载
+                if self._handles.get(collection_name) is collection:
+                    self._loaded[collection_name] = memory
+                    self._evict()
+        finally:
+            with self._lock:
+                del self._loading[collection_name]
+            loading.set()
+        return collection
+
+    def _evict(self):
+        total = sum(self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget_bytes:
+                break
+            if name in self.pinned or self._in_use.get(name) or name == next(reversed(self._loaded)):
+                continue
+            try:
+                self._handles[name].release()
+                logger.info(f"已加载集合超出内存预算，释放最久未使用的集合 '{name}'。")
+            except Exception as e:
+                logger.warning(f"释放集合 '{name}' 失败: {e}")
+            total -= self._loaded.pop(name)
+
+    @contextmanager
+    def use(self, collection_name: str):
+        """获取一个已加载的集合用于查询；从开始加载到使用结束，该集合都不会被淘汰"""
+        with self._lock:
+            self._in_use[collection_name] = self._in_use.get(collection_name, 0) + 1
+        try:
+            yield self._ensure_loaded(collection_name)
+        finally:
+            with self._lock:
+                self._in_use[collection_name] -= 1
+                if not self._in_use[collection_name]:
+                    del self._in_use[collection_name]
+                    # 使用期间被跳过的淘汰在此补做
+                    self._evict()
+
+    def invalidate(self, collection_name: str, notify: bool = True):
+        """
+        集合被删除、重建或重建索引时，丢弃缓存的句柄与加载状态。
+        notify 为 True 时同时更新变更标记，其他工作进程下次使用该集合时也会丢弃各自的缓存。
+        """
+        with self._lock:
+            self._forget(collection_name)
+            if notify and self.state_dir:
+                self._generations[collection_name] = self._bump_generation(collection_name)
+
+    def preload_pinned(self):
+        """启动时预加载固定集合"""
+        for name in self.pinned:
+            try:
+                if utility.has_collection(name):
+                    self._ensure_loaded(name)
+                    logger.info(f"固定集合 '{name}' 已预加载。")
+                else:
+                    logger.warning(f"固定集合 '{name}' 不存在，跳过预加载。")
+            except Exception as e:
+                logger.warning(f"预加载集合 '{name}' 失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "indexes": {name: params["index_type"] for name, params in self._index_params.items()},
+                "pinned": sorted(self.pinned),
+                "estimated_memory_mb": round(sum(self._loaded.values()) / 1024 / 1024, 1),
+                "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 1),
+            }
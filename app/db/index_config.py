@@ -0,0 +1,105 @@
+# 文件名: app/db/index_config.py
+import json
+import math
+import logging
+from config import MILVUS_INDEX_TYPE, MILVUS_METRIC_TYPE, MILVUS_SEARCH_EF, MILVUS_SEARCH_NPROBE
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ["FLAT", "HNSW", "IVF_FLAT", "IVF_SQ8", "IVF_PQ"]
+METRIC_TYPES = ["L2", "IP", "COSINE"]
+
+# 按文本块数量自动选择索引类型的阈值
+_FLAT_MAX_ENTITIES = 2_000        # 数据量很小时暴力检索已足够快且召回率为 100%
+_HNSW_MAX_ENTITIES = 200_000      # 中等规模优先 HNSW，延迟低、召回率高
+_IVF_FLAT_MAX_ENTITIES = 2_000_000
+
+
+def _nlist_for(num_entities: int) -> int:
+    """IVF 聚类中心数量取 4·√N，限制在 [16, 65536]"""
+    return max(16, min(65536, int(4 * math.sqrt(max(num_entities, 1)))))
+
+
+def _pq_m_for(dim: int) -> int:
+    """IVF_PQ 子空间数量必须整除向量维度，优先让每个子空间约 16 维"""
+    for m in (dim // 16, 64, 48, 32, 24, 16, 8, 4, 2):
+        if m and dim % m == 0:
+            return m
+    return 1
+
+
+def choose_index_params(num_entities: int, dim: int, index_type: str = None, metric_type: str = None,
+                        params: dict = None) -> dict:
+    """
+    生成向量索引参数。
+    index_type 为空或 "AUTO" 时按文本块数量自动选择；params 中的值会覆盖自动生成的构建参数。
+    """
+    index_type = (index_type or MILVUS_INDEX_TYPE or "AUTO").upper()
+    metric_type = (metric_type or MILVUS_METRIC_TYPE).upper()
+    if metric_type not in METRIC_TYPES:
+        raise ValueError(f"未知的距离度量: {metric_type}，可选: {METRIC_TYPES}")
+    if index_type == "AUTO":
+        if num_entities <= _FLAT_MAX_ENTITIES:
+            index_type = "FLAT"
+        elif num_entities <= _HNSW_MAX_ENTITIES:
+            index_type = "HNSW"
+        elif num_entities <= _IVF_FLAT_MAX_ENTITIES:
+            index_type = "IVF_FLAT"
+        else:
+            index_type = "IVF_SQ8"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"未知的索引类型: {index_type}，可选: {['AUTO'] + INDEX_TYPES}")
+
+    if index_type == "HNSW":
+        build_params = {"M": 16 if num_entities < 50_000 else 32, "efConstruction": 200}
+    elif index_type in ("IVF_FLAT", "IVF_SQ8"):
+        build_params = {"nlist": _nlist_for(num_entities)}
+    elif index_type == "IVF_PQ":
+        build_params = {"nlist": _nlist_for(num_entities), "m": _pq_m_for(dim), "nbits": 8}
+    else:
+        build_params = {}
+    build_params.update(params or {})
+    return {"index_type": index_type, "metric_type": metric_type, "params": build_params}
+
+
+def normalize_index_params(raw: dict) -> dict:
+    """
+    将 Milvus 返回的索引描述统一为 {"index_type", "metric_type", "params"} 结构。
+    不同版本的服务端可能返回嵌套结构，也可能把构建参数平铺或以 JSON 字符串形式返回。
+    """
+    raw = dict(raw or {})
+    build_params = raw.pop("params", {})
+    if isinstance(build_params, str):
+        build_params = json.loads(build_params or "{}")
+    index_type = str(raw.pop("index_type", "FLAT")).upper()
+    metric_type = str(raw.pop("metric_type", "L2")).upper()
+    build_params = {**{k: v for k, v in raw.items() if k not in ("index_name", "field_name")}, **build_params}
+    for key, value in list(build_params.items()):
+        if isinstance(value, str) and value.isdigit():
+            build_params[key] = int(value)
+    return {"index_type": index_type, "metric_type": metric_type, "params": build_params}
+
+
+def search_params_for(index_params: dict, k: int) -> dict:
+    """根据集合实际使用的索引参数生成与之匹配的检索参数"""
+    index_type = index_params["index_type"]
+    build_params = index_params.get("params", {})
+    if index_type == "HNSW":
+        # ef 必须不小于 top-k
+        search = {"ef": max(MILVUS_SEARCH_EF or 64, k)}
+    elif index_type.startswith("IVF"):
+        nlist = int(build_params.get("nlist", 128))
+        nprobe = MILVUS_SEARCH_NPROBE or max(10, nlist // 16)
+        search = {"nprobe": min(nprobe, nlist)}
+    else:
+        search = {}
+    return {"metric_type": index_params["metric_type"], "params": search}
+
+
+def to_distance(metric_type: str, value: float) -> float:
+    """将检索得分统一为"越小越相似"的距离，便于跨度量排序合并"""
+    if metric_type == "COSINE":
+        return 1.0 - value
+    if metric_type == "IP":
+        return -value
+    return value
@@ -0,0 +1,256 @@
+# 文件名: app/db/ingestion.py
+import re
+import queue
+import logging
+import threading
+from config import (
+    INGEST_CHUNK_SIZE, INGEST_CHUNK_OVERLAP, INGEST_BATCH_CHUNKS, INGEST_QUEUE_SIZE, INGEST_CHUNKER
+)
+from app.services.cache import text_sha256
+from app.utils.helpers import parse_chinese_number, split_long_segment
+
+logger = logging.getLogger(__name__)
+
+# 队列中的结束标记
+_END = object()
+
+# 行首的法律结构标题：第X编 / 第X分编 / 第X章 / 第X节 / 第X条，标题序号后须为空白或行尾
+LEGAL_HEADING_PATTERN = re.compile(r"^[ \t\u3000]*第([一二三四五六七八九十百千零〇两\d]{1,8})(分编|编|章|节|条)(?=[\s\u3000]|$)")
+# 编/章/节 标题行的最大长度，更长的行视为正文中恰好出现在行首的引用
+_MAX_HEADING_LINE_CHARS = 40
+_HEADING_LEVELS = ["编", "分编", "章", "节"]
+
+
+def iter_chunks(pages, chunk_size: int = INGEST_CHUNK_SIZE, chunk_overlap: int = INGEST_CHUNK_OVERLAP):
+    """
+    增量切块：逐页累积文本，缓冲区足够长时切分并产出 (文本块, 页码)，只保留最后一个可能不完整的块继续累积。
+    内存占用只与缓冲区大小有关，与文档总长度无关。
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter  # 导入较慢，只在构建知识库时加载
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    flush_threshold = chunk_size * 4
+    buffer = ""
+    page_marks = []   # (页在缓冲区中的起始位置, 页码)，按位置升序
+
+    def page_of(offset: int) -> int:
+        page_no = page_marks[0][1]
+        for start, no in page_marks:
+            if start > offset:
+                break
+            page_no = no
+        return page_no
+
+    def split_buffer(final: bool):
+        nonlocal buffer, page_marks
+        documents = text_splitter.create_documents([buffer])
+        if not final and len(documents) > 1:
+            documents, carry = documents[:-1], documents[-1]
+        else:
+            carry = None
+        chunks = [(doc.page_content, page_of(doc.metadata["start_index"])) for doc in documents]
+        if carry is None:
+            buffer, page_marks = "", []
+        else:
+            cut = carry.metadata["start_index"]
+            buffer = buffer[cut:]
+            kept = [(start - cut, no) for start, no in page_marks if start > cut]
+            page_marks = [(0, page_of(cut))] + kept
+        return chunks
+
+    for page_no, page_text in pages:
+        if not page_text:
+            continue
+        page_marks.append((len(buffer), page_no))
+        buffer += page_text
+        if len(buffer) >= flush_threshold:
+            yield from split_buffer(final=False)
+    if buffer.strip():
+        yield from split_buffer(final=True)
+
+
+def iter_article_chunks(pages, chunk_size: int = INGEST_CHUNK_SIZE, chunk_overlap: int = INGEST_CHUNK_OVERLAP):
+    """
+    按法律结构增量切块：以“第X条”为边界，每条一个文本块（超长条文按句子再切分），
+    并产出 (文本块, 起始页码, {"article_no": 条号, "chapter": "第X编 … / 第X章 … / 第X节 …"})。
+    编/章/节标题只用于更新所属章节，不计入文本块。条号须递增（或从 1 重新开始），
+    以免把正文中换行后恰好位于行首的“第X条”误判为标题。
+    不属于任何条文的文本（如序言、无条文结构的文档）按字符切块，article_no 为 0。
+    """
+    headings = dict.fromkeys(_HEADING_LEVELS, "")
+    article_no, article_page, article_lines = 0, None, []
+    loose_pages = []   # 不属于任何条文的 (页码, 文本)
+    loose_len = 0
+
+    def chapter() -> str:
+        return " / ".join(headings[level] for level in _HEADING_LEVELS if headings[level])
+
+    def flush_article():
+        nonlocal article_lines
+        text = "\n".join(article_lines).strip()
+        article_lines = []
+        if not text:
+            return
+        fields = {"article_no": article_no, "chapter": chapter()}
+        for piece in (split_long_segment(text, chunk_size) if len(text) > chunk_size else [text]):
+            yield piece, article_page, fields
+
+    def flush_loose():
+        nonlocal loose_pages, loose_len
+        if loose_len:
+            for chunk, page_no in iter_chunks(loose_pages, chunk_size, chunk_overlap):
+                yield chunk, page_no, {"article_no": 0, "chapter": chapter()}
+        loose_pages, loose_len = [], 0
+
+    for page_no, page_text in pages:
+        if not page_text:
+            continue
+        for line in page_text.splitlines():
+            match = LEGAL_HEADING_PATTERN.match(line)
+            number = parse_chinese_number(match.group(1)) if match else None
+            if number is not None and match.group(2) == "条" and (number > article_no or number == 1):
+                yield from flush_article()
+                yield from flush_loose()
+                article_no, article_page = number, page_no
+                article_lines.append(line.strip())
+            elif number is not None and match.group(2) != "条" and len(line.strip()) <= _MAX_HEADING_LINE_CHARS:
+                yield from flush_article()
+                yield from flush_loose()
+                level = match.group(2)
+                headings[level] = line.strip()
+                for lower in _HEADING_LEVELS[_HEADING_LEVELS.index(level) + 1:]:
+                    headings[lower] = ""
+                # 章节标题之后、下一条之前的文本不属于上一条
+                article_lines = []
+            elif article_lines:
+                article_lines.append(line)
+            else:
+                loose_pages.append((page_no, line + "\n"))
+                loose_len += len(line) + 1
+                if loose_len >= chunk_size * 4:
+                    yield from flush_loose()
+    yield from flush_article()
+    yield from flush_loose()
+
+
+CHUNKERS = {
+    "article": iter_article_chunks,
+    "char": iter_chunks,
+}
+
+
+def _stage(worker, inbox: queue.Queue, outbox: queue.Queue, errors: list):
+    """流水线的一个阶段：从 inbox 取数据处理后放入 outbox，遇到结束标记时向下游传递"""
+    try:
+        while True:
+            item = inbox.get()
+            if item is _END:
+                break
+            outbox.put(worker(item))
+    except Exception as e:
+        logger.error(f"知识库导入流水线阶段异常: {e}", exc_info=True)
+        errors.append(e)
+        # 排空上游，避免上游阻塞在已满的队列上
+        while inbox.get() is not _END:
+            pass
+    finally:
+        outbox.put(_END)
+
+
+def run_ingestion_pipeline(pages, embed_fn, insert_fn, existing_hashes_fn=None,
+                           batch_chunks: int = INGEST_BATCH_CHUNKS, queue_size: int = INGEST_QUEUE_SIZE,
+                           chunker: str = INGEST_CHUNKER) -> dict:
+    """
+    流式导入流水线：页面流 → 切块与去重 → 批量生成向量 → 批量插入。
+    各阶段在独立线程中运行，之间用有界队列连接，使 PDF 解析、向量接口调用和数据库写入相互重叠，
+    且任意时刻在内存中的批次数量有上限。
+
+    :param pages: 产出 (页码, 文本) 的可迭代对象
+    :param embed_fn: 文本列表 -> 等长向量列表（失败位置为 None）
+    :param insert_fn: 接收 [(向量, 文本, 内容哈希, 页码, 结构字段), ...]，返回实际插入条数；
+                      结构字段为 {"article_no": 条号, "chapter": 所属章节}，字符切块时为 0 和空串
+    :param existing_hashes_fn: 可选，接收内容哈希列表，返回其中已存在于知识库的哈希集合
+    :param chunker: 切块方式，"article" 按法条结构切块，"char" 按字符长度切块
+    :return: {"inserted": 插入数, "skipped": 重复跳过数, "failed": 向量生成失败数, "chunks": 总块数}
+    """
+    if chunker not in CHUNKERS:
+        raise ValueError(f"未知的切块方式: {chunker}，可选: {list(CHUNKERS)}")
+    stats = {"inserted": 0, "skipped": 0, "failed": 0, "chunks": 0}
+    errors = []
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    embedded_queue = queue.Queue(maxsize=queue_size)
+
+    def produce_batches():
+        seen = set()
+        batch = []
+
+        def emit(batch):
+            if existing_hashes_fn:
+                existing = existing_hashes_fn([item[1] for item in batch])
+                stats["skipped"] += sum(1 for item in batch if item[1] in existing)
+                batch = [item for item in batch if item[1] not in existing]
+            if batch:
+                chunk_queue.put(batch)
+
+        try:
+            for chunk, page_no, *extra in CHUNKERS[chunker](pages):
+                if errors:
+                    # 下游已失败，停止继续解析和请求向量接口
+                    break
+                stats["chunks"] += 1
+                content_hash = text_sha256(chunk)
+                if content_hash in seen:
+                    stats["skipped"] += 1
+                    continue
+                seen.add(content_hash)
+                fields = extra[0] if extra else {"article_no": 0, "chapter": ""}
+                batch.append((chunk, content_hash, page_no, fields))
+                if len(batch) >= batch_chunks:
+                    emit(batch)
+                    batch = []
+            if batch:
+                emit(batch)
+        except Exception as e:
+            logger.error(f"知识库导入切块阶段异常: {e}", exc_info=True)
+            errors.append(e)
+        finally:
+            chunk_queue.put(_END)
+
+    def embed_batch(batch):
+        embeddings = embed_fn([item[0] for item in batch])
+        rows = [(e, chunk, h, page_no, fields)
+                for e, (chunk, h, page_no, fields) in zip(embeddings, batch) if e is not None]
+        failed = len(batch) - len(rows)
+        if failed:
+            logger.error(f"{failed} 个文本块向量生成失败，将不会存入知识库。")
+        return rows, failed
+
+    producer = threading.Thread(target=produce_batches, name="ingest-split", daemon=True)
+    embedder = threading.Thread(target=_stage, args=(embed_batch, chunk_queue, embedded_queue, errors),
+                                name="ingest-embed", daemon=True)
+    producer.start()
+    embedder.start()
+
+    # 插入阶段在调用线程中执行
+    while True:
+        item = embedded_queue.get()
+        if item is _END:
+            break
+        rows, failed = item
+        stats["failed"] += failed
+        if rows and not errors:
+            try:
+                stats["inserted"] += insert_fn(rows)
+                logger.info(f"已插入 {stats['inserted']} 个文本块（已处理 {stats['chunks']} 个）...")
+            except Exception as e:
+                # 继续消费队列直到结束标记，让上游线程能够退出
+                logger.error(f"知识库导入插入阶段异常: {e}", exc_info=True)
+                errors.append(e)
+
+    producer.join()
+    embedder.join()
+    if errors:
+        raise errors[0]
+    return stats
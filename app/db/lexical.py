@@ -0,0 +1,239 @@
+# 文件名: app/db/lexical.py
+import os
+import re
+import json
+import math
+import shutil
+import logging
+import threading
+from collections import Counter
+import numpy as np
+from app.utils.helpers import file_signature
+
+logger = logging.getLogger(__name__)
+
+# 汉字按字二元组切分，字母数字串整体作为一个词
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+")
+_DOCS_FILE = "docs.jsonl"       # 追加写的文档日志，是索引内容的权威来源
+_SNAPSHOT_FILE = "bm25.npz"     # 倒排表快照（NumPy 数组，不使用 pickle），加载时只需重放快照之后追加的文档
+_MAX_QUERY_TERMS = 256          # 长条款只保留 idf 最高的若干词项，控制单次查询耗时
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    单个集合的字二元组 BM25 倒排索引。
+    插入时增量更新内存中的倒排表并追加写文档日志；flush 时保存快照。
+    查询时将各词项的倒排表转为 NumPy 数组（按词项缓存），用 bincount 一次性累加得分。
+    signature 记录本对象最后一次读写时磁盘上的状态，与 disk_signature() 不同说明索引已被其他进程重建、修改或删除。
+    """
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.texts = []
+        self.sources = []
+        self.lengths = []
+        self._postings = {}          # 词项 -> 文档号列表（从快照加载的为 NumPy 数组，追加时转为列表）
+        self._tfs = {}               # 词项 -> 词频列表，与 _postings 对齐
+        self._frozen = {}            # 词项 -> (文档号数组, 词频数组)，插入后失效
+        self._lengths_array = None
+        self._lock = threading.RLock()
+        self.signature = None
+        self._load()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def disk_signature(self):
+        """快照文件的签名与文档日志是否存在。完整的构建、删除来源都会重写快照，删除集合会删除文档日志"""
+        return (file_signature(os.path.join(self.path, _SNAPSHOT_FILE)),
+                os.path.exists(os.path.join(self.path, _DOCS_FILE)))
+
+    def _load(self):
+        # 先取签名再读取：读取期间文件被替换时签名偏旧，只会导致下次多加载一次
+        self.signature = self.disk_signature()
+        snapshot_path = os.path.join(self.path, _SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path, allow_pickle=False) as state:
+                header = json.loads(state["header"].tobytes().decode("utf-8"))
+                ids, tfs, offsets = state["ids"], state["tfs"], state["offsets"]
+                self.lengths = state["lengths"].tolist()
+            self.texts, self.sources = header["texts"], header["sources"]
+            # 各词项的倒排表是拼接数组上的切片视图，无需逐个复制
+            for i, term in enumerate(header["terms"]):
+                self._postings[term] = ids[offsets[i]:offsets[i + 1]]
+                self._tfs[term] = tfs[offsets[i]:offsets[i + 1]]
+        docs_path = os.path.join(self.path, _DOCS_FILE)
+        if os.path.exists(docs_path):
+            with open(docs_path, encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if i >= len(self.texts):
+                        doc = json.loads(line)
+                        self._index(doc["text"], doc["source"])
+
+    def _index(self, text: str, source: str):
+        doc_id = len(self.texts)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                self._postings[term], self._tfs[term] = [doc_id], [tf]
+            else:
+                if not isinstance(postings, list):
+                    postings = self._postings[term] = postings.tolist()
+                    self._tfs[term] = self._tfs[term].tolist()
+                postings.append(doc_id)
+                self._tfs[term].append(tf)
+            self._frozen.pop(term, None)
+        self.texts.append(text)
+        self.sources.append(source)
+        self.lengths.append(sum(counts.values()))
+        self._lengths_array = None
+
+    def add(self, texts: list[str], source: str):
+        """增量加入一批文本块：先追加写文档日志，再更新内存倒排表"""
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, _DOCS_FILE), "a", encoding="utf-8") as f:
+                for text in texts:
+                    f.write(json.dumps({"text": text, "source": source}, ensure_ascii=False) + "\n")
+            for text in texts:
+                self._index(text, source)
+            self.signature = self.disk_signature()
+
+    def flush(self):
+        """
+        保存倒排表快照，下次加载时无需重新切词。快照为单个 .npz 文件：全部倒排表按词项顺序拼接为
+        文档号、词频两个数组并记录各词项的起始位置，词项列表与文本以 JSON 编码保存，加载时不执行任何代码。
+        """
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            snapshot_path = os.path.join(self.path, _SNAPSHOT_FILE)
+            terms = list(self._postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(self._postings[term]) for term in terms])
+            ids = np.concatenate([np.asarray(self._postings[term], dtype=np.int32) for term in terms]) \
+                if terms else np.empty(0, dtype=np.int32)
+            tfs = np.concatenate([np.asarray(self._tfs[term], dtype=np.int32) for term in terms]) \
+                if terms else np.empty(0, dtype=np.int32)
+            header = json.dumps({"terms": terms, "texts": self.texts, "sources": self.sources}, ensure_ascii=False)
+            tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, header=np.frombuffer(header.encode("utf-8"), dtype=np.uint8), ids=ids, tfs=tfs,
+                         offsets=offsets, lengths=np.asarray(self.lengths, dtype=np.int32))
+            os.replace(tmp_path, snapshot_path)
+            self.signature = self.disk_signature()
+
+    def remove_source(self, source: str) -> int:
+        """删除某个来源的全部文本块。文档号会整体重排，因此重建索引"""
+        with self._lock:
+            keep = [(text, s) for text, s in zip(self.texts, self.sources) if s != source]
+            removed = len(self.texts) - len(keep)
+            if not removed:
+                return 0
+            docs_path = os.path.join(self.path, _DOCS_FILE)
+            tmp_path = f"{docs_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for text, s in keep:
+                    f.write(json.dumps({"text": text, "source": s}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, docs_path)
+            self.texts, self.sources, self.lengths = [], [], []
+            self._postings, self._tfs, self._frozen = {}, {}, {}
+            for text, s in keep:
+                self._index(text, s)
+            self.flush()
+            return removed
+
+    def _term_arrays(self, term: str):
+        arrays = self._frozen.get(term)
+        if arrays is None:
+            arrays = (np.asarray(self._postings[term], dtype=np.int32), np.asarray(self._tfs[term], dtype=np.float32))
+            self._frozen[term] = arrays
+        return arrays
+
+    def search(self, query: str, k: int) -> list[dict]:
+        """返回 BM25 得分最高的 k 个文本块 [{"text", "score"}]"""
+        with self._lock:
+            n = len(self.texts)
+            terms = [term for term in set(tokenize(query)) if term in self._postings]
+            if not n or not terms:
+                return []
+            if self._lengths_array is None:
+                self._lengths_array = np.asarray(self.lengths, dtype=np.float32)
+            lengths = self._lengths_array
+            idf = {term: math.log(1 + (n - len(self._postings[term]) + 0.5) / (len(self._postings[term]) + 0.5))
+                   for term in terms}
+            terms = sorted(terms, key=idf.get, reverse=True)[:_MAX_QUERY_TERMS]
+            norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1e-6))
+            all_ids, all_scores = [], []
+            for term in terms:
+                ids, tfs = self._term_arrays(term)
+                all_ids.append(ids)
+                all_scores.append(idf[term] * tfs * (self.k1 + 1) / (tfs + norm[ids]))
+            scores = np.bincount(np.concatenate(all_ids), weights=np.concatenate(all_scores), minlength=n)
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [{"text": self.texts[i], "score": float(scores[i])} for i in top if scores[i] > 0]
+
+
+class LexicalIndexStore:
+    """
+    按集合名管理 BM25 索引，索引存放在 root_dir/<集合名>/ 目录下，首次使用时加载。
+    多进程部署时其他工作进程可能重建或删除了集合，每次获取时核对磁盘上的快照，有变化则重新加载。
+    """
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, collection_name)
+
+    def exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._path(collection_name), _DOCS_FILE))
+
+    def get(self, collection_name: str, create: bool = False):
+        """获取集合的索引；不存在且 create 为 False 时返回 None"""
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is not None and index.signature != index.disk_signature():
+                logger.info(f"集合 '{collection_name}' 的 BM25 索引已被其他进程更新，重新加载。")
+                del self._indexes[collection_name]
+                index = None
+            if index is None:
+                if not create and not self.exists(collection_name):
+                    return None
+                index = BM25Index(self._path(collection_name))
+                self._indexes[collection_name] = index
+            return index
+
+    def drop(self, collection_name: str):
+        with self._lock:
+            self._indexes.pop(collection_name, None)
+            shutil.rmtree(self._path(collection_name), ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: len(index) for name, index in self._indexes.items()}
+
+
+def reciprocal_rank_fusion(ranked_lists: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """倒数排名融合：每个列表中排名为 r 的结果得分 1/(k + r)，返回按总分降序的 (文本, 得分)"""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, text in enumerate(ranked, start=1):
+            scores[text] = scores.get(text, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
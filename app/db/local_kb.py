@@ -0,0 +1,328 @@
+# 文件名: app/db/local_kb.py
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from config import EMBEDDING_DIM, CLAUSE_RETRIEVAL_TOP_K, LOCAL_KB_DIR, LOCAL_KB_DTYPE
+from app.db.base import KnowledgeBaseBackend, BUILD_MODES
+from app.db.index_config import choose_index_params
+from app.db.ingestion import run_ingestion_pipeline
+from app.utils.helpers import iter_pdf_pages, file_signature
+from app.services.llm_service import get_embeddings
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_VECTORS_FILE = "vectors.bin"    # 行优先的原始向量矩阵，通过 np.memmap 只读映射
+_CHUNKS_FILE = "chunks.jsonl"    # 与向量逐行对齐的文本块及其元数据
+_META_FILE = "meta.json"         # 维度、精度、度量以及已提交的行数/字节数
+_SEARCH_BLOCK_ROWS = 65536       # 分块计算距离，限制 float16 转换和距离矩阵的临时内存
+
+
+class _LocalCollection:
+    """
+    一个已打开集合的只读快照。写入后整体替换，检索线程无需加锁。
+    signature 为打开时 meta.json 的签名：任何写入最后都会替换 meta.json，签名变化即说明快照已过期。
+    """
+    def __init__(self, path: str):
+        self.signature = file_signature(os.path.join(path, _META_FILE))
+        with open(os.path.join(path, _META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.count = self.meta["count"]
+        self.metric_type = self.meta["metric_type"]
+        dim, dtype = self.meta["dim"], np.dtype(self.meta["dtype"])
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, _VECTORS_FILE), dtype=dtype, mode="r", shape=(self.count, dim))
+        else:
+            self.vectors = np.empty((0, dim), dtype=dtype)
+        self.records = []
+        with open(os.path.join(path, _CHUNKS_FILE), encoding="utf-8") as f:
+            for line in f:
+                if len(self.records) >= self.count:
+                    break   # 超出已提交行数的部分是中断写入的残留
+                self.records.append(json.loads(line))
+        # 预先计算每行的范数，检索时只需一次矩阵乘法
+        self.norms_sq = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+            self.norms_sq[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+    def search(self, queries: np.ndarray, k: int):
+        """精确 top-k 检索，返回 (行号矩阵, 距离矩阵)，距离越小越相似"""
+        k = min(k, self.count)
+        queries_norm_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+        best_ids, best_dist = [], []
+        for start in range(0, self.count, _SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+            dots = queries @ block.T
+            norms_sq = self.norms_sq[start:start + len(block)]
+            if self.metric_type == "L2":
+                # 与 Milvus 一致，返回平方欧氏距离
+                dist = np.maximum(queries_norm_sq - 2 * dots + norms_sq, 0)
+            elif self.metric_type == "COSINE":
+                dist = 1.0 - dots / np.maximum(np.sqrt(queries_norm_sq * norms_sq), 1e-12)
+            else:
+                dist = -dots
+            kk = min(k, len(block))
+            ids = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+            best_ids.append(ids + start)
+            best_dist.append(np.take_along_axis(dist, ids, axis=1))
+        ids, dist = np.concatenate(best_ids, axis=1), np.concatenate(best_dist, axis=1)
+        order = np.argsort(dist, axis=1)[:, :k]
+        return np.take_along_axis(ids, order, axis=1), np.take_along_axis(dist, order, axis=1)
+
+
+class LocalKnowledgeBase(KnowledgeBaseBackend):
+    """
+    内嵌的本地向量存储后端，无需 Milvus 服务。
+    每个知识库是 LOCAL_KB_DIR 下的一个目录：向量以 float32/float16 矩阵存放并通过内存映射读取，
+    文本与元数据存放在逐行对齐的 JSONL 旁路文件中；检索为基于 NumPy 的精确向量化 top-k。
+    适合几千到几十万文本块规模的知识库。
+    """
+    name = "local"
+
+    def __init__(self, root_dir: str = LOCAL_KB_DIR, dtype: str = LOCAL_KB_DTYPE):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"本地知识库仅支持 float32 或 float16 精度，当前为: {dtype}")
+        super().__init__()
+        self.root_dir = root_dir
+        self.dtype = dtype
+        self._opened = {}
+        self._lock = threading.RLock()
+        os.makedirs(root_dir, exist_ok=True)
+        logger.info(f"本地知识库后端已就绪，数据目录: {os.path.abspath(root_dir)}")
+
+    def _path(self, collection_name: str) -> str:
+        if not collection_name or os.sep in collection_name or collection_name.startswith("."):
+            raise ValueError(f"无效的知识库名称: {collection_name}")
+        return os.path.join(self.root_dir, collection_name)
+
+    def has_collection(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._path(collection_name), _META_FILE))
+
+    def _open(self, collection_name: str) -> _LocalCollection:
+        """打开（或复用已打开的）集合；多进程部署时其他工作进程可能已重建或修改该集合，元数据有变化则重新打开"""
+        with self._lock:
+            collection = self._opened.get(collection_name)
+            if collection is not None and collection.signature != file_signature(
+                    os.path.join(self._path(collection_name), _META_FILE)):
+                logger.info(f"本地集合 '{collection_name}' 已被其他进程更新，重新打开。")
+                collection = None
+            if collection is None:
+                collection = _LocalCollection(self._path(collection_name))
+                self._opened[collection_name] = collection
+            return collection
+
+    def _read_meta(self, collection_name: str) -> dict:
+        with open(os.path.join(self._path(collection_name), _META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, collection_name: str, meta: dict):
+        path = os.path.join(self._path(collection_name), _META_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+        self._opened.pop(collection_name, None)
+
+    def create_collection(self, collection_name: str, drop_existing: bool = True, metric_type: str = None) -> dict:
+        """创建集合并返回其元数据；集合已存在且不删除时返回现有元数据"""
+        with self._lock:
+            path = self._path(collection_name)
+            if self.has_collection(collection_name):
+                if not drop_existing:
+                    return self._read_meta(collection_name)
+                logger.info(f"集合 '{collection_name}' 已存在，正在删除旧集合...")
+                self._opened.pop(collection_name, None)
+                shutil.rmtree(path)
+            os.makedirs(path)
+            open(os.path.join(path, _VECTORS_FILE), "wb").close()
+            open(os.path.join(path, _CHUNKS_FILE), "wb").close()
+            metric_type = choose_index_params(0, EMBEDDING_DIM, "FLAT", metric_type)["metric_type"]
+            meta = {"dim": EMBEDDING_DIM, "dtype": self.dtype, "metric_type": metric_type,
+                    "count": 0, "chunks_bytes": 0, "created_at": time.time()}
+            self._write_meta(collection_name, meta)
+            logger.info(f"本地集合 '{collection_name}' 创建成功（{self.dtype}，{metric_type}）。")
+            return meta
+
+    def _append_rows(self, collection_name: str, rows) -> int:
+        """
+        追加一批 (向量, 文本, 内容哈希, 页码, 结构字段, 来源) 行，先写数据文件，最后提交元数据中的行数。
+        只读写元数据而不重新打开集合，导入过程中的多次追加不会反复加载整个集合。
+        """
+        with self._lock:
+            path = self._path(collection_name)
+            meta = self._read_meta(collection_name)
+            dtype = np.dtype(meta["dtype"])
+            vectors = np.asarray([row[0] for row in rows], dtype=dtype)
+            if vectors.shape[1] != meta["dim"]:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与集合维度 {meta['dim']} 不一致")
+            lines = "".join(json.dumps({"text": text, "content_hash": content_hash, "page": page, "source": source,
+                                        **fields}, ensure_ascii=False) + "\n"
+                            for _, text, content_hash, page, fields, source in rows).encode("utf-8")
+            # 截断上次中断写入留下的未提交数据后再追加
+            with open(os.path.join(path, _VECTORS_FILE), "r+b") as f:
+                f.truncate(meta["count"] * meta["dim"] * dtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors.tobytes())
+            with open(os.path.join(path, _CHUNKS_FILE), "r+b") as f:
+                f.truncate(meta["chunks_bytes"])
+                f.seek(0, os.SEEK_END)
+                f.write(lines)
+            self._write_meta(collection_name, {**meta, "count": meta["count"] + len(rows),
+                                               "chunks_bytes": meta["chunks_bytes"] + len(lines)})
+            return len(rows)
+
+    def build_and_store(self, pdf_source, collection_name: str, mode: str = "rebuild", source_name: str = None,
+                        index_type: str = None, metric_type: str = None, index_params: dict = None) -> int:
+        """
+        将 PDF 存入本地知识库，语义与 Milvus 后端一致（rebuild / append、同一来源内按内容哈希去重、记录来源与页码）。
+        本地后端始终使用精确检索，index_type 与 index_params 被忽略；metric_type 可在追加时修改。
+        """
+        if mode not in BUILD_MODES:
+            raise ValueError("构建模式必须是 'rebuild' 或 'append'")
+        if index_type and index_type.upper() not in ("AUTO", "FLAT"):
+            logger.info(f"本地后端始终使用精确检索，忽略索引类型 {index_type}。")
+        source_name = source_name or (os.path.basename(pdf_source) if isinstance(pdf_source, str) else "upload.pdf")
+        meta = self.create_collection(collection_name, drop_existing=(mode == "rebuild"), metric_type=metric_type)
+        if metric_type:
+            metric_type = choose_index_params(0, EMBEDDING_DIM, "FLAT", metric_type)["metric_type"]
+            if metric_type != meta["metric_type"]:
+                # 精确检索没有需要重建的索引，直接切换度量即可
+                with self._lock:
+                    self._write_meta(collection_name, {**meta, "metric_type": metric_type})
+        logger.info(f"开始为本地集合 '{collection_name}' {'追加' if mode == 'append' else '构建'}知识库（来源: {source_name}）...")
+
+        lexical_index, article_index = self._prepare_indexes(collection_name, mode, meta["count"])
+
+        def insert_rows(rows):
+            inserted = self._append_rows(collection_name, [(*row, source_name) for row in rows])
+            self._index_rows(lexical_index, article_index, rows, source_name)
+            return inserted
+
+        # 只在同一来源内去重，删除其他来源时不会连带删掉本来源也包含的文本块
+        existing_hashes_fn = None
+        if mode == "append" and meta["count"] > 0:
+            existing = {record["content_hash"] for record in self._open(collection_name).records
+                        if record["source"] == source_name}
+            existing_hashes_fn = lambda hashes: existing.intersection(hashes)
+
+        stats = run_ingestion_pipeline(iter_pdf_pages(pdf_source), get_embeddings, insert_rows, existing_hashes_fn)
+        self._flush_indexes(lexical_index, article_index)
+        logger.info(f"知识库导入统计: {stats}")
+        logger.info(f"成功插入 {stats['inserted']} 条数据到本地集合 '{collection_name}'。")
+        return stats["inserted"]
+
+    def remove_source(self, collection_name: str, source_name: str):
+        """删除某个来源文档的全部文本块，并压缩重写数据文件"""
+        if not self.has_collection(collection_name):
+            return False, f"知识库 '{collection_name}' 不存在。"
+        logger.info(f"正在从本地集合 '{collection_name}' 删除来源 '{source_name}' 的文本块...")
+        try:
+            with self._lock:
+                path = self._path(collection_name)
+                collection = self._open(collection_name)
+                meta = collection.meta
+                keep = [i for i, record in enumerate(collection.records) if record["source"] != source_name]
+                removed = collection.count - len(keep)
+                if removed:
+                    lines = "".join(json.dumps(collection.records[i], ensure_ascii=False) + "\n"
+                                    for i in keep).encode("utf-8")
+                    vectors = np.asarray(collection.vectors[keep]) if keep else collection.vectors[:0]
+                    vectors_path, chunks_path = os.path.join(path, _VECTORS_FILE), os.path.join(path, _CHUNKS_FILE)
+                    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(vectors_path + suffix, "wb") as f:
+                        f.write(vectors.tobytes())
+                    with open(chunks_path + suffix, "wb") as f:
+                        f.write(lines)
+                    self._opened.pop(collection_name, None)
+                    del collection
+                    os.replace(vectors_path + suffix, vectors_path)
+                    os.replace(chunks_path + suffix, chunks_path)
+                    self._write_meta(collection_name, {**meta, "count": len(keep), "chunks_bytes": len(lines)})
+            self._remove_source_from_indexes(collection_name, source_name)
+            logger.info(f"已从本地集合 '{collection_name}' 删除来源 '{source_name}' 的 {removed} 个文本块。")
+            return True, f"已从知识库 '{collection_name}' 删除来源 '{source_name}' 的 {removed} 个条目。"
+        except Exception as e:
+            logger.error(f"删除来源 '{source_name}' 失败: {e}", exc_info=True)
+            return False, f"删除来源 '{source_name}' 失败: {str(e)}"
+
+    def vector_retrieve_by_clauses(self, clauses: list[str], collection_name: str, k: int = CLAUSE_RETRIEVAL_TOP_K,
+                                   clause_embeddings: list = None) -> dict[int, list[dict]]:
+        if not clauses or not self.has_collection(collection_name):
+            return {}
+        collection = self._open(collection_name)
+        if not collection.count:
+            return {}
+
+        logger.info(f"正在为 {len(clauses)} 个条款从本地集合 '{collection_name}' 检索上下文...")
+        if clause_embeddings is None:
+            clause_embeddings = get_embeddings(clauses)
+        clause_ids = [i for i, e in enumerate(clause_embeddings) if e is not None]
+        if not clause_ids:
+            logger.error("条款向量全部生成失败，无法检索。")
+            return {}
+        queries = np.asarray([clause_embeddings[i] for i in clause_ids], dtype=np.float32)
+        with metrics.timer("vector_search_seconds", backend=self.name):
+            ids, distances = collection.search(queries, k)
+
+        clause_contexts = {}
+        for idx, row_ids, row_distances in zip(clause_ids, ids.tolist(), distances.tolist()):
+            seen = set()
+            docs = []
+            for row_id, distance in zip(row_ids, row_distances):
+                text = collection.records[row_id]["text"]
+                if text and text not in seen:
+                    seen.add(text)
+                    docs.append({"text": text, "distance": distance})
+            clause_contexts[idx] = docs
+        return clause_contexts
+
+    def is_ready(self, collection_name: str) -> bool:
+        if not self.has_collection(collection_name):
+            return False
+        try:
+            return self._open(collection_name).count > 0
+        except Exception as e:
+            logger.warning(f"检查集合 '{collection_name}' 状态失败: {e}")
+            return False
+
+    def delete_collection(self, collection_name: str):
+        if self.has_collection(collection_name):
+            logger.info(f"正在删除本地集合 '{collection_name}'...")
+            try:
+                with self._lock:
+                    self._opened.pop(collection_name, None)
+                    shutil.rmtree(self._path(collection_name))
+                self._drop_indexes(collection_name)
+                logger.info(f"集合 '{collection_name}' 已成功删除。")
+                return True, f"知识库 '{collection_name}' 已成功删除。"
+            except Exception as e:
+                logger.error(f"删除集合 '{collection_name}' 失败: {e}", exc_info=True)
+                return False, f"删除知识库 '{collection_name}' 失败: {str(e)}"
+        else:
+            logger.warning(f"集合 '{collection_name}' 不存在，无需删除。")
+            return True, f"知识库 '{collection_name}' 本身不存在，无需操作。"
+
+    def list_all_collections(self):
+        logger.info("正在获取所有知识库列表...")
+        try:
+            collections = sorted(name for name in os.listdir(self.root_dir)
+                                 if os.path.exists(os.path.join(self.root_dir, name, _META_FILE)))
+            logger.info(f"成功获取到 {len(collections)} 个知识库: {collections}")
+            return True, collections
+        except Exception as e:
+            logger.error(f"获取知识库列表失败: {e}", exc_info=True)
+            return False, f"获取知识库列表失败: {str(e)}"
+
+    def index_info(self, collection_name: str) -> dict:
+        meta = self._open(collection_name).meta
+        return {"index_type": "FLAT", "metric_type": meta["metric_type"], "params": {"dtype": meta["dtype"]}}
+
+    def stats(self) -> dict:
+        with self._lock:
+            opened = {name: collection.count for name, collection in self._opened.items()}
+        return {**super().stats(), "root_dir": self.root_dir, "dtype": self.dtype, "opened": opened}
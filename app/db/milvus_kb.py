@@ -1,21 +1,35 @@
 # 文件名: app/db/milvus_kb.py
+import os
+import json
 import logging
 from pymilvus import (
     connections, utility, FieldSchema, CollectionSchema, DataType, Collection
 )
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from config import MILVUS_HOST, MILVUS_PORT, EMBEDDING_DIM
-from app.utils.helpers import extract_text_from_pdf
+from config import (
+    MILVUS_HOST, MILVUS_PORT, EMBEDDING_DIM, CLAUSE_RETRIEVAL_TOP_K,
+    MILVUS_LOAD_MEMORY_BUDGET_MB, MILVUS_PINNED_COLLECTIONS
+)
+from app.db.base import KnowledgeBaseBackend, BUILD_MODES
+from app.db.collection_manager import CollectionManager
+from app.db.index_config import choose_index_params, search_params_for, to_distance
+from app.utils.helpers import iter_pdf_pages
+from app.db.ingestion import run_ingestion_pipeline
 from app.services.llm_service import get_embeddings
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
-class MilvusKnowledgeBase:
+class MilvusKnowledgeBase(KnowledgeBaseBackend):
+    name = "milvus"
+
     def __init__(self):
-        # ... (此处代码与原文件中的 MilvusKnowledgeBase 类完全相同) ...
-        # 注意：需要修改一些函数的参数，使其不再依赖全局变量
-        # 比如 create_collection, build_and_store 等
+        super().__init__()
         self.connect()
+        # 缓存集合句柄并让常用集合保持加载，避免每次检索都 load/release；
+        # 集合的变更标记与 BM25 索引放在一起（以 . 开头，不会与集合名冲突），供各工作进程发现其他进程的重建与删除
+        self.collections = CollectionManager(MILVUS_LOAD_MEMORY_BUDGET_MB, MILVUS_PINNED_COLLECTIONS,
+                                             state_dir=os.path.join(self.index_dir, ".generations"))
+        self.collections.preload_pinned()
 
     def connect(self):
         try:
@@ -27,69 +41,198 @@ class MilvusKnowledgeBase:
             logger.error(f"连接 Milvus 失败: {e}")
             raise
 
-    def create_collection(self, collection_name: str):
+    def has_collection(self, collection_name: str) -> bool:
+        return utility.has_collection(collection_name)
+
+    def create_collection(self, collection_name: str, drop_existing: bool = True):
         if utility.has_collection(collection_name):
+            if not drop_existing:
+                return self.collections.get(collection_name)
             logger.info(f"集合 '{collection_name}' 已存在，正在删除旧集合...")
+            self.collections.invalidate(collection_name)
             utility.drop_collection(collection_name)
         fields = [
             FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
-            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=8192)
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=8192),
+            FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64),
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=512),
+            FieldSchema(name="page", dtype=DataType.INT64),
+            FieldSchema(name="article_no", dtype=DataType.INT64),
+            FieldSchema(name="chapter", dtype=DataType.VARCHAR, max_length=512)
         ]
         schema = CollectionSchema(fields, f"{collection_name}知识库")
         collection = Collection(collection_name, schema)
-        index_params = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 128}}
-        collection.create_index(field_name="embedding", index_params=index_params)
-        logger.info(f"集合 '{collection_name}' 创建成功并已创建索引。")
+        # 索引在数据导入完成后按实际文本块数量创建，见 ensure_index
+        logger.info(f"集合 '{collection_name}' 创建成功。")
         return collection
-    
-    def build_and_store(self, pdf_path: str, collection_name: str):
-        collection = self.create_collection(collection_name)
-        logger.info(f"开始为集合 '{collection_name}' 构建并存储知识库...")
-        text = extract_text_from_pdf(pdf_path)
-        if not text: return 0
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
-        chunks = text_splitter.split_text(text)
-        logger.info(f"文本被切分为 {len(chunks)} 个块。")
-        embeddings = get_embeddings(chunks)
-        if not embeddings: return 0
-        entities = [embeddings, chunks]
-        insert_result = collection.insert(entities)
+
+    def ensure_index(self, collection_name: str, index_type: str = None, metric_type: str = None,
+                     index_params: dict = None) -> dict:
+        """
+        确保集合的向量字段已建立索引，返回实际使用的索引参数。
+        未指定 index_type / metric_type 且集合已有索引时保持不变；
+        显式指定且与现有索引不同时，释放集合并重建索引。索引参数由 Milvus 持久化，检索时读回。
+        """
+        collection = self.collections.get(collection_name)
+        explicit = bool(index_type or metric_type or index_params)
+        if collection.has_index():
+            current = self.collections.index_params(collection_name)
+            if not explicit:
+                return current
+            wanted = choose_index_params(collection.num_entities, EMBEDDING_DIM, index_type, metric_type, index_params)
+            if wanted == current:
+                return current
+            logger.info(f"集合 '{collection_name}' 的索引将由 {current} 重建为 {wanted}...")
+            self.collections.invalidate(collection_name)
+            collection.release()
+            collection.drop_index()
+        else:
+            wanted = choose_index_params(collection.num_entities, EMBEDDING_DIM, index_type, metric_type, index_params)
+        collection.create_index(field_name="embedding", index_params=wanted)
+        self.collections.invalidate(collection_name)
+        logger.info(f"集合 '{collection_name}'（{collection.num_entities} 条）已创建索引: {wanted}")
+        return wanted
+
+    @staticmethod
+    def _supports_incremental(collection: Collection) -> bool:
+        """旧版集合只有 embedding/text 字段，不支持去重追加和按来源删除"""
+        return "content_hash" in {field.name for field in collection.schema.fields}
+
+    def _existing_hashes(self, collection_name: str, source_name: str, hashes: list[str]) -> set:
+        """
+        查询集合中该来源已存在的内容哈希。只在同一来源内去重：其他来源中相同的文本块仍会写入，
+        否则删除其他来源时会连带删掉本来源也包含的内容。
+        """
+        existing = set()
+        source_expr = f"source == {json.dumps(source_name, ensure_ascii=False)}"
+        with self.collections.use(collection_name) as collection:
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = collection.query(expr=f"{source_expr} and content_hash in {json.dumps(batch)}",
+                                        output_fields=["content_hash"])
+                existing.update(row["content_hash"] for row in rows)
+        return existing
+
+    def build_and_store(self, pdf_source, collection_name: str, mode: str = "rebuild", source_name: str = None,
+                        index_type: str = None, metric_type: str = None, index_params: dict = None):
+        """
+        将 PDF 存入知识库。
+        mode 为 "rebuild" 时重建集合；为 "append" 时追加到已有集合，并跳过同一来源中内容哈希已存在的文本块。
+        每个文本块同时记录来源文档名（source）与页码（page）。
+        导入以流水线方式进行（逐页解析 → 切块 → 批量向量化 → 批量插入），内存占用与文档大小无关。
+        导入完成后按 index_type / metric_type 建立索引，未指定时根据文本块数量自动选择。
+        """
+        if mode not in BUILD_MODES:
+            raise ValueError("构建模式必须是 'rebuild' 或 'append'")
+        source_name = source_name or (os.path.basename(pdf_source) if isinstance(pdf_source, str) else "upload.pdf")
+        collection = self.create_collection(collection_name, drop_existing=(mode == "rebuild"))
+        if not self._supports_incremental(collection):
+            raise ValueError(f"知识库 '{collection_name}' 为旧版结构，不支持追加，请先重建。")
+        logger.info(f"开始为集合 '{collection_name}' {'追加' if mode == 'append' else '构建'}知识库（来源: {source_name}）...")
+
+        lexical_index, article_index = self._prepare_indexes(collection_name, mode, collection.num_entities)
+        # 早期集合没有 article_no / chapter 字段，追加时只写入已有字段
+        has_article_fields = "article_no" in {field.name for field in collection.schema.fields}
+
+        def insert_rows(rows):
+            embeddings, texts, hashes, pages, fields = (list(column) for column in zip(*rows))
+            columns = [embeddings, texts, hashes, [source_name] * len(rows), pages]
+            if has_article_fields:
+                columns += [[f["article_no"] for f in fields], [f["chapter"][:160] for f in fields]]
+            insert_result = collection.insert(columns)
+            self._index_rows(lexical_index, article_index, rows, source_name)
+            return insert_result.insert_count
+
+        # 追加模式下按内容哈希跳过该来源已写入的文本块（重复导入同一文档）；文档内部的重复块由流水线去重
+        existing_hashes_fn = None
+        if mode == "append" and collection.num_entities > 0:
+            existing_hashes_fn = lambda hashes: self._existing_hashes(collection_name, source_name, hashes)
+
+        stats = run_ingestion_pipeline(iter_pdf_pages(pdf_source), get_embeddings, insert_rows, existing_hashes_fn)
         collection.flush()
-        logger.info(f"成功插入 {insert_result.insert_count} 条数据到 Milvus 集合 '{collection_name}'。")
+        self._flush_indexes(lexical_index, article_index)
+        self.ensure_index(collection_name, index_type, metric_type, index_params)
+        logger.info(f"知识库导入统计: {stats}")
+        logger.info(f"成功插入 {stats['inserted']} 条数据到 Milvus 集合 '{collection_name}'。")
         logger.info("知识库构建并存储完成！")
-        return insert_result.insert_count
+        return stats["inserted"]
 
-    def retrieve(self, query: str, collection_name: str, k: int = 5) -> str:
+    def remove_source(self, collection_name: str, source_name: str):
+        """删除知识库中某个来源文档的全部文本块"""
         if not utility.has_collection(collection_name):
-            return f"知识库 '{collection_name}' 不存在。"
-        
-        collection = Collection(collection_name)
-        collection.load()
-        
-        logger.info(f"正在从 Milvus 集合 '{collection_name}' 检索上下文...")
-        query_embedding = get_embeddings([query])
-        if not query_embedding:
-            return "无法为查询生成向量。"
-        search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-        results = collection.search(
-            data=query_embedding,
-            anns_field="embedding",
-            param=search_params,
-            limit=k,
-            output_fields=["text"]
-        )
-        collection.release()
-        retrieved_docs = [hit.entity.get('text') for hit in results[0]]
-        context = "\n---\n".join(retrieved_docs)
-        logger.info(f"成功从 Milvus 集合 '{collection_name}' 检索到 {len(retrieved_docs)} 条相关信息。")
-        return context
+            return False, f"知识库 '{collection_name}' 不存在。"
+        collection = self.collections.get(collection_name)
+        if not self._supports_incremental(collection):
+            return False, f"知识库 '{collection_name}' 为旧版结构，不支持按来源删除，请先重建。"
+        logger.info(f"正在从集合 '{collection_name}' 删除来源 '{source_name}' 的文本块...")
+        try:
+            with self.collections.use(collection_name) as loaded:
+                result = loaded.delete(expr=f"source == {json.dumps(source_name, ensure_ascii=False)}")
+                loaded.flush()
+            self._remove_source_from_indexes(collection_name, source_name)
+            logger.info(f"已从集合 '{collection_name}' 删除来源 '{source_name}' 的 {result.delete_count} 个文本块。")
+            return True, f"已从知识库 '{collection_name}' 删除来源 '{source_name}' 的 {result.delete_count} 个条目。"
+        except Exception as e:
+            logger.error(f"删除来源 '{source_name}' 失败: {e}", exc_info=True)
+            return False, f"删除来源 '{source_name}' 失败: {str(e)}"
+
+    def vector_retrieve_by_clauses(self, clauses: list[str], collection_name: str, k: int = CLAUSE_RETRIEVAL_TOP_K,
+                                   clause_embeddings: list = None) -> dict[int, list[dict]]:
+        """
+        为每个条款检索相关法条。
+        所有条款的向量一次性批量生成，并通过一次多向量 search 调用完成检索。
+        返回 {条款序号: [{"text": 法条文本, "distance": 距离}, ...]}，距离已统一为越小越相似。
+        """
+        if not clauses or not utility.has_collection(collection_name):
+            return {}
+
+        logger.info(f"正在为 {len(clauses)} 个条款从 Milvus 集合 '{collection_name}' 检索上下文...")
+        if clause_embeddings is None:
+            clause_embeddings = get_embeddings(clauses)
+        # 向量与条款逐项对齐，生成失败的条款跳过检索
+        clause_ids = [i for i, e in enumerate(clause_embeddings) if e is not None]
+        if not clause_ids:
+            logger.error("条款向量全部生成失败，无法检索。")
+            return {}
+        data = [clause_embeddings[i] for i in clause_ids]
+
+        def search():
+            # 检索参数与集合实际的索引类型、度量保持一致
+            index_params = self.collections.index_params(collection_name)
+            with self.collections.use(collection_name) as collection:
+                results = collection.search(data=data, anns_field="embedding", param=search_params_for(index_params, k),
+                                            limit=k, output_fields=["text"])
+            return results, index_params["metric_type"]
+
+        try:
+            with metrics.timer("vector_search_seconds", backend=self.name):
+                results, metric_type = search()
+        except Exception as e:
+            # 集合可能已被其他进程释放或重建，丢弃缓存状态后重新加载重试一次
+            logger.warning(f"检索集合 '{collection_name}' 失败，将重新加载后重试: {e}")
+            metrics.inc("retries_total", component="milvus")
+            self.collections.invalidate(collection_name, notify=False)
+            with metrics.timer("vector_search_seconds", backend=self.name):
+                results, metric_type = search()
+
+        clause_contexts = {}
+        for idx, hits in zip(clause_ids, results):
+            seen = set()
+            docs = []
+            for hit in hits:
+                text = hit.entity.get('text')
+                if text and text not in seen:
+                    seen.add(text)
+                    docs.append({"text": text, "distance": to_distance(metric_type, hit.distance)})
+            clause_contexts[idx] = docs
+        return clause_contexts
 
     def is_ready(self, collection_name: str) -> bool:
         if not utility.has_collection(collection_name):
             return False
         try:
-            collection = Collection(collection_name)
+            collection = self.collections.get(collection_name)
             return collection.num_entities > 0
         except Exception as e:
             logger.warning(f"检查集合 '{collection_name}' 状态失败: {e}")
@@ -99,7 +242,9 @@ class MilvusKnowledgeBase:
         if utility.has_collection(collection_name):
             logger.info(f"正在删除集合 '{collection_name}'...")
             try:
+                self.collections.invalidate(collection_name)
                 utility.drop_collection(collection_name)
+                self._drop_indexes(collection_name)
                 logger.info(f"集合 '{collection_name}' 已成功删除。")
                 return True, f"知识库 '{collection_name}' 已成功删除。"
             except Exception as e:
@@ -109,6 +254,12 @@ class MilvusKnowledgeBase:
             logger.warning(f"集合 '{collection_name}' 不存在，无需删除。")
             return True, f"知识库 '{collection_name}' 本身不存在，无需操作。"
 
+    def index_info(self, collection_name: str) -> dict:
+        return self.collections.index_params(collection_name)
+
+    def stats(self) -> dict:
+        return {**super().stats(), **self.collections.stats()}
+
     def list_all_collections(self):
         logger.info("正在获取所有知识库列表...")
         try:
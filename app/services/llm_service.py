@@ -1,71 +1,219 @@
 # 文件名: app/services/llm_service.py
+import json
 import logging
 import time
-import numpy as np
-import dashscope
-from dashscope import Generation, TextEmbedding
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from config import DASHSCOPE_API_KEY, EMBEDDING_MODEL
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    DASHSCOPE_API_KEY, EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES,
+    LLM_CACHE_ENABLED, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES,
+    EMBEDDING_MAX_WORKERS, EMBEDDING_RATE_LIMIT_RPS, EMBEDDING_RATE_LIMIT_BURST,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_RETRY_BASE_DELAY
+)
+from app.services.cache import EmbeddingCache, TTLCache
 from app.utils.helpers import log_time
+from app.utils.rate_limit import TokenBucket
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
-# 初始化 Dashscope API Key
-dashscope.api_key = DASHSCOPE_API_KEY
-if not dashscope.api_key:
-    logger.error("错误：未能从 .env 文件或环境变量中加载 DASHSCOPE_API_KEY！")
-    exit()
-
-def get_embeddings(texts: list[str], model: str = EMBEDDING_MODEL, batch_size: int = 25) -> list[list[float]]:
-    """为文本列表生成向量嵌入"""
-    # ... (此处代码与原文件中的 get_embeddings 完全相同) ...
-    if len(texts) == 1 and len(texts[0]) > 2048:
-        logger.info("检测到单个长文本，将采用分块平均策略生成向量...")
-        long_text = texts[0]
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = text_splitter.split_text(long_text)
-        chunk_embeddings = get_embeddings(chunks, model, batch_size)
-        if not chunk_embeddings:
-            logger.error("长文本的分块向量生成失败。")
-            return []
-        avg_embedding = np.mean(np.array(chunk_embeddings), axis=0).tolist()
-        return [avg_embedding]
-
-    logger.info(f"正在为 {len(texts)} 个文本块生成向量（分批处理，每批 {batch_size} 个）...")
-    all_embeddings = []
-    start_time = time.time()
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i + batch_size]
-        logger.info(f"处理批次 {i // batch_size + 1}/{len(texts) // batch_size + 1}...")
+if not DASHSCOPE_API_KEY:
+    logger.error("错误：未能从 .env 文件或环境变量中加载 DASHSCOPE_API_KEY！模型与向量接口将不可用。")
+
+# Dashscope SDK 导入耗时较长，首次调用模型时才导入（见 _get_dashscope）
+_dashscope = None
+_dashscope_lock = threading.Lock()
+
+# 持久化向量缓存：相同模型下相同文本只需向 Dashscope 请求一次
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_ENABLED else None
+
+# 模型响应缓存：审查提示词的温度系数很低，相同输入的结果可以直接复用
+llm_response_cache = TTLCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS) if LLM_CACHE_ENABLED else None
+
+metrics.register_cache("embedding", embedding_cache)
+metrics.register_cache("llm_response", llm_response_cache)
+
+# 向量接口的全局限流器，同一进程内所有批次共享 Dashscope 配额
+embedding_rate_limiter = TokenBucket(EMBEDDING_RATE_LIMIT_RPS, EMBEDDING_RATE_LIMIT_BURST)
+
+def _get_dashscope():
+    """导入 Dashscope SDK 并设置 API Key，只在首次调用时执行；未配置 API Key 时抛出 RuntimeError"""
+    global _dashscope
+    if _dashscope is None:
+        if not DASHSCOPE_API_KEY:
+            raise RuntimeError("未配置 DASHSCOPE_API_KEY")
+        with _dashscope_lock:
+            if _dashscope is None:
+                import dashscope
+                dashscope.api_key = DASHSCOPE_API_KEY
+                _dashscope = dashscope
+    return _dashscope
+
+
+def init_llm_client() -> bool:
+    """预先导入 Dashscope SDK（服务预热时调用），返回是否成功"""
+    try:
+        _get_dashscope()
+        return True
+    except Exception as e:
+        logger.error(f"初始化模型客户端失败: {e}")
+        return False
+
+
+def get_llm_status() -> dict:
+    """模型服务客户端状态，供就绪检查使用"""
+    return {"api_key_configured": bool(DASHSCOPE_API_KEY), "client_loaded": _dashscope is not None}
+
+
+SYSTEM_PROMPT = "你是一个专业的AI法律助手，精通中国法律，特别是合同法和民法典。你的回答必须严格遵循用户的指令，尤其是格式要求。"
+
+def _is_retryable(status_code) -> bool:
+    """限流（429）和服务端错误（5xx）可以重试，其余错误（如输入过长）重试无意义"""
+    return status_code == 429 or (isinstance(status_code, int) and status_code >= 500)
+
+
+def _align_embeddings(records: list, count: int):
+    """
+    按 text_index 将响应中的向量放回输入顺序。所有记录都缺少 text_index 时，只有数量与输入一致才按位置对应；
+    text_index 缺失、越界或重复等无法对应的情况返回 None
+    """
+    if all('text_index' not in record for record in records):
+        return [record['embedding'] for record in records] if len(records) == count else None
+    embeddings = [None] * count
+    for record in records:
+        index = record.get('text_index')
+        if not isinstance(index, int) or not 0 <= index < count or embeddings[index] is not None:
+            return None
+        embeddings[index] = record['embedding']
+    return embeddings
+
+
+def _embed_batch(batch_texts: list[str], model: str) -> list:
+    """
+    为一个批次生成向量，返回与 batch_texts 等长的列表，失败的位置为 None。
+    可重试错误按指数退避重试；不可重试错误时将批次二分，以隔离出导致失败的具体文本。
+    """
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        embedding_rate_limiter.acquire()
         try:
-            for text_item in batch_texts:
-                if len(text_item) > 2048:
-                     logger.warning(f"一个文本块长度超过2048字符，可能导致API错误: {text_item[:100]}...")
-            response = TextEmbedding.call(model=model, input=batch_texts)
-            if response.status_code == 200:
-                batch_embeddings = [record['embedding'] for record in response.output['embeddings']]
-                all_embeddings.extend(batch_embeddings)
-            else:
-                logger.error(f"批次处理失败: Code: {response.status_code}, Message: {response.message}")
-                continue
+            with metrics.timer("embedding_batch_seconds", model=model):
+                response = _get_dashscope().TextEmbedding.call(model=model, input=batch_texts)
+            status_code, message = response.status_code, response.message
         except Exception as e:
-            logger.error(f"批次处理异常: {e}", exc_info=True)
-    log_time(start_time, f"向量生成（共 {len(all_embeddings)} 个）")
-    if len(all_embeddings) != len(texts):
-        logger.warning(f"向量生成不完整：预期 {len(texts)} 个，实际生成 {len(all_embeddings)} 个。")
+            logger.warning(f"批次请求异常（第 {attempt + 1} 次）: {e}")
+            status_code, message = None, str(e)
+
+        if status_code == 200:
+            embeddings = _align_embeddings(response.output['embeddings'], len(batch_texts))
+            if embeddings is not None:
+                return embeddings
+            # 响应中的向量无法与输入逐项对应时按失败处理，不能把向量写到错误的文本上
+            logger.warning(f"批次响应中的向量无法与输入对应（第 {attempt + 1} 次），"
+                           f"输入 {len(batch_texts)} 个，返回 {len(response.output['embeddings'])} 个")
+            status_code, message = None, "响应中的向量与输入无法对应"
+
+        if status_code is not None and not _is_retryable(status_code):
+            logger.error(f"批次处理失败（不可重试）: Code: {status_code}, Message: {message}")
+            metrics.inc("errors_total", component="embedding")
+            if len(batch_texts) > 1:
+                mid = len(batch_texts) // 2
+                return _embed_batch(batch_texts[:mid], model) + _embed_batch(batch_texts[mid:], model)
+            return [None]
+
+        if attempt < EMBEDDING_MAX_RETRIES:
+            delay = EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"批次处理失败: Code: {status_code}, Message: {message}，{delay:.1f} 秒后重试...")
+            metrics.inc("retries_total", component="embedding")
+            time.sleep(delay)
+
+    logger.error(f"批次处理在重试 {EMBEDDING_MAX_RETRIES} 次后仍然失败，涉及 {len(batch_texts)} 个文本块。")
+    metrics.inc("errors_total", component="embedding")
+    return [None] * len(batch_texts)
+
+
+def get_embeddings(texts: list[str], model: str = EMBEDDING_MODEL, batch_size: int = 25,
+                   use_cache: bool = True) -> list:
+    """
+    为文本列表生成向量嵌入，返回与 texts 严格等长、逐项对齐的列表，生成失败的位置为 None。
+    优先读取缓存，只有未命中的文本才会请求 Dashscope；各批次在有界线程池中并发执行，
+    受全局令牌桶限流，并对限流和服务端错误做指数退避重试。
+    """
+    results = [None] * len(texts)
+    cache = embedding_cache if use_cache else None
+    if cache and texts:
+        results = cache.get_many(model, texts)
+
+    # 未命中的文本去重后再请求，重复文本只计算一次
+    pending_texts = list(dict.fromkeys(texts[i] for i, r in enumerate(results) if r is None))
+    if not pending_texts:
+        if texts:
+            logger.info(f"{len(texts)} 个文本块全部命中向量缓存。")
+        return results
+
+    for text_item in pending_texts:
+        if len(text_item) > 2048:
+            logger.warning(f"一个文本块长度超过2048字符，可能导致API错误: {text_item[:100]}...")
+
+    try:
+        _get_dashscope()
+    except Exception as e:
+        logger.error(f"无法生成向量: {e}")
+        metrics.inc("errors_total", component="embedding")
+        return results
+
+    batches = [pending_texts[i:i + batch_size] for i in range(0, len(pending_texts), batch_size)]
+    logger.info(f"正在为 {len(pending_texts)} 个文本块生成向量（共 {len(texts)} 个，{len(batches)} 个批次，"
+                f"每批 {batch_size} 个，并发 {EMBEDDING_MAX_WORKERS}）...")
+    computed = {}
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS) as executor:
+        for batch_texts, batch_embeddings in zip(batches, executor.map(lambda b: _embed_batch(b, model), batches)):
+            succeeded = [(t, e) for t, e in zip(batch_texts, batch_embeddings) if e is not None]
+            computed.update(succeeded)
+            if cache and succeeded:
+                cache.put_many(model, [t for t, _ in succeeded], [e for _, e in succeeded])
+    log_time(start_time, f"向量生成（共 {len(computed)} 个）", metric="embedding_seconds")
+
+    all_embeddings = [r if r is not None else computed.get(t) for t, r in zip(texts, results)]
+    failed_indices = [i for i, e in enumerate(all_embeddings) if e is None]
+    if failed_indices:
+        logger.warning(f"向量生成不完整：预期 {len(texts)} 个，失败 {len(failed_indices)} 个，"
+                       f"失败的文本下标: {failed_indices[:50]}{'...' if len(failed_indices) > 50 else ''}")
     return all_embeddings
 
 
-def call_qwen_model(prompt: str, model: str = "qwen-turbo", temperature: float = 0.1) -> str:
-    """调用通义千问模型"""
-    # ... (此处代码与原文件中的 call_qwen_model 完全相同) ...
+def get_embedding_cache_stats() -> dict:
+    """返回向量缓存的命中/未命中统计"""
+    if not embedding_cache:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
+
+
+def _llm_cache_key(prompt: str, model: str, temperature: float) -> str:
+    payload = json.dumps([SYSTEM_PROMPT, prompt, model, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def call_qwen_model(prompt: str, model: str = "qwen-turbo", temperature: float = 0.1, use_cache: bool = True) -> str:
+    """调用通义千问模型，命中响应缓存时直接返回；use_cache=False 时强制请求模型"""
+    cache = llm_response_cache if use_cache else None
+    cache_key = _llm_cache_key(prompt, model, temperature) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Qwen模型({model})命中响应缓存。")
+            return cached
+
     logger.info(f"调用Qwen模型({model})，温度系数: {temperature}")
     start_time = time.time()
     try:
-        response = Generation.call(
+        response = _get_dashscope().Generation.call(
             model=model,
             messages=[
-                {"role": "system", "content": "你是一个专业的AI法律助手，精通中国法律，特别是合同法和民法典。你的回答必须严格遵循用户的指令，尤其是格式要求。"},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=temperature,
@@ -73,11 +221,20 @@ def call_qwen_model(prompt: str, model: str = "qwen-turbo", temperature: float =
         )
         if response.status_code == 200:
             content = response.output.choices[0]['message']['content']
-            log_time(start_time, f"Qwen({model})模型调用")
+            log_time(start_time, f"Qwen({model})模型调用", metric="llm_call_seconds", model=model, status="ok")
+            if cache and content:
+                cache.set(cache_key, content)
             return content
-        else:
-            logger.error(f"模型调用失败: Code: {response.status_code}, Message: {response.message}")
-            return ""
+        logger.error(f"模型调用失败: Code: {response.status_code}, Message: {response.message}")
     except Exception as e:
         logger.error(f"模型调用异常: {str(e)}", exc_info=True)
-        return ""
\ No newline at end of file
+    metrics.observe("llm_call_seconds", time.time() - start_time, model=model, status="error")
+    metrics.inc("errors_total", component="llm")
+    return ""
+
+
+def get_llm_cache_stats() -> dict:
+    """返回模型响应缓存的命中/未命中统计"""
+    if not llm_response_cache:
+        return {"enabled": False}
+    return {"enabled": True, **llm_response_cache.stats()}
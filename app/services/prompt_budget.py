@@ -0,0 +1,146 @@
+# 文件名: app/services/prompt_budget.py
+import re
+import math
+import logging
+from collections import Counter
+from app.utils.helpers import CLAUSE_HEADING_PATTERN
+from app.utils.pdf import PAGE_BREAK
+from config import LLM_MODEL_PROFILES, LLM_STAGE_MODELS, LLM_OUTPUT_RESERVE_TOKENS, TOKEN_ESTIMATE_SAFETY
+
+logger = logging.getLogger(__name__)
+
+# 本地 token 估算：通义千问分词器中常用汉字约 1 字 1 token，英文单词约 4 字母 1 token，数字约 3 位 1 token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_WORD_PATTERN = re.compile(r"[A-Za-z]+")
+_DIGIT_PATTERN = re.compile(r"\d+")
+_OTHER_PATTERN = re.compile(r"[^\sA-Za-z\d\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+# 页码行：“第 3 页 共 10 页”、“- 3 -”、“3/10”、“Page 3 of 10”、单独的数字
+_PAGE_NUMBER_PATTERN = re.compile(
+    r"^\s*(第\s*\d+\s*页\s*([,，/]?\s*共\s*\d+\s*页)?|[-—–]\s*\d+\s*[-—–]|\d+\s*/\s*\d+|(page\s*)?\d+(\s*of\s*\d+)?)\s*$",
+    re.IGNORECASE
+)
+_NO_MORE_TEXT_PATTERN = re.compile(r"[（(]?\s*以下无正文\s*[)）]?")
+_SIGNATURE_PATTERN = re.compile(r"盖章|签字|签章|签署|法定代表人|授权代表|委托代理人|公章|年\s*月\s*日|日\s*期")
+_PAGE_EDGE_LINES = 2          # 每页首、尾各取几行（不含页码行）判断页眉/页脚
+_MIN_HEADER_PAGE_RATIO = 0.5  # 在至少该比例的页首或页尾重复出现的短行视为页眉/页脚
+_MAX_HEADER_CHARS = 50
+_MAX_SIGNATURE_LINE_CHARS = 60
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的 token 数，不调用分词接口"""
+    if not text:
+        return 0
+    return (len(_CJK_PATTERN.findall(text))
+            + sum(math.ceil(len(word) / 4) for word in _WORD_PATTERN.findall(text))
+            + sum(math.ceil(len(digits) / 3) for digits in _DIGIT_PATTERN.findall(text))
+            + len(_OTHER_PATTERN.findall(text)))
+
+
+def _page_edges(lines: list[str]) -> set[int]:
+    """一页中首、尾各 _PAGE_EDGE_LINES 个非空且非页码行的行号"""
+    content = [i for i, line in enumerate(lines) if line.strip() and not _PAGE_NUMBER_PATTERN.match(line)]
+    return set(content[:_PAGE_EDGE_LINES] + content[-_PAGE_EDGE_LINES:])
+
+
+def _page_headers(pages: list[list[str]]) -> set[str]:
+    """在足够多页的页首或页尾重复出现的短行（页眉/页脚）；不足两页时无法区分，返回空集"""
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for lines in pages:
+        counts.update({lines[i].strip() for i in _page_edges(lines)})
+    min_pages = max(2, math.ceil(len(pages) * _MIN_HEADER_PAGE_RATIO))
+    return {line for line, n in counts.items() if n >= min_pages and 4 <= len(line) <= _MAX_HEADER_CHARS}
+
+
+def strip_boilerplate(text: str) -> str:
+    """
+    去除合同文本中与审查无关的内容：页码行、页眉页脚、“以下无正文”之后及末尾的签署栏。
+    页眉页脚按页识别（页间以 PAGE_BREAK 分隔）：只去除在至少半数页的页首或页尾重复出现的短行，
+    正文中反复出现的“甲方（盖章）：”、表格行等不受影响；没有分页信息的文本不做页眉页脚去除。
+    合同开头的合同方信息不受影响。
+    """
+    pages = [page.splitlines() for page in text.split(PAGE_BREAK)]
+    headers = _page_headers(pages)
+    kept = []
+    for lines in pages:
+        edges = _page_edges(lines) if headers else set()
+        kept.extend(line for i, line in enumerate(lines)
+                    if not _PAGE_NUMBER_PATTERN.match(line) and not (i in edges and line.strip() in headers))
+
+    # 后半部分出现“以下无正文”时，其后均为签署栏
+    for i, line in enumerate(kept):
+        if i >= len(kept) // 2 and _NO_MORE_TEXT_PATTERN.search(line):
+            kept = kept[:i]
+            break
+    else:
+        # 末尾由短行组成且包含至少两处签署字样的部分视为签署栏
+        cut, signature_lines = len(kept), 0
+        for i in range(len(kept) - 1, -1, -1):
+            line = kept[i].strip()
+            # 条款正文（条款编号开头或以句末标点结尾）不属于签署栏，即使其中提到“签字盖章”
+            if len(line) > _MAX_SIGNATURE_LINE_CHARS or CLAUSE_HEADING_PATTERN.match(line) or line.endswith(("。", "；", ";")):
+                break
+            if _SIGNATURE_PATTERN.search(line):
+                signature_lines += 1
+                cut = i
+            elif line and not line.endswith(("：", ":")) and signature_lines == 0:
+                break
+        if signature_lines >= 2:
+            kept = kept[:cut]
+    return "\n".join(kept).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到约 max_tokens 个 token 以内（按估算值二分查找截断位置）"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def take_within_budget(docs: list[str], max_tokens: int) -> list[str]:
+    """按顺序保留文档直到总 token 数达到预算，至少保留一条"""
+    kept, used = [], 0
+    for doc in docs:
+        tokens = estimate_tokens(doc)
+        if kept and used + tokens > max_tokens:
+            break
+        kept.append(doc)
+        used += tokens
+    return kept
+
+
+def max_input_tokens(stage: str) -> int:
+    """该阶段可用模型中最大的输入 token 容量（已扣除输出预留并考虑估算误差）"""
+    largest = max(LLM_MODEL_PROFILES[name]["context_tokens"] for name in LLM_STAGE_MODELS[stage])
+    return int((largest - LLM_OUTPUT_RESERVE_TOKENS[stage]) / TOKEN_ESTIMATE_SAFETY)
+
+
+def select_model(stage: str, prompt_tokens: int) -> str:
+    """在该阶段允许的模型中选择上下文窗口放得下的最便宜模型；都放不下时选窗口最大的模型"""
+    needed = prompt_tokens * TOKEN_ESTIMATE_SAFETY + LLM_OUTPUT_RESERVE_TOKENS[stage]
+    candidates = [(name, LLM_MODEL_PROFILES[name]) for name in LLM_STAGE_MODELS[stage]]
+    fitting = [(name, profile) for name, profile in candidates if needed <= profile["context_tokens"]]
+    if fitting:
+        return min(fitting, key=lambda item: item[1]["cost"])[0]
+    name = max(candidates, key=lambda item: item[1]["context_tokens"])[0]
+    logger.warning(f"[{stage}] 提示词约 {prompt_tokens} tokens，超出所有可用模型的上下文窗口，使用 {name}。")
+    return name
+
+
+def plan_prompt(stage: str, prompt: str, parts: dict = None) -> str:
+    """估算提示词 token 数并选择模型，同时记录各组成部分的 token 数，返回模型名"""
+    prompt_tokens = estimate_tokens(prompt)
+    model = select_model(stage, prompt_tokens)
+    detail = "，".join(f"{name} {estimate_tokens(text)}" for name, text in (parts or {}).items())
+    logger.info(f"[{stage}] 提示词约 {prompt_tokens} tokens{f'（{detail}）' if detail else ''}，选用模型 {model}。")
+    return model
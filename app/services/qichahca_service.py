@@ -6,6 +6,18 @@ import hashlib
 import json
 import os
 import logging
+import threading
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    QICHACHA_BASE_URL, QICHACHA_TIMEOUT_SECONDS, QICHACHA_POOL_SIZE,
+    QICHACHA_RATE_LIMIT_RPS, QICHACHA_RATE_LIMIT_BURST,
+    QICHACHA_CACHE_ENABLED, QICHACHA_CACHE_PATH, QICHACHA_CACHE_TTL_SECONDS, QICHACHA_CACHE_MAX_ENTRIES
+)
+from app.services.cache import PersistentTTLCache
+from app.utils.rate_limit import TokenBucket
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -16,49 +28,154 @@ logger = logging.getLogger(__name__)
 # export QICHACHA_SECRET_KEY="your_secret_key"
 APP_KEY = os.environ.get("QICHACHA_APP_KEY", "appKey")      # 替换为你的 AppKey
 SECRET_KEY = os.environ.get("QICHACHA_SECRET_KEY", "secretKey") # 替换为你的 SecretKey
-BASE_URL = "http://api.qichacha.com/ECIV4/GetBasicDetailsByName"  # 企业工商信息查询接口
+BASE_URL = QICHACHA_BASE_URL  # 企业工商信息查询接口，测试时可指向本地桩服务（scripts/qichacha_stub_server.py）
+
+
+def normalize_company_name(company_name: str) -> str:
+    """缓存键：去除首尾空白并统一中英文括号，避免同一公司因写法不同而重复查询"""
+    return company_name.strip().replace("(", "（").replace(")", "）")
+
+
+class QichachaClient:
+    """
+    企查查工商信息查询客户端。
+    - 复用带连接池的 requests.Session，对 502/503/504 自动重试；
+    - 成功结果按公司名写入持久化 TTL 缓存，重复审查同一交易对手时不再访问网络；
+    - 同一公司名的并发查询合并为一次请求，其余调用方等待同一结果；
+    - 发起请求前经过令牌桶限流，避免超出付费配额。
+    """
+    def __init__(self, app_key: str, secret_key: str, base_url: str, timeout: float = QICHACHA_TIMEOUT_SECONDS,
+                 cache: PersistentTTLCache = None, rate_limiter: TokenBucket = None, pool_size: int = QICHACHA_POOL_SIZE):
+        self.app_key = app_key
+        self.secret_key = secret_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests_sent = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self.app_key != "appKey" and self.secret_key != "secretKey"
+
+    def _auth_headers(self) -> dict:
+        timespan = str(int(time.time()))
+        token = self.app_key + timespan + self.secret_key
+        hl = hashlib.md5()
+        hl.update(token.encode(encoding='utf-8'))
+        return {'Token': hl.hexdigest().upper(), 'Timespan': timespan}
+
+    def _fetch(self, company_name: str) -> dict:
+        """实际调用接口。返回公司信息，失败时返回包含 'error' 键的字典"""
+        params = {'key': self.app_key, 'keyword': company_name}
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        response = None
+        try:
+            logger.info(f"正在向企查查查询公司信息: {company_name}")
+            with self._lock:
+                self.requests_sent += 1
+            with metrics.timer("qichacha_lookup_seconds"):
+                response = self.session.get(self.base_url, params=params, headers=self._auth_headers(),
+                                            timeout=self.timeout)
+            response.raise_for_status()  # 如果状态码不是 2xx，则抛出异常
+
+            result_data = response.json()
+
+            if result_data.get("Status") == "200":
+                logger.info(f"成功获取到 '{company_name}' 的信息。")
+                return result_data.get("Result", {})
+            else:
+                error_message = result_data.get("Message", "未知错误")
+                logger.error(f"企查查 API 返回错误: {error_message} (公司: {company_name})")
+                metrics.inc("errors_total", component="qichacha")
+                return {"error": f"Qichacha API error: {error_message}"}
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"请求企查查 API 时发生网络错误: {e}", exc_info=True)
+            metrics.inc("errors_total", component="qichacha")
+            return {"error": f"Network error when calling Qichacha API: {str(e)}"}
+        except json.JSONDecodeError:
+            logger.error(f"解析企查查 API 响应失败。响应内容: {response.text if response is not None else ''}", exc_info=True)
+            metrics.inc("errors_total", component="qichacha")
+            return {"error": "Failed to parse response from Qichacha API."}
+
+    def get_company_info(self, company_name: str, use_cache: bool = True) -> dict:
+        """
+        根据公司名称获取工商信息。
+        :return: 包含公司信息的字典，如果失败则返回包含 'error' 键的字典（失败结果不缓存）。
+        """
+        if not self.configured:
+            logger.error("企查查 API Key 或 Secret Key 未配置。请将其设置为环境变量。")
+            return {"error": "Qichacha API service is not configured on the server."}
+
+        key = normalize_company_name(company_name)
+        if use_cache and self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"企查查查询命中缓存: {key}")
+                return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not owner:
+            logger.info(f"'{key}' 的查询正在进行中，等待其结果。")
+            return future.result()
+
+        try:
+            result = self._fetch(key)
+            if "error" not in result and self.cache:
+                self.cache.set(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"requests_sent": self.requests_sent, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+        stats["cache"] = self.cache.stats() if self.cache else None
+        return stats
+
+
+qichacha_client = QichachaClient(
+    APP_KEY, SECRET_KEY, BASE_URL,
+    cache=PersistentTTLCache(QICHACHA_CACHE_PATH, QICHACHA_CACHE_TTL_SECONDS, QICHACHA_CACHE_MAX_ENTRIES)
+    if QICHACHA_CACHE_ENABLED else None,
+    rate_limiter=TokenBucket(QICHACHA_RATE_LIMIT_RPS, QICHACHA_RATE_LIMIT_BURST)
+)
+metrics.register_cache("qichacha", qichacha_client.cache)
+
 
 def get_company_info(company_name: str) -> dict:
     """
-    调用企查查API，根据公司名称获取工商信息。
+    调用企查查API，根据公司名称获取工商信息（经由共享客户端，带缓存、限流与并发合并）。
     :param company_name: 公司全称
     :return: 包含公司信息的字典，如果失败则返回包含 'error' 键的字典。
     """
-    if APP_KEY == "appKey" or SECRET_KEY == "secretKey":
-        logger.error("企查查 API Key 或 Secret Key 未配置。请将其设置为环境变量。")
-        return {"error": "Qichacha API service is not configured on the server."}
-
-    timespan = str(int(time.time()))
-    token = APP_KEY + timespan + SECRET_KEY
-    
-    hl = hashlib.md5()
-    hl.update(token.encode(encoding='utf-8'))
-    token_md5 = hl.hexdigest().upper()
-    
-    headers = {'Token': token_md5, 'Timespan': timespan}
-    params = {'key': APP_KEY, 'keyword': company_name}
-    
-    try:
-        logger.info(f"正在向企查查查询公司信息: {company_name}")
-        response = requests.get(BASE_URL, params=params, headers=headers, timeout=10)
-        response.raise_for_status()  # 如果状态码不是 2xx，则抛出异常
-        
-        result_data = response.json()
-        
-        if result_data.get("Status") == "200":
-            logger.info(f"成功获取到 '{company_name}' 的信息。")
-            return result_data.get("Result", {})
-        else:
-            error_message = result_data.get("Message", "未知错误")
-            logger.error(f"企查查 API 返回错误: {error_message} (公司: {company_name})")
-            return {"error": f"Qichacha API error: {error_message}"}
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"请求企查查 API 时发生网络错误: {e}", exc_info=True)
-        return {"error": f"Network error when calling Qichacha API: {str(e)}"}
-    except json.JSONDecodeError:
-        logger.error(f"解析企查查 API 响应失败。响应内容: {response.text}", exc_info=True)
-        return {"error": "Failed to parse response from Qichacha API."}
+    return qichacha_client.get_company_info(company_name)
+
+
+def get_qichacha_stats() -> dict:
+    return qichacha_client.stats()
 
 def format_company_info_for_llm(info: dict) -> str:
     """
@@ -81,5 +198,5 @@ def format_company_info_for_llm(info: dict) -> str:
     revoke_info = info.get('RevokeInfo')
     if revoke_info and (revoke_info.get('CancelDate') or revoke_info.get('RevokeDate')):
         profile_parts.append(f"注销/吊销信息: {json.dumps(revoke_info, ensure_ascii=False)}")
-        
-    return "\n".join(profile_parts)
\ No newline at end of file
+
+    return "\n".join(profile_parts)
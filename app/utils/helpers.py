@@ -1,33 +1,200 @@
 # 文件名: app/utils/helpers.py
 import os
+import re
 import time
+import shutil
 import logging
-from PyPDF2 import PdfReader
-from config import Config
+import tempfile
+from config import Config, CLAUSE_MAX_CHARS, UPLOAD_SPOOL_MAX_BYTES
+from app.utils.pdf import PAGE_BREAK, extract_pages, get_extractor
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
-def log_time(start_time, operation_name):
-    """记录操作耗时"""
+# 条款标题：行首的“第X条”、“一、”、“1.”或“2.1 ”等编号（编号后不能紧跟数字，避免误匹配“1.5万元”）
+CLAUSE_HEADING_PATTERN = re.compile(
+    r"^[ \t\u3000]*(?:第[一二三四五六七八九十百千零〇两\d]+条|[一二三四五六七八九十]+、|\d{1,3}(?:\.\d{1,3})+[、.．\s]|\d{1,3}[、.．](?!\d))",
+    re.MULTILINE
+)
+
+# 法条引用，如“第五百八十五条”“第585条”
+ARTICLE_REF_PATTERN = re.compile(r"第([一二三四五六七八九十百千零〇两\d]{1,8})条")
+# 紧接在法条引用之前的法律名称结尾，如“《民法典》”“民法典”“合同法”“司法解释”“合同编”
+_STATUTE_NAME_PATTERN = re.compile(r"(?:》|法|法典|编|条例|规定|解释|办法)\s*$")
+# 同一法律连续引用多条时条号之间的连接，如“第五百七十七条、第五百八十五条”“第三条第二款和第五条”
+_ARTICLE_REF_JOINER_PATTERN = re.compile(r"^(?:第[一二三四五六七八九十百千零〇两\d]+[款项])*\s*(?:、|，|,|和|及|与|或|以及)\s*$")
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+def log_time(start_time, operation_name, metric: str = None, **labels):
+    """记录操作耗时；提供 metric 时同时计入该名称的耗时直方图（labels 为直方图标签）"""
     elapsed_time = time.time() - start_time
     logger.info(f"{operation_name} 耗时: {elapsed_time:.2f} 秒")
+    if metric:
+        metrics.observe(metric, elapsed_time, **labels)
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """从 PDF 文件中提取文本"""
-    if not os.path.exists(pdf_path):
-        logger.error(f"PDF文件未找到: {pdf_path}")
+def _describe_source(source) -> str:
+    return source if isinstance(source, str) else "内存中的 PDF"
+
+def file_signature(path: str):
+    """
+    文件的 (inode, 修改时间, 大小)，不存在时返回 None。
+    索引文件均以“写临时文件再替换”的方式更新，签名变化即说明文件已被（其他进程）重写或删除。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def extract_text_from_pdf(source) -> str:
+    """
+    从 PDF 中提取文本（每页只解析一次，大文件按页码区间多进程并行，结果按文件哈希缓存）。
+    source 可以是文件路径、字节串或可定位的二进制流。
+    """
+    if isinstance(source, str) and not os.path.exists(source):
+        logger.error(f"PDF文件未找到: {source}")
         return ""
     try:
-        logger.info(f"正在从 {pdf_path} 提取文本...")
-        reader = PdfReader(pdf_path)
-        text = "".join(page.extract_text() for page in reader.pages if page.extract_text())
+        logger.info(f"正在从 {_describe_source(source)} 提取文本...")
+        start_time = time.time()
+        text = PAGE_BREAK.join(extract_pages(source))
+        log_time(start_time, "PDF文本提取", metric="pdf_extract_seconds")
         logger.info(f"文本提取成功，共 {len(text)} 字符。")
         return text
     except Exception as e:
         logger.error(f"提取PDF文本失败: {e}", exc_info=True)
+        metrics.inc("errors_total", component="pdf")
         return ""
 
+def iter_pdf_pages(source):
+    """
+    逐页读取 PDF 文本，以生成器形式产出 (页码, 文本)，页码从 1 开始；不会一次性把整份文档的文本读入内存。
+    source 可以是文件路径、字节串或可定位的二进制流。
+    """
+    if isinstance(source, str) and not os.path.exists(source):
+        logger.error(f"PDF文件未找到: {source}")
+        return
+    try:
+        logger.info(f"正在从 {_describe_source(source)} 逐页提取文本...")
+        for page_no, page_text in enumerate(get_extractor().iter_pages(source), start=1):
+            yield page_no, page_text
+    except Exception as e:
+        logger.error(f"提取PDF文本失败: {e}", exc_info=True)
+
+def parse_chinese_number(text: str):
+    """将“五百八十五”“一百零五”“十二”或阿拉伯数字解析为整数，无法解析（含空串）时返回 None"""
+    if not text:
+        return None
+    # isdigit 对“²”等上标数字也返回 True，但 int 无法解析它们；isdecimal 只接受十进制数字（含全角）
+    if text.isdecimal():
+        try:
+            return int(text)
+        except ValueError:  # 位数超出 int 字符串转换上限
+            return None
+    total, digit = 0, 0
+    for ch in text:
+        if ch in _CN_DIGITS:
+            digit = _CN_DIGITS[ch]
+        elif ch in _CN_UNITS:
+            total += (digit or 1) * _CN_UNITS[ch]
+            digit = 0
+        else:
+            return None
+    return total + digit
+
+def find_article_refs(text: str) -> list[int]:
+    """找出文本中引用的全部法条序号（去重、按出现顺序）"""
+    refs = []
+    for match in ARTICLE_REF_PATTERN.finditer(text or ""):
+        number = parse_chinese_number(match.group(1))
+        if number and number not in refs:
+            refs.append(number)
+    return refs
+
+def find_statute_refs(text: str) -> list[int]:
+    """
+    找出文本中与法律名称相连的法条引用（去重、按出现顺序），如“《民法典》第五百八十五条”“依据合同法第107条、第108条”。
+    合同自身的条款编号与内部引用（“第一条 合同标的”“本合同第三条”）不计入。
+    """
+    text = text or ""
+    refs, prev_end, prev_cited = [], 0, False
+    for match in ARTICLE_REF_PATTERN.finditer(text):
+        if prev_cited and _ARTICLE_REF_JOINER_PATTERN.match(text[prev_end:match.start()]):
+            cited = True
+        else:
+            cited = bool(_STATUTE_NAME_PATTERN.search(text[max(0, match.start() - 10):match.start()]))
+        prev_end, prev_cited = match.end(), cited
+        number = parse_chinese_number(match.group(1)) if cited else None
+        if number and number not in refs:
+            refs.append(number)
+    return refs
+
 def allowed_file(filename: str) -> bool:
     """检查文件扩展名是否被允许"""
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
\ No newline at end of file
+           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+
+def spool_upload(file, max_size: int = UPLOAD_SPOOL_MAX_BYTES) -> tempfile.SpooledTemporaryFile:
+    """
+    将上传文件复制到 SpooledTemporaryFile 并回到开头：不超过 max_size（默认 UPLOAD_SPOOL_MAX_BYTES）时留在内存中，
+    超过时才转存为匿名临时文件（名称唯一，关闭即删除）。用完后由调用方关闭。
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=max(1, max_size))
+    shutil.copyfileobj(file.stream, buffer, 1024 * 1024)
+    buffer.seek(0)
+    return buffer
+
+def split_long_segment(segment: str, max_chars: int) -> list[str]:
+    """将超长条款按句号切分为不超过 max_chars 的片段，必要时硬切"""
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[。；;])", segment):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if len(current) + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current.strip():
+        pieces.append(current)
+    return [p.strip() for p in pieces if p.strip()]
+
+def split_contract_clauses(text: str, max_chars: int = CLAUSE_MAX_CHARS, min_chars: int = 20) -> list[str]:
+    """
+    按“第X条”或编号标题将合同切分为条款列表。
+    过短的片段（通常是单独的章节标题）会并入下一条款；超长条款会按句子再切分。
+    找不到任何条款标题时，按句子切分为固定长度的片段。
+    """
+    if not text or not text.strip():
+        return []
+    starts = [m.start() for m in CLAUSE_HEADING_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+
+    segments, carry = [], ""
+    for begin, end in zip(starts, starts[1:]):
+        segment = carry + text[begin:end]
+        if len(segment.strip()) < min_chars:
+            carry = segment
+            continue
+        carry = ""
+        segments.append(segment.strip())
+    if carry.strip():
+        if segments:
+            segments[-1] = segments[-1] + "\n" + carry.strip()
+        else:
+            segments.append(carry.strip())
+
+    clauses = []
+    for segment in segments:
+        if len(segment) > max_chars:
+            clauses.extend(split_long_segment(segment, max_chars))
+        else:
+            clauses.append(segment)
+    return clauses
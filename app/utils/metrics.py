@@ -0,0 +1,331 @@
+# 文件名: app/utils/metrics.py
+"""
+进程内指标：计数器、仪表盘与耗时直方图，以 Prometheus 文本格式由 /metrics 接口输出。
+
+多进程部署（gunicorn）时每个工作进程各自计数，并每隔 METRICS_FLUSH_SECONDS 秒将快照写入
+METRICS_DIR/<pid>.json；/metrics 汇总所有仍在更新的进程快照，因此无论请求落到哪个工作进程，
+返回的都是整个服务的指标。已退出进程的计数器与直方图累加到 METRICS_DIR/archived.json 后再删除其快照，
+工作进程重启不会使汇总的计数器变小；仪表盘只反映存活进程，随进程退出丢弃。
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from config import METRICS_DIR, METRICS_FLUSH_SECONDS, METRICS_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "contract_review_"
+
+_SNAPSHOT_NAME = re.compile(r"^\d+\.json$")
+_ARCHIVE_FILE = "archived.json"  # 已退出进程累计的计数器与直方图
+_LOCK_FILE = ".lock"             # 汇总与归档快照时持有的目录锁，避免多个进程重复归档同一快照
+
+# 耗时直方图的桶（秒），覆盖毫秒级的向量检索到分钟级的整份合同审查
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 指标说明，未列出的指标以名称作为说明
+_HELP = {
+    "stage_seconds": "合同审查各阶段耗时（秒）",
+    "pdf_extract_seconds": "PDF 文本提取耗时（秒）",
+    "embedding_seconds": "一次 get_embeddings 调用的总耗时（秒）",
+    "embedding_batch_seconds": "单个向量生成批次的接口调用耗时（秒）",
+    "llm_call_seconds": "每次通义千问模型调用耗时（秒）",
+    "vector_search_seconds": "向量检索耗时（秒）",
+    "collection_load_seconds": "Milvus 集合加载耗时（秒）",
+    "qichacha_lookup_seconds": "企查查接口查询耗时（秒）",
+    "http_request_seconds": "HTTP 请求处理耗时（秒）",
+    "http_requests_total": "HTTP 请求数",
+    "http_requests_in_flight": "正在处理的 HTTP 请求数",
+    "errors_total": "各组件的错误次数",
+    "retries_total": "各组件的重试次数",
+    "cache_hits_total": "各缓存的命中次数",
+    "cache_misses_total": "各缓存的未命中次数",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表。指标在首次记录时自动创建，名称不含 PREFIX 前缀"""
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}     # (名称, 标签) -> 值
+        self._gauges = {}       # (名称, 标签) -> 值
+        self._histograms = {}   # (名称, 标签) -> [各桶计数, 总和, 次数]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_gauge(self, name: str, delta: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """记录代码块的耗时（异常退出时同样记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_collector(self, collector):
+        """注册在生成快照时调用的函数，返回 [(计数器名称, 标签字典, 值)]，用于导出已有组件自带的统计"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        counters = {}
+        for collector in list(self._collectors):
+            try:
+                for name, labels, value in collector():
+                    counters[(name, _label_key(labels))] = value
+            except Exception as e:
+                logger.warning(f"采集指标失败: {e}")
+        with self._lock:
+            counters.update(self._counters)
+            return {
+                "buckets": list(self.buckets),
+                "counters": [[name, list(map(list, labels)), value] for (name, labels), value in counters.items()],
+                "gauges": [[name, list(map(list, labels)), value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, list(map(list, labels)), list(h[0]), h[1], h[2]]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+
+def _merge(snapshots: list[dict]):
+    """合并多个快照，同名同标签的数值相加，返回 (计数器, 仪表盘, 直方图)；桶边界与 DEFAULT_BUCKETS 不同的直方图忽略"""
+    counters, gauges, histograms = {}, {}, {}
+    buckets = DEFAULT_BUCKETS
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snap["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+        if tuple(snap["buckets"]) != tuple(buckets):
+            continue
+        for name, labels, bucket_counts, total, count in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], bucket_counts)]
+            merged[1] += total
+            merged[2] += count
+    return counters, gauges, histograms
+
+
+def render(snapshots: list[dict]) -> str:
+    """将一个或多个进程的快照合并（同名同标签的数值相加）并输出为 Prometheus 文本格式"""
+    counters, gauges, histograms = _merge(snapshots)
+    buckets = DEFAULT_BUCKETS
+    lines = []
+
+    def header(name: str, metric_type: str):
+        lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+
+    for metric_type, samples in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({name for name, _ in samples}):
+            header(name, metric_type)
+            for (sample_name, labels), value in sorted(samples.items()):
+                if sample_name == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+    for name in sorted({name for name, _ in histograms}):
+        header(name, "histogram")
+        for (sample_name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+            if sample_name != name:
+                continue
+            for bound, bucket_count in zip(buckets, bucket_counts):
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {bucket_count}")
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {repr(float(total))}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# --- 进程级注册表 ---
+registry = MetricsRegistry()
+inc = registry.inc
+add_gauge = registry.add_gauge
+observe = registry.observe
+timer = registry.timer
+register_collector = registry.register_collector
+
+_flusher_started = False
+_flusher_lock = threading.Lock()
+
+
+def register_cache(name: str, cache):
+    """导出缓存对象 stats() 中的 hits / misses 为 cache_hits_total / cache_misses_total 计数器"""
+    if cache is None:
+        return
+
+    def collect():
+        stats = cache.stats()
+        return [("cache_hits_total", {"cache": name}, stats["hits"]),
+                ("cache_misses_total", {"cache": name}, stats["misses"])]
+    register_collector(collect)
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def flush():
+    """将本进程的指标快照写入 METRICS_DIR"""
+    if not METRICS_DIR:
+        return
+    path = _snapshot_path(os.getpid())
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"写入指标快照失败: {e}")
+
+
+def start_flusher():
+    """启动定期写入快照的后台线程（每个进程一次）；未配置 METRICS_DIR 时不启动"""
+    global _flusher_started
+    if not METRICS_DIR:
+        return
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+
+    def run():
+        while True:
+            flush()
+            time.sleep(METRICS_FLUSH_SECONDS)
+    threading.Thread(target=run, name="metrics-flusher", daemon=True).start()
+
+
+@contextmanager
+def _dir_lock():
+    with open(os.path.join(METRICS_DIR, _LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _archive(archived: dict, stale_paths: list[str]) -> dict:
+    """
+    将已退出进程的快照中的计数器与直方图累加到归档快照，写入成功后删除这些快照（仪表盘直接丢弃），返回新的归档快照。
+    调用方持有目录锁；归档写入失败时保留原快照，下次汇总时重试。
+    """
+    snapshots = [archived] if archived else []
+    for path in stale_paths:
+        try:
+            snapshots.append(_read_snapshot(path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取已退出进程的指标快照 {os.path.basename(path)} 失败，将直接删除: {e}")
+    counters, _, histograms = _merge(snapshots)
+    archived = {
+        "buckets": list(DEFAULT_BUCKETS),
+        "counters": [[name, list(map(list, labels)), value] for (name, labels), value in counters.items()],
+        "gauges": [],
+        "histograms": [[name, list(map(list, labels)), h[0], h[1], h[2]] for (name, labels), h in histograms.items()],
+    }
+    path = os.path.join(METRICS_DIR, _ARCHIVE_FILE)
+    try:
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(archived, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"归档已退出进程的指标失败: {e}")
+        return archived
+    for stale_path in stale_paths:
+        try:
+            os.remove(stale_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除已归档的指标快照 {os.path.basename(stale_path)} 失败: {e}")
+    return archived
+
+
+def render_all() -> str:
+    """
+    输出整个服务的指标：本进程的实时数据、其他进程最近写入的快照，以及已退出进程的归档计数。
+    超过 METRICS_STALE_SECONDS 未更新的快照视为已退出的进程，归档后删除。
+    """
+    own = registry.snapshot()
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return render([own])
+    snapshots, stale, now = [own], [], time.time()
+    own_name = f"{os.getpid()}.json"
+    with _dir_lock():
+        for name in os.listdir(METRICS_DIR):
+            if not _SNAPSHOT_NAME.match(name) or name == own_name:
+                continue
+            path = os.path.join(METRICS_DIR, name)
+            try:
+                if now - os.path.getmtime(path) > METRICS_STALE_SECONDS:
+                    stale.append(path)
+                    continue
+                snapshots.append(_read_snapshot(path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取指标快照 {name} 失败: {e}")
+        archive_path = os.path.join(METRICS_DIR, _ARCHIVE_FILE)
+        archived = None
+        if os.path.exists(archive_path):
+            try:
+                archived = _read_snapshot(archive_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取归档指标失败: {e}")
+        if stale:
+            archived = _archive(archived, stale)
+    if archived:
+        snapshots.append(archived)
+    return render(snapshots)
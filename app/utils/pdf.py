@@ -0,0 +1,188 @@
+# 文件名: app/utils/pdf.py
+import io
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    PDF_EXTRACTOR_BACKEND, PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES,
+    PDF_PAGE_CACHE_MAX_FILES, PDF_PAGE_CACHE_TTL_SECONDS
+)
+from app.services.cache import TTLCache
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 拼接整份文档文本时的页间分隔符（换页符），strip_boilerplate 据此按页识别页眉页脚
+PAGE_BREAK = "\f"
+
+
+def _rewind(source):
+    """可定位的二进制流在每次读取前回到开头，路径与字节串原样返回"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def read_source_bytes(source) -> bytes:
+    """读出 PDF 的全部字节：source 可以是文件路径、字节串或可定位的二进制流"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return _rewind(source).read()
+
+
+class PdfExtractor:
+    """
+    PDF 文本提取后端接口。新增后端只需实现以下方法并注册到 EXTRACTORS。
+    source 可以是文件路径、字节串或可定位的二进制流（如上传文件的内存缓冲），无需先写入磁盘。
+    """
+    name = "base"
+
+    def page_count(self, source) -> int:
+        raise NotImplementedError
+
+    def iter_pages(self, source, start: int = 0, end: int = None):
+        """按顺序产出 [start, end) 范围内每页的文本（空白页为空字符串）"""
+        raise NotImplementedError
+
+    def extract_pages(self, source, start: int = 0, end: int = None) -> list[str]:
+        return list(self.iter_pages(source, start, end))
+
+
+class PyPDF2Extractor(PdfExtractor):
+    name = "pypdf2"
+
+    @staticmethod
+    def _reader(source):
+        from PyPDF2 import PdfReader
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        return PdfReader(_rewind(source))
+
+    def page_count(self, source) -> int:
+        return len(self._reader(source).pages)
+
+    def iter_pages(self, source, start: int = 0, end: int = None):
+        reader = self._reader(source)
+        end = len(reader.pages) if end is None else min(end, len(reader.pages))
+        for i in range(start, end):
+            # 每页只调用一次 extract_text
+            yield reader.pages[i].extract_text() or ""
+
+
+class PyMuPDFExtractor(PdfExtractor):
+    """基于 PyMuPDF (fitz) 的后端，通常比 PyPDF2 快一个数量级；未安装时不可用"""
+    name = "pymupdf"
+
+    @staticmethod
+    def _open(source):
+        import fitz
+        if isinstance(source, str):
+            return fitz.open(source)
+        return fitz.open(stream=read_source_bytes(source), filetype="pdf")
+
+    def page_count(self, source) -> int:
+        with self._open(source) as doc:
+            return doc.page_count
+
+    def iter_pages(self, source, start: int = 0, end: int = None):
+        with self._open(source) as doc:
+            end = doc.page_count if end is None else min(end, doc.page_count)
+            for i in range(start, end):
+                yield doc.load_page(i).get_text() or ""
+
+
+EXTRACTORS = {
+    PyPDF2Extractor.name: PyPDF2Extractor,
+    PyMuPDFExtractor.name: PyMuPDFExtractor,
+}
+
+
+def get_extractor(backend: str = None) -> PdfExtractor:
+    backend = backend or PDF_EXTRACTOR_BACKEND
+    if backend not in EXTRACTORS:
+        raise ValueError(f"未知的 PDF 提取后端: {backend}，可选: {list(EXTRACTORS)}")
+    return EXTRACTORS[backend]()
+
+
+# 以文件内容哈希缓存逐页提取结果，同一文件重复上传时无需再次解析
+_page_cache = TTLCache(PDF_PAGE_CACHE_MAX_FILES, PDF_PAGE_CACHE_TTL_SECONDS)
+metrics.register_cache("pdf_pages", _page_cache)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """惰性创建共享进程池。使用 spawn 方式启动，避免在多线程的服务进程中 fork"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _extract_range(backend: str, source, start: int, end: int) -> list[str]:
+    """进程池工作函数：提取一个页码区间，source 为文件路径或字节串"""
+    return get_extractor(backend).extract_pages(source, start, end)
+
+
+def file_sha256(source) -> str:
+    """PDF 内容的 SHA-256，source 可以是文件路径、字节串或可定位的二进制流（读完后回到开头）"""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    f = open(source, 'rb') if isinstance(source, str) else _rewind(source)
+    try:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    finally:
+        if isinstance(source, str):
+            f.close()
+        else:
+            f.seek(0)
+    return digest.hexdigest()
+
+
+def extract_pages(source, backend: str = None, workers: int = None, use_cache: bool = True) -> list[str]:
+    """
+    提取 PDF 每页文本，source 可以是文件路径、字节串或可定位的二进制流。
+    页数达到 PDF_PARALLEL_MIN_PAGES 且 workers > 1 时，将页码区间分配到进程池中并行提取
+    （内存中的 PDF 以字节串传给工作进程）。结果按 (文件哈希, 后端) 缓存。
+    """
+    backend = backend or PDF_EXTRACTOR_BACKEND
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    cache_key = (file_sha256(source), backend) if use_cache else None
+    if cache_key:
+        cached = _page_cache.get(cache_key)
+        if cached is not None:
+            logger.info("PDF 提取命中缓存。")
+            return list(cached)
+
+    extractor = get_extractor(backend)
+    page_count = extractor.page_count(source)
+    if workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        step = -(-page_count // workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        logger.info(f"使用 {len(ranges)} 个进程并行提取 {page_count} 页（后端: {backend}）...")
+        pool = _get_pool(workers)
+        payload = os.path.abspath(source) if isinstance(source, str) else read_source_bytes(source)
+        futures = [pool.submit(_extract_range, backend, payload, s, e) for s, e in ranges]
+        pages = [page for future in futures for page in future.result()]
+    else:
+        pages = extractor.extract_pages(source)
+
+    if cache_key:
+        _page_cache.set(cache_key, tuple(pages))
+    return pages
+
+
+def get_pdf_cache_stats() -> dict:
+    return _page_cache.stats()
@@ -0,0 +1,41 @@
+# 文件名: app/utils/rate_limit.py
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器。
+    以 rate 个/秒的速度补充令牌，最多累积 capacity 个；acquire 在令牌不足时阻塞等待。
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0):
+        """获取令牌，必要时阻塞直到令牌足够"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """非阻塞地尝试获取令牌"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
@@ -0,0 +1,76 @@
+# 文件名: batch_review.py
+"""
+批量合同审查命令行工具，适用于整批合同的夜间审计。
+
+用法:
+    python batch_review.py contracts/ more/a.pdf --collection civil_code --perspective 甲方 --output results/q3.jsonl
+    python batch_review.py @list.txt --collection civil_code --perspective 乙方 --output results/q3.jsonl --review-workers 8
+
+输入可以是 PDF 文件、目录（递归查找 PDF），或以 @ 开头的清单文件（每行一个路径）。
+结果逐份追加写入 JSONL；中断后以相同参数重新运行会跳过已成功审查的合同。结束时打印吞吐报告。
+"""
+import sys
+import json
+import logging
+import argparse
+from config import BATCH_EXTRACT_WORKERS, BATCH_REVIEW_WORKERS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _expand_inputs(inputs: list[str]) -> list[str]:
+    expanded = []
+    for item in inputs:
+        if item.startswith("@"):
+            with open(item[1:], encoding="utf-8") as f:
+                expanded.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else:
+            expanded.append(item)
+    return expanded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="批量合同审查")
+    parser.add_argument("inputs", nargs="+", help="PDF 文件、目录或 @清单文件")
+    parser.add_argument("--collection", required=True, help="使用的知识库名称")
+    parser.add_argument("--perspective", required=True, choices=["甲方", "乙方"], help="我方立场")
+    parser.add_argument("--output", required=True, help="JSONL 结果文件，已存在时续跑")
+    parser.add_argument("--mode", default="auto", choices=["auto", "single", "map_reduce"], help="条款审查模式")
+    parser.add_argument("--extract-workers", type=int, default=BATCH_EXTRACT_WORKERS, help="PDF 提取进程数")
+    parser.add_argument("--review-workers", type=int, default=BATCH_REVIEW_WORKERS, help="同时审查的合同数")
+    parser.add_argument("--report", help="将吞吐报告另存为 JSON 文件")
+    args = parser.parse_args()
+
+    from app.db.base import create_knowledge_base
+    from app.core.assistant import ContractReviewAssistant
+    from app.core.batch import BatchReviewRunner, BatchOutputLocked, collect_contract_paths
+
+    paths = collect_contract_paths(_expand_inputs(args.inputs))
+    if not paths:
+        logger.error("未找到任何 PDF 合同。")
+        return 1
+
+    kb = create_knowledge_base()
+    if not kb.is_ready(args.collection):
+        logger.error(f"知识库 '{args.collection}' 不存在或为空。")
+        return 1
+
+    runner = BatchReviewRunner(ContractReviewAssistant(kb), args.collection, args.perspective, args.output,
+                               mode=args.mode, extract_workers=args.extract_workers,
+                               review_workers=args.review_workers,
+                               progress_callback=lambda done, total: logger.info(f"批量审查进度: {done}/{total}"))
+    try:
+        report = runner.run(paths)
+    except BatchOutputLocked as e:
+        logger.error(str(e))
+        return 1
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
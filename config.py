@@ -1,5 +1,6 @@
 # 文件名: config.py
 import os
+import json
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
@@ -11,13 +12,142 @@ DASHSCOPE_API_KEY = os.getenv('DASHSCOPE_API_KEY')
 # --- Flask 应用配置 ---
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'guess_it_hahahaha'
-    UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'pdf'}
+    # 单个请求体的大小上限（MB），超出时直接返回 413；批量上传多份合同时限制的是总大小
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH_MB', '256')) * 1024 * 1024
+
+# 上传的 PDF 直接在内存中处理，超过该大小才转存为匿名临时文件
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# --- 向量存储后端 ---
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'milvus')            # milvus / local（内嵌 NumPy 后端，无需服务端）
+LOCAL_KB_DIR = os.getenv('LOCAL_KB_DIR', 'data/local_kb')          # local 后端的数据目录，每个知识库一个子目录
+LOCAL_KB_DTYPE = os.getenv('LOCAL_KB_DTYPE', 'float32')            # float32 / float16（内存与磁盘占用减半）
 
 # --- Milvus 配置 ---
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
+# 常驻内存的集合的估算内存预算（MB），超出时按 LRU 释放
+MILVUS_LOAD_MEMORY_BUDGET_MB = int(os.getenv('MILVUS_LOAD_MEMORY_BUDGET_MB', '4096'))
+# 启动时预加载且不会被淘汰的集合，逗号分隔
+MILVUS_PINNED_COLLECTIONS = [c.strip() for c in os.getenv('MILVUS_PINNED_COLLECTIONS', '').split(',') if c.strip()]
+# 默认索引类型：AUTO（按文本块数量自动选择）/ FLAT / HNSW / IVF_FLAT / IVF_SQ8 / IVF_PQ
+MILVUS_INDEX_TYPE = os.getenv('MILVUS_INDEX_TYPE', 'AUTO')
+MILVUS_METRIC_TYPE = os.getenv('MILVUS_METRIC_TYPE', 'L2')                       # L2 / IP / COSINE
+# 检索参数，0 表示根据索引构建参数自动推导
+MILVUS_SEARCH_EF = int(os.getenv('MILVUS_SEARCH_EF', '0'))                       # HNSW
+MILVUS_SEARCH_NPROBE = int(os.getenv('MILVUS_SEARCH_NPROBE', '0'))               # IVF 系列
 
 # --- 模型常量 ---
 EMBEDDING_MODEL = "text-embedding-v2"
 EMBEDDING_DIM = 1536
+
+# --- 向量生成并发与限流配置 ---
+EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', '4'))             # 并发请求的批次数
+EMBEDDING_RATE_LIMIT_RPS = float(os.getenv('EMBEDDING_RATE_LIMIT_RPS', '10'))    # 每秒请求数上限，需与 Dashscope 配额一致
+EMBEDDING_RATE_LIMIT_BURST = float(os.getenv('EMBEDDING_RATE_LIMIT_BURST', '10'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '3'))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv('EMBEDDING_RETRY_BASE_DELAY', '1.0'))  # 指数退避的基础等待时间（秒）
+
+# --- 向量缓存配置 ---
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'cache/embeddings.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+
+# --- 大模型响应缓存配置 ---
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', '86400'))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+
+# --- 提示词预算与模型选择 ---
+# 可选模型：context_tokens 为上下文窗口（输入 + 输出），cost 为每千 token 的相对单价，按实际计费调整。
+# 可通过环境变量 LLM_MODEL_PROFILES 以 JSON 覆盖。
+LLM_MODEL_PROFILES = json.loads(os.getenv('LLM_MODEL_PROFILES', '') or json.dumps({
+    "qwen-turbo": {"context_tokens": 8000, "cost": 1.0},
+    "qwen-plus": {"context_tokens": 32000, "cost": 2.0},
+    "qwen-long": {"context_tokens": 1000000, "cost": 4.0},
+}))
+# 各阶段允许使用的模型（决定质量下限）与为输出预留的 token 数；实际从中选择上下文放得下的最便宜模型
+LLM_STAGE_MODELS = {
+    "summary": ["qwen-turbo", "qwen-long"],
+    "extract_parties": ["qwen-turbo", "qwen-long"],
+    "party_review": ["qwen-plus", "qwen-long"],
+    "clause_review": ["qwen-plus", "qwen-long"],
+}
+LLM_OUTPUT_RESERVE_TOKENS = {"summary": 1024, "extract_parties": 256, "party_review": 2048, "clause_review": 4096}
+TOKEN_ESTIMATE_SAFETY = 1.15           # 本地估算可能偏低，选择模型时按该系数放大
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_CONTEXT_TOKEN_BUDGET', '6000'))  # 提示词中法条部分的 token 上限
+
+# --- 企查查接口配置 ---
+QICHACHA_BASE_URL = os.getenv('QICHACHA_BASE_URL', 'http://api.qichacha.com/ECIV4/GetBasicDetailsByName')
+QICHACHA_TIMEOUT_SECONDS = float(os.getenv('QICHACHA_TIMEOUT_SECONDS', '10'))
+QICHACHA_POOL_SIZE = int(os.getenv('QICHACHA_POOL_SIZE', '10'))                # 连接池大小
+QICHACHA_RATE_LIMIT_RPS = float(os.getenv('QICHACHA_RATE_LIMIT_RPS', '2'))     # 每秒请求数上限，需与付费配额一致
+QICHACHA_RATE_LIMIT_BURST = float(os.getenv('QICHACHA_RATE_LIMIT_BURST', '5'))
+QICHACHA_CACHE_ENABLED = os.getenv('QICHACHA_CACHE_ENABLED', 'true').lower() == 'true'
+QICHACHA_CACHE_PATH = os.getenv('QICHACHA_CACHE_PATH', 'cache/qichacha.sqlite3')
+QICHACHA_CACHE_TTL_SECONDS = int(os.getenv('QICHACHA_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 工商信息很少变化
+QICHACHA_CACHE_MAX_ENTRIES = int(os.getenv('QICHACHA_CACHE_MAX_ENTRIES', '20000'))
+
+# --- PDF 文本提取配置 ---
+PDF_EXTRACTOR_BACKEND = os.getenv('PDF_EXTRACTOR_BACKEND', 'pypdf2')  # 可选: pypdf2, pymupdf
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))  # 少于该页数时不启用多进程
+PDF_PAGE_CACHE_MAX_FILES = 64
+PDF_PAGE_CACHE_TTL_SECONDS = 3600
+
+# --- 知识库导入配置 ---
+INGEST_CHUNK_SIZE = 1000      # 文本块大小（字符）
+INGEST_CHUNK_OVERLAP = 50     # 相邻文本块重叠字符数
+INGEST_CHUNKER = os.getenv('INGEST_CHUNKER', 'article')  # article：按编/章/节/条结构切块；char：按字符长度切块
+INGEST_BATCH_CHUNKS = 100     # 每个向量生成/插入批次的文本块数
+INGEST_QUEUE_SIZE = 4         # 流水线各阶段之间的队列容量（批次数），决定峰值内存
+
+# --- 检索配置 ---
+CLAUSE_MAX_CHARS = 1500           # 单个条款片段的最大字符数（向量模型单条输入上限为 2048）
+CLAUSE_RETRIEVAL_TOP_K = 3        # 每个条款检索的法条数量
+RETRIEVAL_MAX_CONTEXT_DOCS = 20   # 去重合并后写入提示词的法条数量上限
+# 混合检索：向量检索与字二元组 BM25 检索结果按倒数排名融合（RRF）
+HYBRID_RETRIEVAL_ENABLED = os.getenv('HYBRID_RETRIEVAL_ENABLED', 'true').lower() == 'true'
+HYBRID_CANDIDATE_K = 10           # 融合前每路召回的候选数量
+HYBRID_RRF_K = 60                 # RRF 平滑常数
+KB_INDEX_DIR = os.getenv('KB_INDEX_DIR', 'data/kb_index')  # 各集合 BM25 索引的存放目录
+
+# --- 条款审查配置 ---
+REVIEW_MAP_REDUCE_THRESHOLD_CHARS = 20000  # 超过该长度的合同自动采用 map-reduce 分窗口审查
+REVIEW_WINDOW_CHARS = 6000                 # 每个审查窗口的最大字符数
+REVIEW_MAX_CONCURRENCY = 4                 # 并发审查窗口数上限
+BULK_PARTY_MAX_CONCURRENCY = int(os.getenv('BULK_PARTY_MAX_CONCURRENCY', '8'))  # 批量主体审查的并发 LLM 调用数，按模型配额调整
+BULK_PARTY_MAX_FILES = int(os.getenv('BULK_PARTY_MAX_FILES', '500'))              # 单次批量主体审查的合同数上限
+
+# --- 异步任务配置 ---
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', '4'))   # 同时执行的审查任务数
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', '3600'))  # 已结束任务的保留时间
+JOB_STATE_DIR = os.getenv('JOB_STATE_DIR', 'cache/jobs')    # 任务状态快照目录，多进程部署时任一工作进程都能查询任务；设为空字符串则仅保存在内存中
+
+# --- 合同文档缓存配置 ---
+# 以上传文件的 SHA-256 为键缓存提取文本、条款切分、合同方与条款向量，各接口可通过 document_id 复用
+DOCUMENT_STORE_MAX_ENTRIES = int(os.getenv('DOCUMENT_STORE_MAX_ENTRIES', '256'))
+DOCUMENT_STORE_DIR = os.getenv('DOCUMENT_STORE_DIR', 'cache/documents')  # 磁盘层目录，设为空字符串则仅缓存在内存中
+DOCUMENT_STORE_MAX_DISK_MB = int(os.getenv('DOCUMENT_STORE_MAX_DISK_MB', '1024'))  # 磁盘层容量上限，超出时按最近使用时间淘汰最旧的合同
+
+# --- 批量审查配置 ---
+BATCH_EXTRACT_WORKERS = int(os.getenv('BATCH_EXTRACT_WORKERS', str(PDF_EXTRACT_WORKERS)))  # PDF 提取进程数
+BATCH_REVIEW_WORKERS = int(os.getenv('BATCH_REVIEW_WORKERS', '4'))    # 同时审查的合同数，按 LLM 配额调整
+BATCH_INPUT_ROOT = os.getenv('BATCH_INPUT_ROOT', 'data/batch_inputs')    # 批量审查接口只允许读取该目录下的合同
+BATCH_OUTPUT_DIR = os.getenv('BATCH_OUTPUT_DIR', 'data/batch_outputs')   # 批量审查接口的 JSONL 结果目录
+
+# --- 生产部署配置（gunicorn -c gunicorn.conf.py wsgi:app）---
+SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:6045')
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '4'))                # 工作进程数，每个进程各自持有向量库连接与内存缓存
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', '8'))                # 每个进程的请求线程数，请求耗时主要在等待 LLM，线程即可并发
+SERVE_TIMEOUT_SECONDS = int(os.getenv('SERVE_TIMEOUT_SECONDS', '600'))            # 单个请求的最长处理时间（同步审查可达数分钟）
+SERVE_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv('SERVE_GRACEFUL_TIMEOUT_SECONDS', '300'))  # 停止时等待进行中的请求与异步任务完成的时间
+SERVE_KEEPALIVE_SECONDS = int(os.getenv('SERVE_KEEPALIVE_SECONDS', '5'))
+SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', '0'))      # 工作进程处理该数量请求后重启，0 表示不重启
+COMPONENT_INIT_RETRY_SECONDS = float(os.getenv('COMPONENT_INIT_RETRY_SECONDS', '10'))  # 向量库等核心组件初始化失败后，至少间隔该时间再由请求触发重试
+
+# --- 指标配置（GET /metrics，Prometheus 文本格式）---
+METRICS_DIR = os.getenv('METRICS_DIR', 'cache/metrics')                       # 各工作进程的指标快照目录，用于多进程汇总；设为空字符串则只输出当前进程的指标
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))         # 工作进程写入快照的间隔
+METRICS_STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', '60'))        # 超过该时间未更新的快照视为进程已退出
@@ -0,0 +1,41 @@
+# 文件名: gunicorn.conf.py
+"""
+gunicorn 生产部署配置:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+进程数、线程数与超时时间见 config.py 中的 SERVE_* 配置，可通过环境变量调整。
+收到 SIGTERM 后停止接收新请求，等待进行中的请求与异步审查任务完成（最长 SERVE_GRACEFUL_TIMEOUT_SECONDS 秒）。
+"""
+from config import (
+    SERVE_BIND, SERVE_WORKERS, SERVE_THREADS, SERVE_TIMEOUT_SECONDS, SERVE_GRACEFUL_TIMEOUT_SECONDS,
+    SERVE_KEEPALIVE_SECONDS, SERVE_MAX_REQUESTS
+)
+
+bind = SERVE_BIND
+workers = SERVE_WORKERS
+worker_class = "gthread"
+threads = SERVE_THREADS
+timeout = SERVE_TIMEOUT_SECONDS
+graceful_timeout = SERVE_GRACEFUL_TIMEOUT_SECONDS
+keepalive = SERVE_KEEPALIVE_SECONDS
+max_requests = SERVE_MAX_REQUESTS
+max_requests_jitter = SERVE_MAX_REQUESTS // 10
+
+# 不在主进程中预加载应用：导入时打开的 SQLite 缓存连接不能跨 fork 共享，
+# 每个工作进程自行导入应用，并在下方 post_worker_init 中预热核心组件
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """工作进程加载应用后在后台预热向量库连接、审查助手与模型客户端，不推迟开始接收请求；预热完成前 /readyz 返回 503"""
+    from app.api.routes import start_warm_up
+    start_warm_up()
+
+
+def worker_exit(server, worker):
+    """工作进程退出前等待进行中的异步审查任务完成"""
+    from app.api.routes import shutdown_components
+    shutdown_components()
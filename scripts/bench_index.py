@@ -0,0 +1,127 @@
+# 文件名: scripts/bench_index.py
+"""
+向量索引基准测试：在同一批数据上比较各索引类型及检索参数的召回率与延迟，
+以 NumPy 暴力检索结果作为真值。需要可用的 Milvus 服务。
+
+用法:
+    python scripts/bench_index.py [--num 20000] [--queries 200] [--k 3] [--metric L2]
+    python scripts/bench_index.py --from-collection civil_code_2021   # 使用已有知识库中的真实向量
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymilvus import connections, utility, FieldSchema, CollectionSchema, DataType, Collection
+from config import MILVUS_HOST, MILVUS_PORT, EMBEDDING_DIM
+from app.db.index_config import choose_index_params, INDEX_TYPES
+
+BENCH_COLLECTION = "bench_index_tmp"
+
+# 每种索引需要扫描的检索参数
+SEARCH_SWEEPS = {
+    "FLAT": [{}],
+    "HNSW": [{"ef": ef} for ef in (16, 64, 128, 256)],
+    "IVF_FLAT": [{"nprobe": n} for n in (4, 16, 64)],
+    "IVF_SQ8": [{"nprobe": n} for n in (4, 16, 64)],
+    "IVF_PQ": [{"nprobe": n} for n in (4, 16, 64)],
+}
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.from_collection:
+        collection = Collection(args.from_collection)
+        collection.load()
+        rows = collection.query(expr="pk >= 0", output_fields=["embedding"], limit=min(args.num, 16384))
+        return np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+    rng = np.random.default_rng(42)
+    # 合成数据带有簇结构，比均匀随机向量更接近真实文本向量的分布
+    centers = rng.normal(size=(max(args.num // 200, 8), args.dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=args.num)
+    return centers[labels] + 0.3 * rng.normal(size=(args.num, args.dim)).astype(np.float32)
+
+
+def brute_force(vectors: np.ndarray, queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    if metric == "L2":
+        scores = (queries ** 2).sum(1, keepdims=True) - 2 * queries @ vectors.T + (vectors ** 2).sum(1)
+        return np.argsort(scores, axis=1)[:, :k]
+    if metric == "COSINE":
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def create_bench_collection(vectors: np.ndarray) -> Collection:
+    if utility.has_collection(BENCH_COLLECTION):
+        utility.drop_collection(BENCH_COLLECTION)
+    fields = [
+        FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=vectors.shape[1]),
+    ]
+    collection = Collection(BENCH_COLLECTION, CollectionSchema(fields, "索引基准测试临时集合"))
+    for start in range(0, len(vectors), 5000):
+        batch = vectors[start:start + 5000]
+        collection.insert([list(range(start, start + len(batch))), batch.tolist()])
+    collection.flush()
+    return collection
+
+
+def bench_index(collection: Collection, index_params: dict, queries: np.ndarray, truth: np.ndarray, k: int):
+    collection.release()
+    if collection.has_index():
+        collection.drop_index()
+    start = time.perf_counter()
+    collection.create_index(field_name="embedding", index_params=index_params)
+    utility.wait_for_index_building_complete(BENCH_COLLECTION)
+    build_seconds = time.perf_counter() - start
+    collection.load()
+
+    for search in SEARCH_SWEEPS[index_params["index_type"]]:
+        param = {"metric_type": index_params["metric_type"], "params": search}
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = collection.search(data=[query.tolist()], anns_field="embedding", param=param, limit=k)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append([hit.id for hit in hits])
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth.tolist())])
+        label = f"{index_params['index_type']} {index_params['params']} {search}"
+        print(f"{label:<64} 构建 {build_seconds:7.2f} 秒  召回率@{k} {recall:6.3f}  "
+              f"p50 {np.percentile(latencies, 50):7.2f} ms  p95 {np.percentile(latencies, 95):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引召回率/延迟基准测试")
+    parser.add_argument("--num", type=int, default=20000, help="向量数量")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--metric", default="L2", choices=["L2", "IP", "COSINE"])
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--from-collection", help="从已有知识库采样真实向量")
+    args = parser.parse_args()
+
+    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(7)
+    # 查询向量取自数据点并加入扰动，模拟与知识库内容相近但不完全相同的条款
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    truth = brute_force(vectors, queries, args.k, args.metric)
+    print(f"向量数 {len(vectors)}，维度 {vectors.shape[1]}，查询数 {len(queries)}，度量 {args.metric}")
+    print(f"AUTO 策略对该规模的选择: {choose_index_params(len(vectors), vectors.shape[1], 'AUTO', args.metric)}\n")
+
+    collection = create_bench_collection(vectors)
+    try:
+        for index_type in args.index_types.split(","):
+            index_params = choose_index_params(len(vectors), vectors.shape[1], index_type.strip(), args.metric)
+            bench_index(collection, index_params, queries, truth, args.k)
+    finally:
+        utility.drop_collection(BENCH_COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
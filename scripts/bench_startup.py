@@ -0,0 +1,105 @@
+# 文件名: scripts/bench_startup.py
+"""
+冷启动基准测试：多次以全新的解释器进程启动应用，测量各阶段耗时（取中位数）。
+    import_app        导入应用并执行 create_app()
+    first_healthz     到 /healthz 首次返回 200（进程可以接收流量）
+    components_ready  到向量库连接与审查助手初始化完成（/readyz 的前提）
+    process_total     从启动解释器到以上全部完成
+
+用法:
+    python scripts/bench_startup.py [--runs 5] [--max-live-seconds 1.5]
+    python scripts/bench_startup.py --importtime 15    # 额外列出导入耗时最多的模块
+设置 --max-live-seconds 时，进程可接收流量前的耗时超过该值则以非零状态退出，可用于 CI 防止启动变慢。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+imported = time.perf_counter()
+status = app.test_client().get('/healthz').status_code
+live = time.perf_counter()
+from app.api.routes import init_components
+ready_ok = init_components(force=True)
+ready = time.perf_counter()
+print("BENCH_STARTUP " + json.dumps({
+    "import_app": imported - start, "first_healthz": live - start, "components_ready": ready - start,
+    "healthz_status": status, "components_ok": ready_ok,
+}))
+"""
+
+
+def _run_probe(extra_args: list[str] = None):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *(extra_args or []), "-c", _PROBE], env=env,
+                          capture_output=True, text=True)
+    total = time.perf_counter() - start
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH_STARTUP ")), None)
+    if line is None:
+        raise RuntimeError(f"启动探测进程失败（退出码 {proc.returncode}）:\n{proc.stderr[-2000:]}")
+    result = json.loads(line[len("BENCH_STARTUP "):])
+    result["process_total"] = total
+    return result, proc.stderr
+
+
+def _top_imports(stderr: str, top: int) -> list[tuple[str, float]]:
+    """解析 -X importtime 输出，返回累计耗时最多的模块 [(模块, 毫秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="应用冷启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="启动次数，结果取中位数")
+    parser.add_argument("--max-live-seconds", type=float, help="进程可接收流量前的耗时上限（秒），超过时返回非零状态")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="列出导入耗时最多的 N 个模块")
+    args = parser.parse_args()
+
+    stages = ["import_app", "first_healthz", "components_ready", "process_total"]
+    samples = {stage: [] for stage in stages}
+    components_ok = True
+    for i in range(args.runs):
+        result, _ = _run_probe()
+        components_ok = components_ok and result["components_ok"]
+        for stage in stages:
+            samples[stage].append(result[stage])
+        print(f"第 {i + 1} 次: " + "，".join(f"{stage} {result[stage]:.3f}s" for stage in stages))
+
+    # 进程可接收流量前的耗时 = 解释器启动 + 导入应用 + 首个 /healthz
+    live_seconds = [total - (ready - healthz) for total, ready, healthz in
+                    zip(samples["process_total"], samples["components_ready"], samples["first_healthz"])]
+    report = {
+        "runs": args.runs,
+        "median_seconds": {stage: round(statistics.median(values), 3) for stage, values in samples.items()},
+        "time_to_live_seconds": round(statistics.median(live_seconds), 3),
+        "components_ok": components_ok,
+    }
+    if args.importtime:
+        _, stderr = _run_probe(["-X", "importtime"])
+        report["slowest_imports_ms"] = {module: round(ms, 1) for module, ms in _top_imports(stderr, args.importtime)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.max_live_seconds and report["time_to_live_seconds"] > args.max_live_seconds:
+        print(f"冷启动耗时 {report['time_to_live_seconds']}s 超过上限 {args.max_live_seconds}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
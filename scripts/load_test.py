@@ -0,0 +1,98 @@
+# 文件名: scripts/load_test.py
+"""
+HTTP 负载测试：以固定并发持续请求同一接口，输出吞吐（requests/sec）与延迟分位数。
+用于比较开发服务器（python run.py）与 gunicorn 部署（gunicorn -c gunicorn.conf.py wsgi:app）。
+
+用法:
+    python scripts/load_test.py --url http://127.0.0.1:6045/list_kbs --concurrency 32 --duration 30
+    python scripts/load_test.py --url http://127.0.0.1:6045/documents --method POST --file contract.pdf --concurrency 16
+    python scripts/load_test.py --url http://127.0.0.1:6045/review_party --method POST --file contract.pdf \
+        --form perspective=甲方 --concurrency 8 --duration 120
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_load(args) -> dict:
+    form = dict(item.split("=", 1) for item in args.form)
+    file_bytes = None
+    if args.file:
+        with open(args.file, "rb") as f:
+            file_bytes = f.read()
+
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if args.method == "GET":
+                    response = session.get(args.url, params=form, timeout=args.timeout)
+                else:
+                    files = {args.file_field: ("load_test.pdf", file_bytes, "application/pdf")} if file_bytes else None
+                    response = session.post(args.url, data=form, files=files, timeout=args.timeout)
+                status = str(response.status_code)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(worker)
+    wall = time.perf_counter() - start
+
+    ok = sum(n for status, n in statuses.items() if status.startswith("2"))
+    return {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "succeeded": ok,
+        "statuses": dict(statuses),
+        "wall_seconds": round(wall, 2),
+        "requests_per_second": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 1),
+        } if latencies else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HTTP 负载测试")
+    parser.add_argument("--url", required=True, help="请求地址")
+    parser.add_argument("--method", default="GET", choices=["GET", "POST"])
+    parser.add_argument("--file", help="随请求上传的文件（multipart）")
+    parser.add_argument("--file-field", default="contract_file", help="上传文件的表单字段名")
+    parser.add_argument("--form", action="append", default=[], help="表单字段或查询参数，格式 key=value，可重复")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=30, help="持续时间（秒）")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求的超时时间（秒）")
+    args = parser.parse_args()
+
+    report = run_load(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["succeeded"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
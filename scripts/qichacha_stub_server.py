@@ -0,0 +1,101 @@
+# 文件名: scripts/qichacha_stub_server.py
+"""
+企查查工商信息接口的本地桩服务，用于测试与压测，不消耗付费配额。
+校验 Token 签名，按关键字返回固定格式的工商信息；关键字包含“不存在”时返回查无结果。
+每个请求输出一行“[序号] ...”，测试据此统计上游实际收到的请求数。
+
+用法:
+    QICHACHA_APP_KEY=test QICHACHA_SECRET_KEY=test python scripts/qichacha_stub_server.py [--port 8765] [--latency 0.3] [--fail-first 2]
+    （--port 0 时由系统分配端口，启动信息中输出实际地址）
+    export QICHACHA_BASE_URL=http://127.0.0.1:8765/ECIV4/GetBasicDetailsByName
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+APP_KEY = os.environ.get("QICHACHA_APP_KEY", "test")
+SECRET_KEY = os.environ.get("QICHACHA_SECRET_KEY", "test")
+
+_request_count = 0
+_count_lock = threading.Lock()
+
+
+def fake_company(name: str) -> dict:
+    digest = int(hashlib.md5(name.encode("utf-8")).hexdigest(), 16)
+    return {
+        "Name": name,
+        "Status": "存续",
+        "OperName": "张三",
+        "RegistCapi": f"{digest % 9000 + 100}万元人民币",
+        "StartDate": f"{2000 + digest % 24}-01-01T00:00:00",
+        "EconKind": "有限责任公司",
+        "Scope": "软件开发；技术服务；技术咨询。",
+        "RevokeInfo": None,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_first = 0
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        global _request_count
+        with _count_lock:
+            _request_count += 1
+            count = _request_count
+        params = parse_qs(urlparse(self.path).query)
+        keyword = params.get("keyword", [""])[0]
+        timespan = self.headers.get("Timespan", "")
+        expected = hashlib.md5((APP_KEY + timespan + SECRET_KEY).encode("utf-8")).hexdigest().upper()
+        if self.headers.get("Token") != expected or params.get("key", [""])[0] != APP_KEY:
+            return self._reply(200, {"Status": "101", "Message": "签名验证失败"})
+        if count <= self.fail_first:
+            print(f"[{count}] 模拟故障(503): {keyword}", flush=True)
+            return self._reply(503, {"Status": "503", "Message": "服务暂不可用"})
+        if self.latency:
+            time.sleep(self.latency)
+        print(f"[{count}] 查询: {keyword}", flush=True)
+        if not keyword or "不存在" in keyword:
+            return self._reply(200, {"Status": "201", "Message": "查询无结果"})
+        return self._reply(200, {"Status": "200", "Message": "查询成功", "Result": fake_company(keyword)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="企查查接口本地桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟的接口延迟（秒）")
+    parser.add_argument("--fail-first", type=int, default=0, help="前 N 个请求返回 503，用于验证客户端重试")
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.fail_first = args.fail_first
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    host, port = server.server_address[:2]
+    print(f"企查查桩服务已启动: http://{host}:{port}/ECIV4/GetBasicDetailsByName", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"共收到 {_request_count} 个请求。")
+
+
+if __name__ == "__main__":
+    main()
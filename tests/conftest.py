@@ -0,0 +1,44 @@
+# 文件名: tests/conftest.py
+"""
+测试公共配置。config.py 在导入时读取环境变量，因此在任何应用模块被导入之前，
+把各缓存、索引与状态目录指向临时目录，避免测试读写仓库中的 cache/ 与 data/。
+"""
+import os
+import hashlib
+import tempfile
+import numpy as np
+import pytest
+
+_TEST_ROOT = tempfile.mkdtemp(prefix="contract_review_tests_")
+for _name, _value in {
+    "VECTOR_BACKEND": "local",
+    "LOCAL_KB_DIR": os.path.join(_TEST_ROOT, "local_kb"),
+    "KB_INDEX_DIR": os.path.join(_TEST_ROOT, "kb_index"),
+    "EMBEDDING_CACHE_PATH": os.path.join(_TEST_ROOT, "embeddings.sqlite3"),
+    "QICHACHA_CACHE_PATH": os.path.join(_TEST_ROOT, "qichacha.sqlite3"),
+    "JOB_STATE_DIR": os.path.join(_TEST_ROOT, "jobs"),
+    "DOCUMENT_STORE_DIR": os.path.join(_TEST_ROOT, "documents"),
+    "METRICS_DIR": os.path.join(_TEST_ROOT, "metrics"),
+}.items():
+    os.environ[_name] = _value
+
+from config import EMBEDDING_DIM  # noqa: E402
+
+
+def fake_embedding(text: str) -> list[float]:
+    """由文本哈希确定的单位向量：相同文本得到相同向量，不同文本几乎正交"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_embeddings(texts: list[str]) -> list[list[float]]:
+    return [fake_embedding(text) for text in texts]
+
+
+@pytest.fixture
+def kb_index_dir(tmp_path, monkeypatch):
+    """让知识库后端的 BM25 / 条号索引写入本测试独有的目录"""
+    index_dir = tmp_path / "kb_index"
+    monkeypatch.setattr("app.db.base.KB_INDEX_DIR", str(index_dir))
+    return index_dir
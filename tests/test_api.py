@@ -0,0 +1,161 @@
+# 文件名: tests/test_api.py
+import io
+import threading
+from types import SimpleNamespace
+import pytest
+from app import create_app
+from app.api import routes
+from app.core.assistant import ContractReviewAssistant
+from app.db import local_kb
+from app.db.local_kb import LocalKnowledgeBase
+from tests.conftest import fake_embeddings
+
+LAW_A = "第一条 买方逾期付款的，应当按日支付违约金。\n第二条 出卖人应当按期交付标的物。\n"
+LAW_B = "第一条 承租人应当按照约定的方法使用租赁物。\n"
+
+
+@pytest.fixture
+def backend(tmp_path, kb_index_dir, monkeypatch):
+    """本地后端；上传内容直接作为单页文本（不解析 PDF），向量由文本哈希生成"""
+    monkeypatch.setattr(local_kb, "iter_pdf_pages", lambda source: [(1, source.read().decode("utf-8"))])
+    monkeypatch.setattr(local_kb, "get_embeddings", fake_embeddings)
+    backend = LocalKnowledgeBase(root_dir=str(tmp_path / "local_kb"))
+    monkeypatch.setattr(routes, "kb", backend)
+    monkeypatch.setattr(routes, "assistant", ContractReviewAssistant(backend, routes.document_store))
+    return backend
+
+
+@pytest.fixture
+def client(backend):
+    return create_app().test_client()
+
+
+def _build(client, text: str, filename: str, **form):
+    data = {"collection_name": "kb", "mode": "append", "file": (io.BytesIO(text.encode("utf-8")), filename), **form}
+    return client.post("/build_kb", data=data, content_type="multipart/form-data")
+
+
+def _sources(backend) -> set[str]:
+    return {hit["source"] for no in (1, 2) for hit in backend.lookup_articles("kb", [no]).get(no, [])}
+
+
+def test_build_kb_keeps_chinese_source_names(client, backend):
+    assert _build(client, LAW_A, "民法典.pdf").status_code == 200
+    assert _build(client, LAW_B, "最高法司法解释(2023).pdf").status_code == 200
+    assert _sources(backend) == {"民法典.pdf", "最高法司法解释(2023).pdf"}
+
+    response = client.post("/remove_source", data={"collection_name": "kb", "source": "民法典.pdf"})
+    assert response.status_code == 200
+    assert _sources(backend) == {"最高法司法解释(2023).pdf"}
+
+
+def test_build_kb_source_field_overrides_filename(client, backend):
+    assert _build(client, LAW_A, "C:\\uploads\\law.pdf", source="民法典（2020）").status_code == 200
+    assert _sources(backend) == {"民法典（2020）"}
+    assert _build(client, LAW_B, "lease.pdf", source="x" * 600).status_code == 400
+
+
+def test_lookup_article_rejects_unparsable_number(client):
+    response = client.get("/lookup_article", query_string={"collection_name": "kb", "article": "²"})
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_same_text_in_two_sources_survives_removing_one(client, backend):
+    assert _build(client, LAW_A, "民法典.pdf").status_code == 200
+    # 另一来源包含完全相同的条文：按来源去重，不会因为与民法典.pdf 重复而被跳过
+    assert _build(client, LAW_A, "汇编.pdf").status_code == 200
+    assert _sources(backend) == {"民法典.pdf", "汇编.pdf"}
+    # 同一来源重复导入仍然去重
+    count = len(backend._open("kb").records)
+    assert _build(client, LAW_A, "汇编.pdf").status_code == 200
+    assert len(backend._open("kb").records) == count
+
+    response = client.post("/remove_source", data={"collection_name": "kb", "source": "民法典.pdf"})
+    assert response.status_code == 200
+    assert _sources(backend) == {"汇编.pdf"}
+    records = backend._open("kb").records
+    assert records and {record["source"] for record in records} == {"汇编.pdf"}
+
+
+def _bulk_upload(client, contracts: dict):
+    files = [(io.BytesIO(content), name) for name, content in contracts.items()]
+    return client.post("/jobs/review_parties", data={"perspective": "甲方", "contract_files": files},
+                       content_type="multipart/form-data")
+
+
+def test_bulk_party_review_rejects_oversized_request(client):
+    client.application.config["MAX_CONTENT_LENGTH"] = 1024 * 1024
+    response = _bulk_upload(client, {f"{no}.pdf": b"x" * 300 * 1024 for no in range(4)})
+    assert response.status_code == 413
+    assert response.get_json()["status"] == "error"
+
+
+def test_bulk_party_review_reuses_parsed_documents(backend, monkeypatch):
+    extracted = []
+
+    def extract(stream):
+        extracted.append(stream)
+        return stream.read().decode("utf-8")
+
+    class _Assistant:
+        def run_bulk_party_review(self, contracts, perspective, progress_callback=None):
+            return {"results": {contract_id: {"report": text} for contract_id, text in contracts.items()}}
+
+    monkeypatch.setattr(routes, "extract_text_from_pdf", extract)
+    monkeypatch.setattr(routes, "assistant", _Assistant())
+    job = SimpleNamespace(update_stage=lambda *args: None)
+    contracts = {"a.pdf": "甲方：批量复用测试甲\n第一条 付款。", "b.pdf": "甲方：批量复用测试乙\n第一条 交货。"}
+
+    def run():
+        uploads = [(name, io.BytesIO(text.encode("utf-8"))) for name, text in contracts.items()]
+        return routes._bulk_party_review_job(job, uploads, "甲方")
+
+    first = run()
+    assert {cid: r["report"] for cid, r in first["results"].items()} == contracts
+    assert len(extracted) == 2
+    # 再次提交相同内容的合同时直接使用已解析的文本
+    assert run()["results"] == first["results"]
+    assert len(extracted) == 2
+
+
+def test_stream_review_returns_json_error_when_parsing_fails(client, monkeypatch):
+    assert _build(client, LAW_A, "民法典.pdf").status_code == 200
+
+    def broken_parse(stream, filename):
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(routes, "_parse_upload", broken_parse)
+    data = {"collection_name": "kb", "perspective": "甲方", "contract_file": (io.BytesIO(b"%PDF"), "contract.pdf")}
+    response = client.post("/review_contract/stream", data=data, content_type="multipart/form-data")
+    assert response.status_code == 500
+    assert response.get_json() == {"status": "error", "message": "服务器内部错误: 磁盘已满"}
+
+
+def test_readyz_reports_init_state_without_blocking(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_init(force=False):
+        started.set()
+        release.wait(5)  # 模拟连接不上的向量库
+        return False
+
+    monkeypatch.setattr(routes, "assistant", None)
+    monkeypatch.setattr(routes, "init_components", slow_init)
+    monkeypatch.setattr(routes, "get_llm_status", lambda: {"api_key_configured": True, "client_loaded": False})
+    client = create_app().test_client()
+    try:
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.get_json()["dependencies"]["knowledge_base"]["initialized"] is False
+        # 初始化在后台进行，readyz 已经返回
+        assert started.wait(5)
+    finally:
+        release.set()
+
+
+def test_readyz_ready_once_initialized(client, monkeypatch):
+    monkeypatch.setattr(routes, "get_llm_status", lambda: {"api_key_configured": True, "client_loaded": True})
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ready"
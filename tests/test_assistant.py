@@ -0,0 +1,50 @@
+# 文件名: tests/test_assistant.py
+from app.core import assistant as assistant_module
+from app.core.assistant import ContractReviewAssistant
+
+CONTRACT = ("第一条 合同标的\n本合同标的为办公设备一批。\n"
+            "第二条 付款\n买方应于收货后三十日内付款。\n"
+            "第三条 违约责任\n违约方应依据《民法典》第五百八十五条支付违约金。")
+ARTICLES = {no: f"民法典第{no}条原文。" for no in (1, 2, 3, 585)}
+
+
+class _FakeKnowledgeBase:
+    def __init__(self):
+        self.looked_up = []
+
+    def lookup_articles(self, collection_name, article_nos):
+        self.looked_up.append(list(article_nos))
+        return {no: [{"article_no": no, "source": "民法典.pdf", "chapter": "", "text": ARTICLES[no]}]
+                for no in article_nos if no in ARTICLES}
+
+    def retrieve_by_clauses(self, clauses, collection_name, k=None, clause_embeddings=None):
+        return {}
+
+    @staticmethod
+    def merge_clause_contexts(clause_contexts, max_docs=None):
+        return ["检索得到的相关条文。"]
+
+
+def test_retrieved_context_only_cites_statute_references():
+    knowledge_base = _FakeKnowledgeBase()
+    context = ContractReviewAssistant(knowledge_base)._build_retrieved_context(CONTRACT, "kb", {})
+    assert knowledge_base.looked_up == [[585]]
+    docs = context.split("\n---\n")
+    assert docs == ["【民法典.pdf 第585条】民法典第585条原文。", "检索得到的相关条文。"]
+
+
+def test_stream_updates_risk_item_when_higher_level_duplicate_arrives(monkeypatch):
+    monkeypatch.setattr(assistant_module, "call_qwen_model", lambda prompt, **kwargs: "{}")
+    assistant = ContractReviewAssistant(_FakeKnowledgeBase())
+    batches = [
+        [{"original_clause": "第二条 付款", "risk_level": "低风险"}, {"original_clause": "第一条 合同标的", "risk_level": "中风险"}],
+        [{"original_clause": "第二条  付款", "risk_level": "高风险"}, {"original_clause": "第一条 合同标的", "risk_level": "低风险"}],
+    ]
+    monkeypatch.setattr(assistant, "iter_review_batches", lambda *args, **kwargs: iter(batches))
+
+    events = [(event, data) for event, data in assistant.iter_full_review(CONTRACT, "甲方", "kb", mode="single")
+              if event in ("risk_item", "risk_item_update", "done")]
+    assert [event for event, _ in events] == ["risk_item", "risk_item", "risk_item_update", "done"]
+    assert events[2][1] == {"index": 0, "risk_item": batches[1][0]}
+    # 流中最终显示的条款与 done 中合并后的报告一致
+    assert events[3][1]["risk_review_report"] == [batches[1][0], batches[0][1]]
@@ -0,0 +1,105 @@
+# 文件名: tests/test_batch.py
+import json
+import fcntl
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import assistant as assistant_module
+from app.core import batch as batch_module
+from app.core.assistant import ContractReviewAssistant, SUMMARY_UNAVAILABLE
+from app.core.batch import BatchOutputLocked, BatchReviewRunner, load_completed, output_in_use
+
+CONTRACT = "甲方：某某科技有限公司\n乙方：某某贸易有限公司\n第一条 乙方应于收货后三十日内付款。\n第二条 违约方应支付违约金。"
+REVIEW = json.dumps([{"original_clause": "第二条 违约方应支付违约金。", "risk_level": "中"}], ensure_ascii=False)
+
+
+class _FakeKnowledgeBase:
+    def retrieve_by_clauses(self, clauses, collection_name, k=None, clause_embeddings=None):
+        return {}
+
+    def lookup_articles(self, collection_name, article_nos):
+        return {}
+
+    @staticmethod
+    def merge_clause_contexts(clause_contexts, max_docs=None):
+        return []
+
+
+def _fake_llm(fail_summary=False, fail_review=False):
+    def call(prompt, model="qwen-turbo", temperature=0.1, use_cache=True):
+        if "公司全称" in prompt:
+            return json.dumps({"party_a": "某某科技有限公司", "party_b": "某某贸易有限公司"}, ensure_ascii=False)
+        if "风险" in prompt:
+            return "" if fail_review else REVIEW
+        return "" if fail_summary else "买卖合同摘要。"
+    return call
+
+
+@pytest.fixture
+def assistant():
+    return ContractReviewAssistant(_FakeKnowledgeBase())
+
+
+def test_full_review_without_errors(assistant, monkeypatch):
+    monkeypatch.setattr(assistant_module, "call_qwen_model", _fake_llm())
+    result = assistant.run_full_review(CONTRACT, "甲方", "kb", mode="single")
+    assert result["errors"] == []
+    assert result["contract_summary"] == "买卖合同摘要。"
+    assert result["risk_review_report"]
+
+
+def test_full_review_reports_swallowed_llm_failures(assistant, monkeypatch):
+    monkeypatch.setattr(assistant_module, "call_qwen_model", _fake_llm(fail_summary=True, fail_review=True))
+    result = assistant.run_full_review(CONTRACT, "甲方", "kb", mode="single")
+    assert result["contract_summary"] == SUMMARY_UNAVAILABLE
+    assert result["risk_review_report"] == []
+    assert len(result["errors"]) == 2
+
+
+def _run_batch(assistant, monkeypatch, paths, output_path):
+    # 用线程池代替提取进程池，提取函数直接返回固定的合同文本
+    monkeypatch.setattr(batch_module, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context=None: ThreadPoolExecutor(max_workers=max_workers))
+    monkeypatch.setattr(batch_module, "_extract_contract", lambda path: (CONTRACT, 0.0))
+    runner = BatchReviewRunner(assistant, "kb", "甲方", str(output_path), mode="single")
+    return runner.run([str(p) for p in paths])
+
+
+def test_batch_records_incomplete_review_as_failed_and_retries(assistant, monkeypatch, tmp_path):
+    paths = [tmp_path / "a.pdf", tmp_path / "b.pdf"]
+    for i, path in enumerate(paths):
+        path.write_bytes(f"contract {i}".encode())
+    output_path = tmp_path / "results.jsonl"
+
+    monkeypatch.setattr(assistant_module, "call_qwen_model", _fake_llm(fail_summary=True))
+    report = _run_batch(assistant, monkeypatch, paths, output_path)
+    assert report["failed"] == 2 and report["succeeded"] == 0
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert all(r["status"] == "failed" and "合同摘要生成失败" in r["error"] for r in records)
+    assert load_completed(str(output_path)) == set()
+
+    # 续跑时重新审查上次失败的合同
+    monkeypatch.setattr(assistant_module, "call_qwen_model", _fake_llm())
+    report = _run_batch(assistant, monkeypatch, paths, output_path)
+    assert report["succeeded"] == 2 and report["skipped"] == 0
+    assert len(load_completed(str(output_path))) == 2
+
+
+def test_batch_refuses_output_file_held_by_another_run(assistant, monkeypatch, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"contract")
+    output_path = tmp_path / "results.jsonl"
+    monkeypatch.setattr(assistant_module, "call_qwen_model", _fake_llm())
+    assert not output_in_use(str(output_path))
+
+    # 另一个任务（此处以另一个文件描述符模拟）正在写入同一结果文件
+    with open(output_path, "a") as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        assert output_in_use(str(output_path))
+        with pytest.raises(BatchOutputLocked):
+            _run_batch(assistant, monkeypatch, [path], output_path)
+        assert output_path.read_text(encoding="utf-8") == ""
+
+    assert not output_in_use(str(output_path))
+    assert _run_batch(assistant, monkeypatch, [path], output_path)["succeeded"] == 1
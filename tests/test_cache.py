@@ -0,0 +1,84 @@
+# 文件名: tests/test_cache.py
+from types import SimpleNamespace
+import pytest
+from app.services import cache as cache_module
+from app.services.cache import EmbeddingCache, PersistentTTLCache, TTLCache
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+def test_embedding_cache_roundtrip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_entries=10)
+    cache.put_many("m", ["甲", "乙"], [[1.0, 2.0], [3.0, 4.0]])
+    assert cache.get_many("m", ["乙", "丙", "甲", "乙"]) == [[3.0, 4.0], None, [1.0, 2.0], [3.0, 4.0]]
+    assert cache.get_many("other-model", ["甲"]) == [None]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (3, 2, 2)
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_entries=2)
+    cache.put_many("m", ["a"], [[1.0]])
+    clock.advance(1)
+    cache.put_many("m", ["b"], [[2.0]])
+    clock.advance(1)
+    cache.get_many("m", ["a"])          # a 最近被访问，b 成为最久未使用
+    clock.advance(1)
+    cache.put_many("m", ["c"], [[3.0]])
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_embedding_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path, max_entries=10).put_many("m", ["甲"], [[0.5]])
+    assert EmbeddingCache(path, max_entries=10).get_many("m", ["甲"]) == [[0.5]]
+
+
+def test_persistent_ttl_cache_expires(tmp_path, clock):
+    cache = PersistentTTLCache(str(tmp_path / "kv.sqlite3"), ttl_seconds=10, max_entries=10)
+    cache.set("公司", {"name": "示例有限公司"})
+    clock.advance(9)
+    assert cache.get("公司") == {"name": "示例有限公司"}
+    clock.advance(2)
+    assert cache.get("公司") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_persistent_ttl_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = PersistentTTLCache(str(tmp_path / "kv.sqlite3"), ttl_seconds=100, max_entries=2)
+    cache.set("a", 1)
+    clock.advance(1)
+    cache.set("b", 2)
+    clock.advance(1)
+    assert cache.get("a") == 1
+    clock.advance(1)
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_ttl_cache_lru_and_expiry(clock):
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    clock.advance(11)
+    assert cache.get("a") is None and cache.get("c") is None
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,101 @@
+# 文件名: tests/test_collection_manager.py
+import time
+import threading
+import pytest
+from app.db import collection_manager
+from app.db.collection_manager import CollectionManager
+
+
+class _FakeCollection:
+    """Milvus 集合句柄的替身；名称以 slow 开头的集合在 gate 放行前一直处于加载中，fail 为 True 时加载失败"""
+    gate = None
+    loads = []
+    fail = False
+
+    def __init__(self, name):
+        self.name = name
+        self.num_entities = 1
+
+    def load(self):
+        _FakeCollection.loads.append(self.name)
+        if _FakeCollection.fail:
+            raise RuntimeError("load failed")
+        if self.name.startswith("slow"):
+            assert _FakeCollection.gate.wait(10)
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    _FakeCollection.gate = threading.Event()
+    _FakeCollection.loads = []
+    _FakeCollection.fail = False
+    monkeypatch.setattr(collection_manager, "Collection", _FakeCollection)
+    return CollectionManager(1024)
+
+
+def _use_in_thread(manager, name, results):
+    def run():
+        with manager.use(name) as collection:
+            results.append(collection)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_until_loading(name):
+    while name not in _FakeCollection.loads:
+        time.sleep(0.001)
+
+
+def test_slow_load_does_not_block_other_collections(manager):
+    with manager.use("fast"):
+        pass
+    results = []
+    loader = _use_in_thread(manager, "slow", results)
+    _wait_until_loading("slow")
+    # 其他集合的查询、句柄获取与状态查询不需要等待正在进行的加载
+    with manager.use("fast") as collection:
+        assert collection.name == "fast"
+    assert manager.stats()["loaded"] == ["fast"]
+    _FakeCollection.gate.set()
+    loader.join(10)
+    assert [collection.name for collection in results] == ["slow"]
+    assert manager.stats()["loaded"] == ["fast", "slow"]
+
+
+def test_concurrent_users_share_one_load(manager):
+    results = []
+    threads = [_use_in_thread(manager, "slow", results) for _ in range(5)]
+    _wait_until_loading("slow")
+    _FakeCollection.gate.set()
+    for thread in threads:
+        thread.join(10)
+    assert _FakeCollection.loads == ["slow"]
+    assert len(results) == 5 and len({id(collection) for collection in results}) == 1
+
+
+def test_failed_load_is_retried_by_next_user(manager):
+    _FakeCollection.fail = True
+    with pytest.raises(RuntimeError):
+        with manager.use("kb"):
+            pass
+    assert manager.stats()["loaded"] == []
+    _FakeCollection.fail = False
+    with manager.use("kb") as collection:
+        assert collection.name == "kb"
+    assert manager.stats()["loaded"] == ["kb"]
+
+
+def test_collections_in_use_are_not_evicted(manager, monkeypatch):
+    monkeypatch.setattr(CollectionManager, "estimate_memory", staticmethod(lambda collection: 600 * 1024 * 1024))
+    manager = CollectionManager(1024)
+    with manager.use("a"):
+        with manager.use("b"):
+            assert manager.stats()["loaded"] == ["a", "b"]
+        with manager.use("c"):
+            # a 仍在使用，只能淘汰 b
+            assert manager.stats()["loaded"] == ["a", "c"]
+    assert manager.stats()["loaded"] == ["c"]
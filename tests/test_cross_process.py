@@ -0,0 +1,139 @@
+# 文件名: tests/test_cross_process.py
+"""
+多进程部署（gunicorn 多个工作进程）时，/build_kb、/remove_source、/delete_kb 只会落到其中一个进程。
+这里在子进程中修改知识库，检验本进程缓存的向量快照、BM25 索引、条号索引与 Milvus 集合句柄随之失效。
+"""
+import os
+import sys
+import json
+import subprocess
+import pytest
+from app.db import local_kb, collection_manager
+from app.db.local_kb import LocalKnowledgeBase
+from app.db.collection_manager import CollectionManager
+from tests.conftest import fake_embedding, fake_embeddings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAW_A = [(1, "第一条 买方逾期付款的，应当按日支付违约金。\n第二条 出卖人应当按期交付标的物。\n")]
+LAW_B = [(1, "第一条 承租人应当按照约定的方法使用租赁物。\n第二条 出租人应当履行租赁物的维修义务。\n")]
+
+# 子进程：与测试进程共用同一数据目录的另一个“工作进程”
+_WORKER = """
+import sys, json
+from app.db import base, local_kb
+from tests.conftest import fake_embeddings
+root_dir, index_dir, action, args = sys.argv[1], sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+base.KB_INDEX_DIR = index_dir
+local_kb.iter_pdf_pages = iter
+local_kb.get_embeddings = fake_embeddings
+backend = local_kb.LocalKnowledgeBase(root_dir=root_dir)
+if action == "build":
+    backend.build_and_store([tuple(page) for page in args["pages"]], "kb", mode=args["mode"], source_name=args["source"])
+elif action == "remove_source":
+    assert backend.remove_source("kb", args["source"])[0]
+elif action == "delete":
+    assert backend.delete_collection("kb")[0]
+"""
+
+
+@pytest.fixture
+def backend(tmp_path, kb_index_dir, monkeypatch):
+    monkeypatch.setattr(local_kb, "iter_pdf_pages", iter)
+    monkeypatch.setattr(local_kb, "get_embeddings", fake_embeddings)
+    return LocalKnowledgeBase(root_dir=str(tmp_path / "local_kb"))
+
+
+def _in_other_process(backend, kb_index_dir, action: str, **args):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    subprocess.run([sys.executable, "-c", _WORKER, backend.root_dir, str(kb_index_dir), action,
+                    json.dumps(args, ensure_ascii=False)], cwd=ROOT, env=env, check=True, timeout=120)
+
+
+def _top_vector_hit(backend, text):
+    contexts = backend.vector_retrieve_by_clauses([text], "kb", k=1, clause_embeddings=[fake_embedding(text)])
+    return contexts[0][0]["text"] if contexts else None
+
+
+def _top_lexical_hit(backend, text):
+    index = backend.lexical.get("kb")
+    hits = index.search(text, 1) if index is not None else []
+    return hits[0]["text"] if hits else None
+
+
+def test_rebuild_in_other_process_is_visible(backend, kb_index_dir):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    old = "第一条 买方逾期付款的，应当按日支付违约金。"
+    assert _top_vector_hit(backend, old) == old
+    assert _top_lexical_hit(backend, "逾期付款") == old
+    assert backend.lookup_articles("kb", [1])[1][0]["source"] == "a.pdf"
+
+    _in_other_process(backend, kb_index_dir, "build", pages=LAW_B, mode="rebuild", source="b.pdf")
+
+    new = "第一条 承租人应当按照约定的方法使用租赁物。"
+    assert _top_vector_hit(backend, new) == new
+    assert backend._open("kb").count == 2
+    assert _top_lexical_hit(backend, "逾期付款") is None
+    assert _top_lexical_hit(backend, "租赁物") in (new, "第二条 出租人应当履行租赁物的维修义务。")
+    assert [hit["source"] for hit in backend.lookup_articles("kb", [1])[1]] == ["b.pdf"]
+
+
+def test_append_and_remove_source_in_other_process_are_visible(backend, kb_index_dir):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    assert len(backend.lexical.get("kb")) == 2
+
+    _in_other_process(backend, kb_index_dir, "build", pages=LAW_B, mode="append", source="b.pdf")
+    assert backend._open("kb").count == 4
+    assert len(backend.lexical.get("kb")) == 4
+    assert {hit["source"] for hit in backend.lookup_articles("kb", [1])[1]} == {"a.pdf", "b.pdf"}
+
+    _in_other_process(backend, kb_index_dir, "remove_source", source="a.pdf")
+    assert {record["source"] for record in backend._open("kb").records} == {"b.pdf"}
+    assert _top_lexical_hit(backend, "逾期付款") is None
+    assert [hit["source"] for hit in backend.lookup_articles("kb", [1])[1]] == ["b.pdf"]
+
+
+def test_delete_in_other_process_is_visible(backend, kb_index_dir):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    assert backend.lexical.get("kb") is not None and backend.articles.get("kb") is not None
+
+    _in_other_process(backend, kb_index_dir, "delete")
+
+    assert not backend.has_collection("kb")
+    assert backend.lexical.get("kb") is None
+    assert backend.articles.get("kb") is None
+    assert backend.lookup_articles("kb", [1]) == {}
+    assert backend.retrieve_by_clauses(["逾期付款"], "kb", clause_embeddings=[fake_embedding("逾期付款")]) == {}
+
+
+class _FakeCollection:
+    """Milvus 集合句柄的替身"""
+    def __init__(self, name):
+        self.name = name
+        self.num_entities = 1
+
+    def load(self):
+        pass
+
+    def release(self):
+        pass
+
+
+def test_collection_handles_follow_generation_marker(tmp_path, monkeypatch):
+    monkeypatch.setattr(collection_manager, "Collection", _FakeCollection)
+    state_dir = str(tmp_path / ".generations")
+    worker_a = CollectionManager(1024, state_dir=state_dir)
+    worker_b = CollectionManager(1024, state_dir=state_dir)   # 与 worker_a 共用标记目录，代表另一个工作进程
+
+    with worker_a.use("kb") as handle:
+        pass
+    assert worker_a.get("kb") is handle and worker_a.stats()["loaded"] == ["kb"]
+
+    worker_b.invalidate("kb")          # 另一个进程重建了集合
+    assert worker_a.get("kb") is not handle
+    assert worker_a.stats()["loaded"] == []
+
+    handle = worker_a.get("kb")
+    worker_a.invalidate("kb", notify=False)   # 仅本进程的重试，不通知其他进程
+    assert worker_b.get("kb") is worker_b.get("kb")
+    assert worker_a.get("kb") is not handle
@@ -0,0 +1,50 @@
+# 文件名: tests/test_documents.py
+import os
+import hashlib
+
+from app.core.documents import ContractDocument, DocumentStore
+
+
+def _document(no: int) -> ContractDocument:
+    document_id = hashlib.sha256(str(no).encode()).hexdigest()
+    return ContractDocument(document_id, f"第一条 合同{no}正文。" * 200, f"{no}.pdf",
+                            clause_embeddings=[[0.1] * 8])
+
+
+def _stored_ids(disk_dir) -> set[str]:
+    return {name[:-len(".json")] for name in os.listdir(disk_dir) if name.endswith(".json")}
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    store = DocumentStore(max_entries=1, disk_dir=str(tmp_path))
+    documents = [_document(no) for no in range(3)]
+    store.update(documents[0])
+    store.update(documents[1])
+    # 容量只够保存两份合同（留出少量余量，created_at 的长度不同会使文件大小相差几个字节）
+    store.max_disk_bytes = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) + 64
+    for no, document in enumerate(documents[:2]):
+        os.utime(tmp_path / f"{document.id}.json", (1000 + no, 1000 + no))
+
+    # 从磁盘读取合同 0 会刷新其使用时间，写入合同 2 时淘汰的是合同 1
+    assert store.get(documents[0].id) is not None
+    store.update(documents[2])
+    assert _stored_ids(tmp_path) == {documents[0].id, documents[2].id}
+    assert not os.path.exists(tmp_path / f"{documents[1].id}.npy")
+
+
+def test_disk_tier_keeps_latest_document_even_if_oversized(tmp_path):
+    store = DocumentStore(max_entries=4, disk_dir=str(tmp_path), max_disk_mb=0)
+    document = _document(0)
+    store.update(document)
+    assert _stored_ids(tmp_path) == {document.id}
+
+
+def test_disk_write_failure_is_logged_not_raised(tmp_path, caplog):
+    disk_dir = tmp_path / "documents"
+    store = DocumentStore(max_entries=4, disk_dir=str(disk_dir))
+    os.rmdir(disk_dir)
+    document = _document(0)
+    store.update(document)
+    assert "写入合同文档缓存" in caplog.text
+    # 内存层仍然可用
+    assert store.get(document.id) is document
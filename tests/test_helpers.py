@@ -0,0 +1,64 @@
+# 文件名: tests/test_helpers.py
+import pytest
+from app.utils.helpers import parse_chinese_number, find_article_refs, find_statute_refs, split_contract_clauses
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("五百八十五", 585),
+    ("一百零五", 105),
+    ("十二", 12),
+    ("十", 10),
+    ("两千零一", 2001),
+    ("585", 585),
+    ("５８５", 585),
+])
+def test_parse_chinese_number(text, expected):
+    assert parse_chinese_number(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "第五条", "五a", "abc", "²", "1²", "9" * 5000])
+def test_parse_chinese_number_rejects_invalid(text):
+    assert parse_chinese_number(text) is None
+
+
+def test_find_article_refs_deduplicates_in_order():
+    text = "依据民法典第五百八十五条及第577条，参照第五百八十五条、第一百零五条处理。"
+    assert find_article_refs(text) == [585, 577, 105]
+
+
+def test_find_article_refs_handles_empty_text():
+    assert find_article_refs("") == []
+    assert find_article_refs(None) == []
+    assert find_article_refs("本合同未引用任何法条") == []
+
+
+def test_find_statute_refs_ignores_contract_clause_numbers():
+    text = ("第一条 合同标的\n本合同标的为办公设备一批。\n"
+            "第二条 付款\n买方应于收货后三十日内付款。\n"
+            "第三条 违约责任\n违约方应依据《民法典》第五百八十五条支付违约金，本合同第二条另有约定的除外。\n"
+            "第十二条 其他\n本合同一式两份。")
+    assert find_article_refs(text) == [1, 2, 3, 585, 12]
+    assert find_statute_refs(text) == [585]
+
+
+def test_find_statute_refs_follows_chained_citations():
+    text = "依据《中华人民共和国民法典》第五百七十七条、第五百八十五条第二款和第586条处理；参照合同法第107条。"
+    assert find_statute_refs(text) == [577, 585, 586, 107]
+    assert find_statute_refs("") == []
+
+
+def test_split_contract_clauses_by_heading():
+    text = ("采购合同\n"
+            "第一条 标的物为办公设备一批，具体规格见附件一。\n"
+            "第二条 买方应于收货后三十日内支付全部货款，逾期按日万分之五支付违约金。\n"
+            "第三条 因本合同产生的争议，提交买方所在地人民法院诉讼解决。")
+    clauses = split_contract_clauses(text)
+    assert len(clauses) == 3
+    assert clauses[0].startswith("采购合同")
+    assert clauses[1].startswith("第二条")
+    assert clauses[2].startswith("第三条")
+
+
+def test_split_contract_clauses_does_not_split_on_amounts():
+    text = "第一条 合同总价款为1.5万元，含税。付款方式为银行转账，收款账户见合同首页。"
+    assert split_contract_clauses(text) == [text]
@@ -0,0 +1,77 @@
+# 文件名: tests/test_ingestion.py
+from app.db.ingestion import iter_article_chunks, run_ingestion_pipeline
+from tests.conftest import fake_embeddings
+
+LAW_PAGES = [
+    (1, "中华人民共和国示例法\n"
+        "第一编 总则\n"
+        "第一章 一般规定\n"
+        "第一条 为了规范合同行为，制定本法。\n"
+        "第二条 本法所称合同是民事主体之间设立、变更、终止民事法律关系的协议。\n"),
+    (2, "第二章 合同的订立\n"
+        "第三条 当事人订立合同，可以采取书面形式、口头形式或者其他形式。依照本法\n"
+        "第二条 的规定订立的合同受法律保护。\n"),
+]
+
+
+def _chunks(pages, **kwargs):
+    return list(iter_article_chunks(pages, **kwargs))
+
+
+def test_article_chunks_split_on_article_headings():
+    chunks = _chunks(LAW_PAGES)
+    articles = [(fields["article_no"], page) for _, page, fields in chunks if fields["article_no"]]
+    assert articles == [(1, 1), (2, 1), (3, 2)]
+
+
+def test_article_chunks_track_chapters():
+    by_article = {fields["article_no"]: fields["chapter"] for _, _, fields in _chunks(LAW_PAGES)}
+    assert by_article[1] == "第一编 总则 / 第一章 一般规定"
+    assert by_article[3] == "第一编 总则 / 第二章 合同的订立"
+
+
+def test_heading_lines_are_not_part_of_chunks():
+    texts = [text for text, _, _ in _chunks(LAW_PAGES)]
+    assert not any("第一章 一般规定" in text or "第二章 合同的订立" in text for text in texts)
+
+
+def test_reference_at_line_start_stays_in_current_article():
+    # 第 2 页的“第二条 的规定……”是第三条正文中换行后的引用，条号没有递增，不应切出新的条文
+    article_three = next(text for text, _, fields in _chunks(LAW_PAGES) if fields["article_no"] == 3)
+    assert article_three.endswith("依照本法\n第二条 的规定订立的合同受法律保护。")
+
+
+def test_preamble_without_article_structure_is_loose():
+    chunks = _chunks(LAW_PAGES)
+    text, page, fields = chunks[0]
+    assert "中华人民共和国示例法" in text
+    assert page == 1 and fields["article_no"] == 0
+
+
+def test_long_article_is_split_by_sentence():
+    body = "当事人应当按照约定全面履行自己的义务。" * 20
+    chunks = _chunks([(1, f"第一条 {body}\n")], chunk_size=100)
+    assert len(chunks) > 1
+    assert all(len(text) <= 100 for text, _, _ in chunks)
+    assert {fields["article_no"] for _, _, fields in chunks} == {1}
+
+
+def test_pipeline_deduplicates_and_skips_existing():
+    pages = [(1, "第一条 甲方应按期付款。\n第二条 乙方应按期交货。\n第三条 甲方应按期付款。\n")]
+    inserted = []
+
+    def insert_rows(rows):
+        inserted.extend(rows)
+        return len(rows)
+
+    existing = set()
+
+    def existing_hashes(hashes):
+        return existing.intersection(hashes)
+
+    stats = run_ingestion_pipeline(pages, fake_embeddings, insert_rows, existing_hashes)
+    assert stats["chunks"] == 3
+    assert stats["inserted"] == 3   # 条号不同，文本也不同
+    existing.update(row[2] for row in inserted)
+    stats = run_ingestion_pipeline(pages, fake_embeddings, insert_rows, existing_hashes)
+    assert stats["inserted"] == 0 and stats["skipped"] == 3
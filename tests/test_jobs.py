@@ -0,0 +1,67 @@
+# 文件名: tests/test_jobs.py
+import time
+from app.core.jobs import JobManager
+
+
+def _wait(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job.to_dict()
+        time.sleep(0.01)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内结束")
+
+
+def _manager(tmp_path):
+    return JobManager(max_workers=2, ttl_seconds=60, state_dir=str(tmp_path / "jobs"))
+
+
+def test_job_succeeds_with_stage_progress(tmp_path):
+    manager = _manager(tmp_path)
+
+    def work(job, value):
+        job.update_stage("extract", "running")
+        job.update_stage("extract", "done")
+        return {"value": value}
+
+    job = manager.submit("demo", ["extract"], work, 42)
+    state = _wait(manager, job.id)
+    assert state["status"] == "succeeded" and state["progress"] == 1.0
+    assert state["result"] == {"value": 42}
+    assert state["stages"]["extract"]["status"] == "done"
+    manager.shutdown()
+
+
+def test_exception_marks_running_stage_failed(tmp_path):
+    manager = _manager(tmp_path)
+
+    def work(job):
+        job.update_stage("extract", "running")
+        job.update_stage("extract", "done")
+        job.update_stage("review", "running")
+        raise RuntimeError("LLM 不可用")
+
+    job = manager.submit("demo", ["extract", "review"], work)
+    state = _wait(manager, job.id)
+    assert state["status"] == "failed" and "LLM 不可用" in state["error"]
+    assert state["stages"]["extract"]["status"] == "done"
+    assert state["stages"]["review"]["status"] == "failed"
+    assert state["stages"]["review"]["finished_at"] is not None
+    manager.shutdown()
+
+
+def test_error_result_marks_running_stage_failed(tmp_path):
+    manager = _manager(tmp_path)
+
+    def work(job):
+        job.update_stage("extract", "running")
+        return {"error": "无法从PDF中提取文本内容"}
+
+    job = manager.submit("demo", ["extract"], work)
+    _wait(manager, job.id)
+    manager.shutdown()
+    # 其他工作进程从状态文件读到的也是最终状态
+    persisted = _manager(tmp_path).get(job.id).to_dict()
+    assert persisted["status"] == "failed"
+    assert persisted["stages"]["extract"]["status"] == "failed"
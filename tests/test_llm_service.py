@@ -0,0 +1,49 @@
+# 文件名: tests/test_llm_service.py
+from types import SimpleNamespace
+import pytest
+from app.services import llm_service
+
+
+def _response(records):
+    return SimpleNamespace(status_code=200, message="", output={"embeddings": records})
+
+
+@pytest.fixture
+def embedding_api(monkeypatch):
+    """依次返回 responses 中的响应，并记录调用次数"""
+    api = SimpleNamespace(responses=[], calls=0)
+
+    def call(model, input):
+        api.calls += 1
+        return api.responses.pop(0)
+
+    monkeypatch.setattr(llm_service, "_get_dashscope", lambda: SimpleNamespace(TextEmbedding=SimpleNamespace(call=call)))
+    monkeypatch.setattr(llm_service, "embedding_rate_limiter", SimpleNamespace(acquire=lambda: None))
+    monkeypatch.setattr(llm_service, "EMBEDDING_RETRY_BASE_DELAY", 0)
+    return api
+
+
+def test_embeddings_follow_text_index(embedding_api):
+    embedding_api.responses = [_response([{"text_index": 1, "embedding": [2.0]}, {"text_index": 0, "embedding": [1.0]}])]
+    assert llm_service._embed_batch(["甲", "乙"], "m") == [[1.0], [2.0]]
+
+
+def test_embeddings_without_text_index_use_position_only_when_counts_match(embedding_api):
+    embedding_api.responses = [_response([{"embedding": [1.0]}, {"embedding": [2.0]}])]
+    assert llm_service._embed_batch(["甲", "乙"], "m") == [[1.0], [2.0]]
+
+
+def test_unalignable_response_is_retried(embedding_api):
+    embedding_api.responses = [
+        _response([{"embedding": [1.0]}]),
+        _response([{"text_index": 0, "embedding": [1.0]}, {"embedding": [2.0]}]),
+        _response([{"text_index": 0, "embedding": [1.0]}, {"text_index": 1, "embedding": [2.0]}]),
+    ]
+    assert llm_service._embed_batch(["甲", "乙"], "m") == [[1.0], [2.0]]
+    assert embedding_api.calls == 3
+
+
+def test_unalignable_response_never_fills_wrong_slot(embedding_api, monkeypatch):
+    monkeypatch.setattr(llm_service, "EMBEDDING_MAX_RETRIES", 1)
+    embedding_api.responses = [_response([{"embedding": [1.0]}])] * 2
+    assert llm_service._embed_batch(["甲", "乙"], "m") == [None, None]
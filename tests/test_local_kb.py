@@ -0,0 +1,85 @@
+# 文件名: tests/test_local_kb.py
+import numpy as np
+import pytest
+from app.db import local_kb
+from app.db.local_kb import LocalKnowledgeBase
+from tests.conftest import fake_embedding, fake_embeddings
+
+LAW_A = [(1, "第一条 买方逾期付款的，应当按日支付违约金。\n第二条 出卖人应当按期交付标的物。\n"),
+         (2, "第三条 当事人一方不履行合同义务的，应当承担违约责任。\n")]
+LAW_B = [(1, "第一条 承租人应当按照约定的方法使用租赁物。\n")]
+
+
+@pytest.fixture
+def backend(tmp_path, kb_index_dir, monkeypatch):
+    """数据写入临时目录的本地后端；页面直接以 [(页码, 文本)] 传入，向量由文本哈希生成"""
+    monkeypatch.setattr(local_kb, "iter_pdf_pages", iter)
+    monkeypatch.setattr(local_kb, "get_embeddings", fake_embeddings)
+    return LocalKnowledgeBase(root_dir=str(tmp_path / "local_kb"))
+
+
+def _search(backend, text, k=1):
+    return backend.vector_retrieve_by_clauses([text], "kb", k=k, clause_embeddings=[fake_embedding(text)])[0]
+
+
+def test_build_and_exact_search(backend):
+    assert backend.build_and_store(LAW_A, "kb", source_name="a.pdf") == 3
+    assert backend.is_ready("kb")
+    query = "第三条 当事人一方不履行合同义务的，应当承担违约责任。"
+    hits = _search(backend, query, k=3)
+    assert hits[0]["text"] == query
+    assert hits[0]["distance"] == pytest.approx(0, abs=1e-4)
+    assert [hit["distance"] for hit in hits] == sorted(hit["distance"] for hit in hits)
+
+
+def test_append_skips_existing_chunks(backend):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    assert backend.build_and_store(LAW_A, "kb", mode="append", source_name="a.pdf") == 0
+    assert backend.build_and_store(LAW_B, "kb", mode="append", source_name="b.pdf") == 1
+    assert backend._open("kb").count == 4
+
+
+def test_remove_source_compacts_collection(backend):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    backend.build_and_store(LAW_B, "kb", mode="append", source_name="b.pdf")
+    ok, _ = backend.remove_source("kb", "a.pdf")
+    assert ok
+    collection = backend._open("kb")
+    assert collection.count == 1
+    assert [record["source"] for record in collection.records] == ["b.pdf"]
+    assert backend.lookup_articles("kb", [3]) == {}
+    assert backend.lookup_articles("kb", [1])[1][0]["source"] == "b.pdf"
+
+
+def test_float16_storage(tmp_path, kb_index_dir, monkeypatch):
+    monkeypatch.setattr(local_kb, "iter_pdf_pages", iter)
+    monkeypatch.setattr(local_kb, "get_embeddings", fake_embeddings)
+    backend = LocalKnowledgeBase(root_dir=str(tmp_path / "local_kb"), dtype="float16")
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    assert backend._open("kb").vectors.dtype == np.float16
+    query = "第二条 出卖人应当按期交付标的物。"
+    assert _search(backend, query)[0]["text"] == query
+
+
+def test_hybrid_retrieval_and_article_lookup(backend):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    contexts = backend.retrieve_by_clauses(["逾期付款违约金"], "kb", k=2,
+                                           clause_embeddings=[fake_embedding("逾期付款违约金")])
+    assert contexts[0][0]["text"].startswith("第一条 买方逾期付款")
+    hits = backend.lookup_articles("kb", [2, 9])
+    assert list(hits) == [2]
+    assert hits[2][0]["text"] == "第二条 出卖人应当按期交付标的物。"
+
+
+def test_delete_collection(backend):
+    backend.build_and_store(LAW_A, "kb", source_name="a.pdf")
+    assert backend.list_all_collections() == (True, ["kb"])
+    ok, _ = backend.delete_collection("kb")
+    assert ok and not backend.has_collection("kb")
+    assert backend.lexical.get("kb") is None and backend.articles.get("kb") is None
+    assert backend.vector_retrieve_by_clauses(["任意"], "kb") == {}
+
+
+def test_rejects_invalid_names(backend):
+    with pytest.raises(ValueError):
+        backend.has_collection("../escape")
@@ -0,0 +1,64 @@
+# 文件名: tests/test_metrics.py
+import os
+import json
+
+import pytest
+
+from app.utils import metrics
+from app.utils.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_worker_snapshot(metrics_dir, pid: int, requests: int, in_flight: int, age: float = 0):
+    worker = MetricsRegistry()
+    worker.inc("test_requests_total", requests, route="/review")
+    worker.add_gauge("test_in_flight", in_flight)
+    for _ in range(requests):
+        worker.observe("test_seconds", 0.2)
+    path = metrics_dir / f"{pid}.json"
+    path.write_text(json.dumps(worker.snapshot()), encoding="utf-8")
+    if age:
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+
+
+def _sample(text: str, line_prefix: str):
+    for line in text.splitlines():
+        if line.startswith(metrics.PREFIX + line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_dead_worker_counters_are_archived(metrics_dir):
+    _write_worker_snapshot(metrics_dir, 1000001, requests=3, in_flight=2)
+    _write_worker_snapshot(metrics_dir, 1000002, requests=4, in_flight=1)
+    text = metrics.render_all()
+    assert _sample(text, 'test_requests_total{route="/review"}') == 7
+    assert _sample(text, "test_in_flight") == 3
+
+    # 进程 1000001 退出：快照被归档并删除，计数器与直方图不减少，仪表盘不再包含它
+    mtime = os.path.getmtime(metrics_dir / "1000001.json") - metrics.METRICS_STALE_SECONDS - 1
+    os.utime(metrics_dir / "1000001.json", (mtime, mtime))
+    for _ in range(2):
+        text = metrics.render_all()
+        assert not os.path.exists(metrics_dir / "1000001.json")
+        assert _sample(text, 'test_requests_total{route="/review"}') == 7
+        assert _sample(text, "test_seconds_count") == 7
+        assert _sample(text, "test_in_flight") == 1
+
+
+def test_archive_accumulates_across_restarts(metrics_dir):
+    stale = metrics.METRICS_STALE_SECONDS + 1
+    _write_worker_snapshot(metrics_dir, 1000001, requests=3, in_flight=1, age=stale)
+    metrics.render_all()
+    _write_worker_snapshot(metrics_dir, 1000002, requests=5, in_flight=1, age=stale)
+    text = metrics.render_all()
+    assert _sample(text, 'test_requests_total{route="/review"}') == 8
+    assert _sample(text, "test_in_flight") is None
+    archived = json.loads((metrics_dir / "archived.json").read_text(encoding="utf-8"))
+    assert archived["gauges"] == []
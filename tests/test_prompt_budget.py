@@ -0,0 +1,99 @@
+# 文件名: tests/test_prompt_budget.py
+import pytest
+from app.services import prompt_budget
+from app.services.prompt_budget import (
+    estimate_tokens, truncate_to_tokens, take_within_budget, select_model, plan_prompt, strip_boilerplate
+)
+from app.utils.pdf import PAGE_BREAK
+
+PROFILES = {
+    "small": {"context_tokens": 1000, "cost": 1.0},
+    "medium": {"context_tokens": 4000, "cost": 2.0},
+    "large": {"context_tokens": 100000, "cost": 4.0},
+}
+
+
+@pytest.fixture
+def model_profiles(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "LLM_MODEL_PROFILES", PROFILES)
+    monkeypatch.setattr(prompt_budget, "LLM_STAGE_MODELS", {"review": ["large", "small", "medium"]})
+    monkeypatch.setattr(prompt_budget, "LLM_OUTPUT_RESERVE_TOKENS", {"review": 200})
+    monkeypatch.setattr(prompt_budget, "TOKEN_ESTIMATE_SAFETY", 1.0)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("违约金") == 3
+    assert estimate_tokens("contract") == 2
+    assert estimate_tokens("12345") == 2
+    assert estimate_tokens("甲方 pays 100 元!") == 2 + 1 + 1 + 1 + 1
+
+
+def test_truncate_to_tokens():
+    text = "违约" * 50
+    assert truncate_to_tokens(text, 1000) == text
+    truncated = truncate_to_tokens(text, 10)
+    assert truncated == text[:10]
+    assert estimate_tokens(truncated) <= 10
+
+
+def test_take_within_budget_stops_at_budget():
+    docs = ["一二三四五", "六七八九十", "甲乙丙丁戊"]
+    assert take_within_budget(docs, 10) == docs[:2]
+    assert take_within_budget(docs, 9) == docs[:1]
+    assert take_within_budget(docs, 100) == docs
+
+
+def test_take_within_budget_keeps_at_least_one():
+    assert take_within_budget(["很长的一条法条" * 10], 1) == ["很长的一条法条" * 10]
+    assert take_within_budget([], 10) == []
+
+
+def test_select_model_picks_cheapest_that_fits(model_profiles):
+    assert select_model("review", 500) == "small"
+    assert select_model("review", 801) == "medium"
+    assert select_model("review", 50000) == "large"
+
+
+def test_select_model_falls_back_to_largest_window(model_profiles):
+    assert select_model("review", 10 ** 6) == "large"
+
+
+def test_plan_prompt_estimates_whole_prompt(model_profiles):
+    assert plan_prompt("review", "审" * 500) == "small"
+    assert plan_prompt("review", "审" * 3000, parts={"contract": "审" * 3000}) == "medium"
+
+
+def _contract_pages(count: int) -> list[str]:
+    pages = []
+    for no in range(1, count + 1):
+        pages.append("\n".join([
+            "某某科技有限公司采购合同",
+            f"第{no}条 违约责任",
+            "违约责任",
+            "甲方（盖章）：",
+            "| 货物名称 | 数量 | 单价 |",
+            f"本页第{no}项约定以双方确认为准。",
+            "合同编号：HT-2024-001",
+            f"第 {no} 页 共 {count} 页",
+        ]))
+    return pages
+
+
+def test_strip_boilerplate_removes_page_headers_only():
+    text = strip_boilerplate(PAGE_BREAK.join(_contract_pages(4)))
+    assert "某某科技有限公司采购合同" not in text
+    assert "合同编号" not in text
+    assert "第 1 页" not in text
+    # 正文中在每页重复出现、但不在页首页尾的内容保留
+    assert text.count("违约责任") == 8
+    assert text.count("甲方（盖章）：") == 4
+    assert text.count("| 货物名称 | 数量 | 单价 |") == 4
+
+
+def test_strip_boilerplate_keeps_repeated_body_lines_without_page_breaks():
+    body = "\n".join(["第一条 违约责任", "违约责任", "甲方（盖章）：", "违约责任", "甲方（盖章）：",
+                      "违约责任", "甲方（盖章）：", "第二条 争议解决。"])
+    text = strip_boilerplate(body)
+    assert text.count("违约责任") == 4
+    assert text.count("甲方（盖章）：") == 3
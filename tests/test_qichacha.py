@@ -0,0 +1,114 @@
+# 文件名: tests/test_qichacha.py
+"""启动 scripts/qichacha_stub_server.py，以桩服务实际收到的请求数检验客户端的缓存、并发合并、限流与重试"""
+import os
+import re
+import sys
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.services.cache import PersistentTTLCache
+from app.services.qichahca_service import QichachaClient
+from app.utils.rate_limit import TokenBucket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = os.path.join(ROOT, "scripts", "qichacha_stub_server.py")
+
+
+class StubServer:
+    """在子进程中运行的桩服务；requests 为桩服务输出的请求记录（每个上游请求一行）"""
+    def __init__(self, *args: str):
+        env = dict(os.environ, QICHACHA_APP_KEY="test", QICHACHA_SECRET_KEY="test", PYTHONUNBUFFERED="1")
+        self.process = subprocess.Popen([sys.executable, STUB, "--port", "0", *args], env=env,
+                                        stdout=subprocess.PIPE, text=True, encoding="utf-8")
+        banner = self.process.stdout.readline()
+        match = re.search(r"(http://\S+)", banner)
+        if not match:
+            self.stop()
+            raise RuntimeError(f"桩服务启动失败: {banner!r}")
+        self.url = match.group(1)
+        self.requests = []
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            if line.startswith("["):
+                self.requests.append(line.strip())
+
+    def request_count(self, settle: float = 0.2) -> int:
+        time.sleep(settle)  # 等待读取线程收到最后几行输出
+        return len(self.requests)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+@pytest.fixture
+def stub_server(request):
+    server = StubServer(*getattr(request, "param", ()))
+    yield server
+    server.stop()
+
+
+def _client(server: StubServer, tmp_path, rate_limiter: TokenBucket = None) -> QichachaClient:
+    cache = PersistentTTLCache(str(tmp_path / "qichacha.sqlite3"), ttl_seconds=3600, max_entries=100)
+    return QichachaClient("test", "test", server.url, timeout=5, cache=cache, rate_limiter=rate_limiter)
+
+
+def test_repeat_lookup_is_served_from_cache(stub_server, tmp_path):
+    client = _client(stub_server, tmp_path)
+    first = client.get_company_info("某某科技（北京）有限公司")
+    assert first["Name"] == "某某科技（北京）有限公司"
+    assert stub_server.request_count() == 1
+
+    # 括号、首尾空白写法不同的同一公司名也命中缓存
+    assert client.get_company_info(" 某某科技(北京)有限公司 ") == first
+    assert stub_server.request_count() == 1
+    assert client.stats()["cache"]["hits"] == 1
+
+    # 缓存持久化：新客户端（模拟进程重启）同样不访问网络
+    assert _client(stub_server, tmp_path).get_company_info("某某科技（北京）有限公司") == first
+    assert stub_server.request_count() == 1
+
+
+def test_failed_lookup_is_not_cached(stub_server, tmp_path):
+    client = _client(stub_server, tmp_path)
+    assert "error" in client.get_company_info("不存在的公司")
+    assert "error" in client.get_company_info("不存在的公司")
+    assert stub_server.request_count() == 2
+
+
+@pytest.mark.parametrize("stub_server", [("--latency", "0.5")], indirect=True)
+def test_concurrent_lookups_are_coalesced(stub_server, tmp_path):
+    client = _client(stub_server, tmp_path)
+    callers = 8
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        results = list(executor.map(lambda _: client.get_company_info("某某贸易有限公司"), range(callers)))
+    assert all(result == results[0] and result["Name"] == "某某贸易有限公司" for result in results)
+    assert stub_server.request_count() == 1
+    stats = client.stats()
+    assert stats["requests_sent"] == 1
+    assert stats["coalesced"] == callers - 1
+
+
+def test_rate_limiter_spaces_out_requests(stub_server, tmp_path):
+    client = _client(stub_server, tmp_path, rate_limiter=TokenBucket(rate=5, capacity=1))
+    start = time.monotonic()
+    for no in range(4):
+        assert "error" not in client.get_company_info(f"第{no}号有限公司")
+    # 桶容量为 1：第一个请求立即发出，其后每个请求至少等待 0.2 秒
+    assert time.monotonic() - start >= 0.55
+    assert stub_server.request_count() == 4
+
+
+@pytest.mark.parametrize("stub_server", [("--fail-first", "2")], indirect=True)
+def test_transient_errors_are_retried(stub_server, tmp_path):
+    client = _client(stub_server, tmp_path)
+    result = client.get_company_info("某某科技有限公司")
+    assert result["Name"] == "某某科技有限公司"
+    # 两次 503 后第三次成功，对调用方只算一次查询
+    assert stub_server.request_count() == 3
+    assert client.stats()["requests_sent"] == 1
@@ -0,0 +1,119 @@
+# 文件名: tests/test_retrieval.py
+import os
+import numpy as np
+import pytest
+from app.db.base import KnowledgeBaseBackend
+from app.db.lexical import BM25Index, LexicalIndexStore, tokenize, reciprocal_rank_fusion
+
+DOCS = [
+    "买方逾期付款的，应当按日支付违约金。",
+    "出卖人应当按照约定的期限交付标的物。",
+    "当事人一方不履行合同义务的，应当承担违约责任。",
+]
+
+
+def test_tokenize_uses_character_bigrams():
+    assert tokenize("违约金 ABC12") == ["违约", "约金", "abc12"]
+    assert tokenize("甲") == ["甲"]
+
+
+def test_bm25_ranks_matching_document_first(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(DOCS, "law.pdf")
+    hits = index.search("逾期付款违约金", 3)
+    assert hits[0]["text"] == DOCS[0]
+    assert all(hit["score"] > 0 for hit in hits)
+    assert index.search("完全无关的查询词", 3) == []
+
+
+def test_bm25_reloads_snapshot_and_replays_log(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(DOCS[:2], "a.pdf")
+    index.flush()
+    index.add(DOCS[2:], "b.pdf")   # 快照之后追加、尚未 flush 的文档从日志重放
+    reloaded = BM25Index(str(tmp_path))
+    assert len(reloaded) == 3
+    assert reloaded.search("违约责任", 1)[0]["text"] == DOCS[2]
+    assert reloaded.search("交付标的物", 1) == index.search("交付标的物", 1)
+
+
+def test_bm25_remove_source(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(DOCS[:2], "a.pdf")
+    index.add(DOCS[2:], "b.pdf")
+    assert index.remove_source("a.pdf") == 2
+    assert index.remove_source("a.pdf") == 0
+    assert len(BM25Index(str(tmp_path))) == 1
+    assert index.search("违约金", 3)[0]["text"] == DOCS[2]
+
+
+def test_lexical_store_get_and_drop(tmp_path):
+    store = LexicalIndexStore(str(tmp_path))
+    assert store.get("kb") is None
+    store.get("kb", create=True).add(DOCS, "law.pdf")
+    assert store.exists("kb")
+    assert store.stats() == {"kb": 3}
+    store.drop("kb")
+    assert store.get("kb") is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [text for text, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+class _FakeBackend(KnowledgeBaseBackend):
+    """向量检索返回预设排名的后端，用于检验混合检索的融合逻辑"""
+    name = "fake"
+
+    def __init__(self, vector_ranked: list[str]):
+        super().__init__()
+        self.vector_ranked = vector_ranked
+        self.requested_k = None
+
+    def vector_retrieve_by_clauses(self, clauses, collection_name, k=3, clause_embeddings=None):
+        self.requested_k = k
+        return {i: [{"text": text, "distance": rank} for rank, text in enumerate(self.vector_ranked[:k])]
+                for i in range(len(clauses))}
+
+
+def test_retrieve_by_clauses_fuses_vector_and_lexical(kb_index_dir):
+    backend = _FakeBackend(vector_ranked=[DOCS[1], DOCS[2]])
+    backend.lexical.get("kb", create=True).add(DOCS, "law.pdf")
+    contexts = backend.retrieve_by_clauses(["当事人不履行合同义务应承担违约责任"], "kb", k=2)
+    texts = [doc["text"] for doc in contexts[0]]
+    # DOCS[2] 在两路中都排名靠前，融合后排第一
+    assert texts == [DOCS[2], DOCS[1]]
+    assert backend.requested_k >= 2
+    distances = [doc["distance"] for doc in contexts[0]]
+    assert distances == sorted(distances)
+
+
+def test_retrieve_by_clauses_without_lexical_index_is_vector_only(kb_index_dir):
+    backend = _FakeBackend(vector_ranked=DOCS)
+    contexts = backend.retrieve_by_clauses(["任意条款"], "kb", k=2)
+    assert [doc["text"] for doc in contexts[0]] == DOCS[:2]
+    assert backend.requested_k == 2
+
+
+def test_merge_clause_contexts_keeps_best_distance():
+    merged = KnowledgeBaseBackend.merge_clause_contexts({
+        0: [{"text": "a", "distance": 0.5}, {"text": "b", "distance": 0.2}],
+        1: [{"text": "a", "distance": 0.1}],
+    }, max_docs=5)
+    assert merged == ["a", "b"]
+
+
+def test_bm25_snapshot_loads_without_pickle(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(DOCS, "law.pdf")
+    index.flush()
+    os.remove(tmp_path / "docs.jsonl")   # 只从快照加载，不重放文档日志
+    reloaded = BM25Index(str(tmp_path))
+    assert reloaded.sources == ["law.pdf"] * 3
+    assert reloaded.search("违约金", 3) == index.search("违约金", 3)
+    reloaded.add(["买方应当支付价款。"], "more.pdf")   # 从快照加载的倒排表仍可增量追加
+    assert reloaded.search("支付价款", 1)[0]["text"] == "买方应当支付价款。"
+    with np.load(tmp_path / "bm25.npz", allow_pickle=False) as state:
+        assert state["ids"].dtype == np.int32
@@ -8,6 +8,17 @@ import base64
 # --- 配置 ---
 # 确保这里的地址和端口与你的 Flask 应用 (run.py) 匹配
 API_BASE_URL = "http://127.0.0.1:6045"
+JOB_POLL_INTERVAL = 2      # 轮询任务状态的间隔（秒）
+JOB_POLL_TIMEOUT = 1800    # 等待单个任务完成的最长时间（秒）
+
+# 各审查阶段在界面上的显示名称
+STAGE_LABELS = {
+    "extract": "提取合同文本",
+    "summarize": "生成合同摘要",
+    "extract_parties": "识别合同主体",
+    "retrieve": "检索法律依据",
+    "review": "审查条款风险",
+}
 
 
 # --- 页面美化辅助函数 ---
@@ -99,6 +110,101 @@ def api_request(method, endpoint, data=None, files=None):
             st.error(f"无法解析服务器错误响应。")
         return None
 
+def wait_for_job(submit_response):
+    """轮询异步任务直到结束，期间展示各阶段进度；成功时返回任务结果，失败时返回 None"""
+    if not submit_response or not submit_response.get('job_id'):
+        return None
+    job_id = submit_response['job_id']
+    progress_bar = st.progress(0.0, text="任务已提交，等待执行...")
+    stage_placeholder = st.empty()
+    deadline = time.time() + JOB_POLL_TIMEOUT
+    while time.time() < deadline:
+        job = api_request('GET', f'/jobs/{job_id}')
+        if not job:
+            return None
+        stage_lines = []
+        for stage, info in job.get('stages', {}).items():
+            mark = {"done": "✅", "running": "⏳", "failed": "❌"}.get(info.get('status'), "▫️")
+            stage_lines.append(f"{mark} {STAGE_LABELS.get(stage, stage)}")
+        stage_placeholder.markdown("  \n".join(stage_lines))
+        progress_bar.progress(job.get('progress', 0.0), text=f"任务状态: {job.get('status')}")
+
+        if job.get('status') == 'succeeded':
+            progress_bar.progress(1.0, text="审查完成")
+            return job.get('result')
+        if job.get('status') == 'failed':
+            st.error(f"审查失败: {job.get('error', '未知错误')}", icon="❌")
+            return None
+        time.sleep(JOB_POLL_INTERVAL)
+    st.error("等待审查结果超时，请稍后重试。", icon="⌛")
+    return None
+
+def iter_sse_events(endpoint, data=None, files=None):
+    """以流式方式请求 SSE 接口，逐个产出 (事件名, 数据)"""
+    url = f"{API_BASE_URL}{endpoint}"
+    try:
+        with requests.post(url, data=data, files=files, stream=True, timeout=(10, JOB_POLL_TIMEOUT)) as response:
+            if response.status_code != 200:
+                try:
+                    message = response.json().get('message', '未知错误')
+                except ValueError:
+                    message = response.text
+                st.error(f"服务器返回错误: {message}")
+                return
+            response.encoding = 'utf-8'
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:") and event:
+                    yield event, json.loads(line[len("data:"):].strip())
+                    event = None
+    except requests.exceptions.RequestException as e:
+        st.error(f"请求 API 失败: {e}")
+
+def stream_contract_review(data, files):
+    """流式审查合同：摘要、合同方和风险条款一旦就绪就立即显示，结束后返回完整结果"""
+    result = {}
+    live = st.empty()
+    with live.container():
+        status = st.status("正在进行深度合同审查...", expanded=True)
+        summary_box = st.container(border=True)
+        risk_box = st.container(border=True)
+        with risk_box:
+            st.markdown("#### 🚨 风险审查详情（实时）")
+    risk_slots = []  # 每个已显示的风险条款一个占位，风险等级上调时原位重绘
+    for event, payload in iter_sse_events('/review_contract/stream', data=data, files=files):
+        if event == "summary":
+            result['contract_summary'] = payload
+            status.write("✅ 合同摘要已生成")
+            with summary_box:
+                st.markdown("#### 📄 合同摘要")
+                st.markdown(payload)
+        elif event == "parties":
+            status.write(f"✅ 已识别合同方：甲方 {payload.get('party_a', '未知')}，乙方 {payload.get('party_b', '未知')}")
+        elif event == "risk_item":
+            with risk_box:
+                risk_slots.append(st.empty())
+            with risk_slots[-1].container():
+                render_risk_item(len(risk_slots) - 1, payload)
+        elif event == "risk_item_update":
+            index = payload["index"]
+            if index < len(risk_slots):
+                with risk_slots[index].container():
+                    render_risk_item(index, payload["risk_item"])
+        elif event == "done":
+            result.update(payload)
+            status.update(label="审查完成", state="complete", expanded=False)
+        elif event == "error":
+            status.update(label="审查失败", state="error")
+            st.error(payload.get('message', '未知错误'), icon="❌")
+            return None
+    if 'risk_review_report' not in result:
+        return None
+    # 完整结果将在下方的结果区统一展示，清除实时区域避免重复
+    live.empty()
+    return result
+
 # --- 状态管理函数 ---
 
 def refresh_kb_list():
@@ -112,6 +218,44 @@ def refresh_kb_list():
 
 # --- 界面渲染函数 ---
 
+def render_risk_item(i, risk):
+    """渲染单个风险条款卡片"""
+    risk_level = risk.get('risk_level', '未知')
+    if '高' in risk_level:
+        icon = "🔴"
+        delta_color = "inverse"
+    elif '中' in risk_level:
+        icon = "🟠"
+        delta_color = "normal"
+    else:
+        icon = "🟡"
+        delta_color = "off"
+    
+    with st.container(border=True):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown(f"**风险点 {i+1}:** {risk.get('clause_category', '未知类别')}")
+        with col2:
+            st.metric(label="风险等级", value=risk_level, delta=icon, delta_color=delta_color)
+
+        tab1, tab2, tab3 = st.tabs(["风险条款原文", "合规性与风险分析", "修改建议"])
+
+        with tab1:
+            st.code(risk.get('original_clause', 'N/A'), language=None)
+        with tab2:
+            st.markdown("**合规性分析 (基于知识库):**")
+            st.info(risk.get('compliance_analysis', 'N/A'), icon="⚖️")
+            st.markdown("**具体风险说明:**")
+            st.warning(risk.get('risk_reason', 'N/A'), icon="⚠️")
+            for article in risk.get('cited_articles', []):
+                with st.expander(f"📖 引用原文：{article['source']} 第{article['article_no']}条"):
+                    st.caption(article.get('chapter') or '')
+                    st.write(article['text'])
+        with tab3:
+            st.markdown("**修改建议:**")
+            st.success(risk.get('modification_suggestion', 'N/A'), icon="✍️")
+
+
 def page_kb_management():
     """渲染知识库管理页面"""
     st.header("📚 知识库管理中心")
@@ -144,6 +288,19 @@ def page_kb_management():
             type="pdf",
             key="kb_uploader"
         )
+        build_mode = st.radio(
+            "**构建方式**",
+            options=['rebuild', 'append'],
+            format_func=lambda m: "重建（覆盖同名知识库）" if m == 'rebuild' else "追加（仅存入新内容）",
+            horizontal=True
+        )
+        with st.expander("索引设置（可选）"):
+            index_type = st.selectbox(
+                "**索引类型**",
+                options=['AUTO', 'FLAT', 'HNSW', 'IVF_FLAT', 'IVF_SQ8', 'IVF_PQ'],
+                help="AUTO 会根据文本块数量自动选择；追加时仅在显式指定后才会重建索引。"
+            )
+            metric_type = st.selectbox("**距离度量**", options=['L2', 'IP', 'COSINE'])
         if st.button("🚀 开始构建", type="primary"):
             if not kb_name:
                 st.warning("请输入知识库名称。", icon="⚠️")
@@ -152,7 +309,11 @@ def page_kb_management():
             else:
                 with st.spinner(f"正在构建知识库 '{kb_name}'..."):
                     files = {'file': (uploaded_kb_file.name, uploaded_kb_file.getvalue(), 'application/pdf')}
-                    data = {'collection_name': kb_name}
+                    data = {'collection_name': kb_name, 'mode': build_mode}
+                    if index_type != 'AUTO':
+                        data['index_type'] = index_type
+                    if metric_type != 'L2':
+                        data['metric_type'] = metric_type
                     response = api_request('POST', '/build_kb', data=data, files=files)
                 if response:
                     if response.get('status') == 'success':
@@ -162,6 +323,25 @@ def page_kb_management():
                     else:
                         st.error(f"构建失败: {response.get('message')}", icon="❌")
     
+    # 移除来源文档
+    with st.container(border=True):
+        st.subheader("✂️ 移除来源文档")
+        if st.session_state.kb_list:
+            kb_for_source = st.selectbox(
+                "**选择知识库**",
+                options=st.session_state.kb_list,
+                index=None,
+                placeholder="请选择...",
+                key="source_kb_select"
+            )
+            source_name = st.text_input("**来源文档名**", placeholder="例如: judicial_interpretation_2023.pdf")
+            if st.button("移除该文档的全部条目", disabled=(not kb_for_source or not source_name)):
+                response = api_request('POST', '/remove_source', data={'collection_name': kb_for_source, 'source': source_name})
+                if response and response.get('status') == 'success':
+                    st.success(response.get('message'), icon="✅")
+        else:
+            st.info("没有可操作的知识库。", icon="ℹ️")
+
     # 删除知识库
     with st.container(border=True):
         st.subheader("🗑️ 删除知识库")
@@ -222,14 +402,13 @@ def page_contract_review():
             if not selected_kb or not perspective or not uploaded_contract_file:
                 st.warning("请确保已选择知识库、立场并上传了合同文件。", icon="⚠️")
             else:
-                with st.spinner("正在进行深度合同审查，请稍候..."):
-                    files = {'contract_file': (uploaded_contract_file.name, uploaded_contract_file.getvalue(), 'application/pdf')}
-                    data = {
-                        'collection_name': selected_kb,
-                        'perspective': perspective
-                    }
-                    # 将响应存储在 session_state 中，避免 rerun 后丢失
-                    st.session_state.review_response = api_request('POST', '/review_contract', data=data, files=files)
+                files = {'contract_file': (uploaded_contract_file.name, uploaded_contract_file.getvalue(), 'application/pdf')}
+                data = {
+                    'collection_name': selected_kb,
+                    'perspective': perspective
+                }
+                # 流式接收审查结果并实时展示，将最终结果存储在 session_state 中，避免 rerun 后丢失
+                st.session_state.review_response = stream_contract_review(data, files)
     
     # 显示结果
     if 'review_response' in st.session_state and st.session_state.review_response:
@@ -249,36 +428,7 @@ def page_contract_review():
             else:
                 st.info(f"共发现 {len(risk_report)} 个潜在风险点：", icon="💡")
                 for i, risk in enumerate(risk_report):
-                    risk_level = risk.get('risk_level', '未知')
-                    if '高' in risk_level:
-                        icon = "🔴"
-                        delta_color = "inverse"
-                    elif '中' in risk_level:
-                        icon = "🟠"
-                        delta_color = "normal"
-                    else:
-                        icon = "🟡"
-                        delta_color = "off"
-                    
-                    with st.container(border=True):
-                        col1, col2 = st.columns([3, 1])
-                        with col1:
-                            st.markdown(f"**风险点 {i+1}:** {risk.get('clause_category', '未知类别')}")
-                        with col2:
-                            st.metric(label="风险等级", value=risk_level, delta=icon, delta_color=delta_color)
-
-                        tab1, tab2, tab3 = st.tabs(["风险条款原文", "合规性与风险分析", "修改建议"])
-
-                        with tab1:
-                            st.code(risk.get('original_clause', 'N/A'), language=None)
-                        with tab2:
-                            st.markdown("**合规性分析 (基于知识库):**")
-                            st.info(risk.get('compliance_analysis', 'N/A'), icon="⚖️")
-                            st.markdown("**具体风险说明:**")
-                            st.warning(risk.get('risk_reason', 'N/A'), icon="⚠️")
-                        with tab3:
-                            st.markdown("**修改建议:**")
-                            st.success(risk.get('modification_suggestion', 'N/A'), icon="✍️")
+                    render_risk_item(i, risk)
 
 
 def page_party_review():
@@ -309,13 +459,13 @@ def page_party_review():
             if not party_profile or not uploaded_contract_file_party:
                 st.warning("请确保已粘贴对方简介并上传了合同文件。", icon="⚠️")
             else:
-                with st.spinner("正在分析交易对手，请稍候..."):
-                    files = {'contract_file': (uploaded_contract_file_party.name, uploaded_contract_file_party.getvalue(), 'application/pdf')}
-                    data = {
-                        'perspective': perspective,
-                        'party_profile': party_profile
-                    }
-                    st.session_state.party_response = api_request('POST', '/review_party', data=data, files=files)
+                files = {'contract_file': (uploaded_contract_file_party.name, uploaded_contract_file_party.getvalue(), 'application/pdf')}
+                data = {
+                    'perspective': perspective,
+                    'party_profile': party_profile
+                }
+                submit_response = api_request('POST', '/jobs/review_party', data=data, files=files)
+                st.session_state.party_response = wait_for_job(submit_response)
             
     # 显示结果
     if 'party_response' in st.session_state and st.session_state.party_response:
@@ -0,0 +1,10 @@
+# 文件名: wsgi.py
+"""
+生产部署入口，供 gunicorn 加载:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+核心组件不在导入时创建，由 gunicorn.conf.py 在每个工作进程启动后于后台预热。
+"""
+from app import create_app
+
+app = create_app()